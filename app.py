@@ -2,7 +2,10 @@ import logging
 import _config as conf
 import pyldapi
 from flask import Flask
-from controller import pages, classes, oai
+from controller import pages, classes, oai, search, tiles, assets
+from model.compression import compress_response
+from model.static_assets import static_url
+from model.suggest import suggest_index
 
 
 app = Flask(__name__, template_folder=conf.TEMPLATES_DIR, static_folder=conf.STATIC_DIR)
@@ -10,6 +13,18 @@ app = Flask(__name__, template_folder=conf.TEMPLATES_DIR, static_folder=conf.STA
 app.register_blueprint(pages.pages)
 app.register_blueprint(classes.classes)
 app.register_blueprint(oai.oai_)
+app.register_blueprint(search.search)
+app.register_blueprint(tiles.tiles)
+app.register_blueprint(assets.assets)
+
+# fingerprinted asset URLs for templates, in place of url_for('static', ...)
+app.add_template_global(static_url)
+
+# gzip or Brotli, as each request accepts
+app.after_request(compress_response)
+
+# built in the background from the start, so suggestions are ready as soon as they can be
+suggest_index.ensure_built(wait=False)
 
 
 # run the Flask app
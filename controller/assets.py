@@ -0,0 +1,49 @@
+"""
+This file contains the HTTP route for fingerprinted static assets, built by model/static_assets.py. Run it to build
+them:
+
+    python -m controller.assets
+"""
+import logging
+import mimetypes
+from flask import Blueprint, request, send_from_directory, abort
+from model import compression
+from model.static_assets import STATIC_BUILD_DIR, MANIFEST, ASSET_MAX_AGE, build, encoded_file, precompressed
+
+
+assets = Blueprint('assets', __name__)
+
+
+@assets.route('/assets/<path:filename>')
+def asset(filename):
+    """
+    A fingerprinted static asset, precompressed if the request accepts an encoding it's been compressed with. Its
+    name changes with its content so it's cached for a year without being revalidated.
+
+    :return: HTTP Response
+    """
+    if filename == MANIFEST:
+        abort(404)
+
+    encoding = compression.negotiate(request)
+    encoded = encoded_file(filename, encoding)
+    if encoded is not None:
+        response = send_from_directory(
+            STATIC_BUILD_DIR,
+            encoded,
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(STATIC_BUILD_DIR, filename)
+
+    if precompressed(filename):
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(ASSET_MAX_AGE)
+    return response
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    built = build()
+    logging.info('Built {} static assets in {}'.format(len(built), STATIC_BUILD_DIR))
@@ -1,55 +1,282 @@
 """
 This file contains all the HTTP routes for classes from the IGSN model, such as Samples and the Sample Register
 """
-from flask import Blueprint, request, Response
+import logging
+from flask import Blueprint, request, Response, jsonify, make_response
 import _config as config
 import pyldapi
 import requests
-from io import BytesIO
 from lxml import etree
 from model.sample import SampleRenderer
 from model.site import SiteRenderer
 from model.survey import SurveyRenderer
+from model.counts import get_count
+from model.page_cache import PageCache
+from model.cursor_register import CursorRegisterRenderer, encode_cursor, decode_cursor, PAGE_SIZE_MAX
+from model import store, conditional
+from model.filtered_register import FilteredRegisterRenderer
+from model.spatial import spatial_index, sample_index, parse_bbox
+from model.export import EXPORT_MIMETYPES, stream_ndjson, stream_csv
 
 
 classes = Blueprint('classes', __name__)
 
 
+REGISTER_ITEM_URLS = {
+    'IGSN': config.XML_API_URL_SAMPLESET,
+    'ENO': config.XML_API_URL_SITESET,
+    'SURVEYID': config.XML_API_URL_SURVEY_REGISTER
+}
+
+REGISTER_ITEM_LABELS = {
+    'IGSN': 'Sample ',
+    'ENO': 'Site ',
+    'SURVEYID': 'Survey '
+}
+
+
 def _get_items(page, per_page, elem_tag):
+    """
+    Reads a page of a register from the Oracle XML API
+
+    :param page: the page number
+    :param per_page: the number of items per page
+    :param elem_tag: the register's item element tag, e.g. IGSN
+    :return: list of (identifier, label) tuples, or None if the page isn't valid XML, e.g. past the last page
+    """
+    if elem_tag not in REGISTER_ITEM_URLS:
+        raise ValueError('Invalid register item tag: {}'.format(elem_tag))
+
     items = []
+    label = REGISTER_ITEM_LABELS[elem_tag]
 
-    r = None
-    if elem_tag == 'IGSN':
-        r = requests.get(config.XML_API_URL_SAMPLESET.format(page, per_page), timeout=3)
-    elif elem_tag == 'ENO':
-        r = requests.get(config.XML_API_URL_SITESET.format(page, per_page), timeout=3)
-    elif elem_tag == 'SURVEYID':
-        r = requests.get(config.XML_API_URL_SURVEY_REGISTER.format(page, per_page), timeout=3)
-    else:
-        print('Invalid tag')
+    r = requests.get(REGISTER_ITEM_URLS[elem_tag].format(page, per_page), timeout=3, stream=True)
+    r.raw.decode_content = True
+
+    # a single streaming pass that only stops at the wanted elements; malformed XML raises as it's met so it's
+    # validated as it's read
+    try:
+        for event, elem in etree.iterparse(r.raw, tag=elem_tag):
+            # a row with an empty identifier can't be linked to, so is skipped, as the sync does
+            if elem.text is not None:
+                items.append((elem.text, label + elem.text))
+            elem.clear()
+            # drop the ROWs already read so memory use doesn't grow with per_page
+            row = elem.getparent()
+            while row is not None and row.getprevious() is not None:
+                del row.getparent()[0]
+
+        return items
+    except etree.XMLSyntaxError as e:
+        # the API returns a plain "No data" message, not XML, past the last page
+        logging.info('Page {} of the {} register is not valid XML: {}'.format(page, elem_tag, e))
         return None
+    finally:
+        r.close()
+
 
-    xml = r.content
+register_pages = PageCache(_get_items)
 
-    parser = etree.XMLParser(dtd_validation=False)
+NEAR_K_MAX = 1000
 
+
+def _page_args():
+    """
+    :return: (page, per_page) from the request, by default 1 & 20
+    :raises ValueError: if either isn't a positive integer
+    """
     try:
-        etree.fromstring(xml, parser)
-        xml = BytesIO(xml)
+        page = int(request.values.get('page', 1))
+        per_page = int(request.values.get('per_page', 20))
+    except ValueError:
+        page = per_page = 0
+    if page < 1 or per_page < 1:
+        raise ValueError('page and per_page must be positive integers')
+    return page, per_page
+
+
+def _render_register(r, *data):
+    """
+    Renders a register page, unless the client's copy is current by the page's ETag, a hash of what the page shows
+
+    :param r: the page's pyldapi RegisterRenderer
+    :param data: the page's items, the register's count etc.
+    :return: HTTP Response
+    """
+    etag = conditional.make_etag(
+        request.host_url, request.path, r.view, r.format, sorted(request.args.items(multi=True)), data
+    )
+    response = conditional.not_modified(request, etag)
+    if response is not None:
+        return response
+
+    response = make_response(r.render())
+    if response.status_code == 200:
+        conditional.set_validators(response, etag)
+    return response
+
 
-        labels = {
-            'IGSN': 'Sample ',
-            'ENO': 'Site ',
-            'SURVEYID': 'Survey '
+def _render_register_by_cursor(register, elem_tag, label, comment, contained_item_class):
+    """
+    Renders a page of a register after the cursor given in the request, reading the page from the local store with a
+    keyset query rather than from the Oracle XML API, which can only page by offset
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param elem_tag: the register's item element tag, e.g. IGSN
+    :return: HTTP Response
+    """
+    cursor = request.values.get('cursor')
+    try:
+        after = decode_cursor(cursor)
+    except ValueError as e:
+        return Response(str(e), mimetype='text/plain', status=400)
+
+    try:
+        no_of_items = get_count(register)
+
+        per_page = min(_page_args()[1], PAGE_SIZE_MAX)
+        if register == 'site' and after is not None:
+            after = int(after)
+        ids = store.get_items_after(register, after, per_page)
+    except ValueError as e:
+        return Response(str(e), mimetype='text/plain', status=400)
+    except Exception as e:
+        print(e)
+        return Response('The {} is offline'.format(label), mimetype='text/plain', status=500)
+
+    r = CursorRegisterRenderer(
+        request,
+        request.base_url,
+        label,
+        comment,
+        [(i, REGISTER_ITEM_LABELS[elem_tag] + i) for i in ids],
+        [contained_item_class],
+        no_of_items,
+        cursor,
+        encode_cursor(ids[-1]) if len(ids) == per_page else None
+    )
+
+    return _render_register(r, ids, no_of_items)
+
+
+def _render_register_by_bbox(register, elem_tag, label, comment, contained_item_class):
+    """
+    Renders a page of the items of a register that intersect the bbox given in the request, found with the spatial
+    index of the local store
+
+    :param register: 'site' or 'survey'
+    :param elem_tag: the register's item element tag, e.g. ENO
+    :return: HTTP Response
+    """
+    try:
+        bbox = parse_bbox(request.values.get('bbox'))
+        page, per_page = _page_args()
+    except ValueError as e:
+        return Response(str(e), mimetype='text/plain', status=400)
+
+    try:
+        ids = spatial_index.intersecting(register, bbox)
+    except Exception as e:
+        print(e)
+        return Response('The {} is offline'.format(label), mimetype='text/plain', status=500)
+
+    page_ids = ids[(page - 1) * per_page:page * per_page]
+    r = FilteredRegisterRenderer(
+        request,
+        request.base_url,
+        label,
+        comment,
+        [(i, REGISTER_ITEM_LABELS[elem_tag] + i) for i in page_ids],
+        [contained_item_class],
+        len(ids),
+        {'bbox': request.values.get('bbox')}
+    )
+
+    return _render_register(r, page_ids, len(ids))
+
+
+def _render_export(register):
+    """
+    Streams a whole register, from the local store, as NDJSON or CSV. The format is chosen by the _format query string
+    argument or the Accept header and the export starts after the identifier in the after argument, if given.
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: HTTP Response
+    """
+    mimetype = request.values.get('_format') or \
+        request.accept_mimetypes.best_match(list(EXPORT_MIMETYPES), default='application/x-ndjson')
+    if mimetype not in EXPORT_MIMETYPES:
+        return Response(
+            'The export format must be one of {}'.format(', '.join(EXPORT_MIMETYPES)),
+            mimetype='text/plain',
+            status=400
+        )
+
+    after = request.values.get('after')
+    if after is not None and register == 'site':
+        try:
+            after = int(after)
+        except ValueError:
+            return Response('after must be a Site ENO', mimetype='text/plain', status=400)
+
+    stream = stream_csv if EXPORT_MIMETYPES[mimetype] == 'csv' else stream_ndjson
+    return Response(
+        stream(register, after),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': 'inline; filename="{}s.{}"'.format(register, EXPORT_MIMETYPES[mimetype])
         }
-        for event, elem in etree.iterparse(xml):
-            if elem.tag == elem_tag:
-                items.append((elem.text, labels[elem.tag] + elem.text))
+    )
 
-        return items
-    except Exception:
-        print('not valid xml')
-        return None
+
+@classes.route('/sample/export')
+def samples_export():
+    """
+    Every Sample, streamed
+
+    :return: HTTP Response
+    """
+    return _render_export('sample')
+
+
+@classes.route('/sample/near')
+def samples_near():
+    """
+    The Samples nearest a point, within a radius, with their distances from it
+
+    :return: HTTP Response
+    """
+    try:
+        lat = float(request.values.get('lat'))
+        lon = float(request.values.get('lon'))
+        radius = float(request.values.get('radius')) if request.values.get('radius') is not None else 10.0
+        k = int(request.values.get('k')) if request.values.get('k') is not None else 10
+    except (TypeError, ValueError):
+        return Response('lat & lon are required and must be numbers, as must radius (km) & k', mimetype='text/plain',
+                        status=400)
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180 or radius <= 0 or not 1 <= k <= NEAR_K_MAX:
+        return Response('lat, lon, radius (km) or k (at most {}) is out of range'.format(NEAR_K_MAX),
+                        mimetype='text/plain', status=400)
+
+    try:
+        nearest = sample_index.nearest(lon, lat, radius, k)
+    except Exception as e:
+        print(e)
+        return Response('The Samples Register is offline', mimetype='text/plain', status=500)
+
+    return jsonify({
+        'lat': lat,
+        'lon': lon,
+        'radius': radius,
+        'samples': [
+            {
+                'igsn': igsn,
+                'uri': config.URI_SAMPLE_INSTANCE_BASE + igsn,
+                'distance': round(distance, 3)
+            }
+            for distance, igsn in nearest
+        ]
+    })
 
 
 @classes.route('/sample/<string:igsn>')
@@ -95,15 +322,18 @@ def samples():
 
     :return: HTTP Response
     """
+    if request.values.get('cursor') is not None:
+        return _render_register_by_cursor('sample', 'IGSN', 'Sample Register', 'A register of Samples', config.URI_SAMPLE_CLASS)
 
-    # get the total register count from the XML API
     try:
-        r = requests.get(config.XML_API_URL_TOTAL_COUNT)
-        no_of_items = int(r.content.decode('utf-8').split('<RECORD_COUNT>')[1].split('</RECORD_COUNT>')[0])
+        page, per_page = _page_args()
+    except ValueError as e:
+        return Response(str(e), mimetype='text/plain', status=400)
 
-        page = request.values.get('page') if request.values.get('page') is not None else 1
-        per_page = request.values.get('per_page') if request.values.get('per_page') is not None else 20
-        items = _get_items(page, per_page, "IGSN")
+    # get the total register count from the XML API
+    try:
+        no_of_items = get_count('sample')
+        items = register_pages.get("IGSN", page, per_page)
     except Exception as e:
         print(e)
         return Response('The Samples Register is offline', mimetype='text/plain', status=500)
@@ -118,7 +348,12 @@ def samples():
         no_of_items
     )
 
-    return r.render()
+    return _render_register(r, items, no_of_items)
+
+
+@classes.route('/site/ga/export')
+def sites_export():
+    return _render_export('site')
 
 
 @classes.route('/site/ga/<string:site_no>')
@@ -129,15 +364,20 @@ def site(site_no):
 
 @classes.route('/site/ga/')
 def sites():
-    # get the total register count for site
+    if request.values.get('bbox') is not None:
+        return _render_register_by_bbox('site', 'ENO', 'Site Register', 'A register of Sites', config.URI_SITE_CLASS)
+    if request.values.get('cursor') is not None:
+        return _render_register_by_cursor('site', 'ENO', 'Site Register', 'A register of Sites', config.URI_SITE_CLASS)
+
     try:
-        r = requests.get(config.XML_API_URL_SITES_TOTAL_COUNT)
-        no_of_items = int(r.content.decode('utf-8').split('<RECORDS>')[1].split('</RECORDS>')[0])
-        # no_of_items =
+        page, per_page = _page_args()
+    except ValueError as e:
+        return Response(str(e), mimetype='text/plain', status=400)
 
-        page = request.values.get('page') if request.values.get('page') is not None else 1
-        per_page = request.values.get('per_page') if request.values.get('per_page') is not None else 20
-        items = _get_items(page, per_page, "ENO")
+    # get the total register count for site
+    try:
+        no_of_items = get_count('site')
+        items = register_pages.get("ENO", page, per_page)
     except Exception as e:
         print(e)
         return Response('The Site Register is offline', mimetype='text/plain', status=500)
@@ -152,17 +392,25 @@ def sites():
         no_of_items
     )
 
-    return r.render()
+    return _render_register(r, items, no_of_items)
 
 
 @classes.route('/survey/ga/')
 def surveys():
+    if request.values.get('bbox') is not None:
+        return _render_register_by_bbox('survey', 'SURVEYID', 'Survey Register', 'A register of Surveys', config.URI_SURVEY_CLASS)
+    if request.values.get('cursor') is not None:
+        return _render_register_by_cursor('survey', 'SURVEYID', 'Survey Register', 'A register of Surveys', config.URI_SURVEY_CLASS)
+
+    try:
+        page, per_page = _page_args()
+    except ValueError as e:
+        return Response(str(e), mimetype='text/plain', status=400)
+
     # get the total register count for survey
     try:
-        no_of_items = 9200 #TODO: implement a survey count in Oracle XML API
-        page = request.values.get('page') if request.values.get('page') is not None else 1
-        per_page = request.values.get('per_page') if request.values.get('per_page') is not None else 20
-        items = _get_items(page, per_page, "SURVEYID")
+        no_of_items = get_count('survey')
+        items = register_pages.get("SURVEYID", page, per_page)
     except Exception as e:
         print(e)
         return Response('The Survey Register is offline', mimetype='text/plain', status=500)
@@ -176,7 +424,12 @@ def surveys():
         [config.URI_SURVEY_CLASS],
         no_of_items
     )
-    return r.render()
+    return _render_register(r, items, no_of_items)
+
+
+@classes.route('/survey/ga/export')
+def surveys_export():
+    return _render_export('survey')
 
 
 @classes.route('/survey/ga/<string:survey_no>')
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, Response
 from controller.oai_functions import *
 from controller.oai_errors import *
+from model import store
 import _config as conf
 
 oai_ = Blueprint('oai', __name__)
@@ -46,6 +47,21 @@ def oai():
             s = SampleRenderer(request)
 
             if s.not_found:
+                deleted = store.get_tombstone(request.values.get('identifier'))
+                if deleted is not None:
+                    return Response(
+                        render_template(
+                            'oai_get_record.xml',
+                            response_date=response_date,
+                            request_uri=request.base_url,
+                            metadataPrefix=request.values.get('metadataPrefix'),
+                            identifier=request.values.get('identifier'),
+                            date_modified=deleted,
+                            deleted=True
+                        ),
+                        mimetype='text/xml'
+                    )
+
                 return Response(
                     render_template(
                         'oai_error.xml',
@@ -110,12 +126,23 @@ def oai():
     elif request.values.get('verb') == 'ListIdentifiers':
         # render_template
         try:
-            samples, resumption_token = list_records(
-                request.values.get('metadataPrefix'),
+            deleted_records = list_deleted_records(
                 request.values.get('resumptionToken'),
                 request.values.get('from'),
                 request.values.get('until')
             )
+            try:
+                samples, resumption_token = list_records(
+                    request.values.get('metadataPrefix'),
+                    request.values.get('resumptionToken'),
+                    request.values.get('from'),
+                    request.values.get('until')
+                )
+            except NoRecordsMatchError:
+                # a window may contain only deletions
+                if len(deleted_records) == 0:
+                    raise
+                samples, resumption_token = [], None
 
             return Response(
                 render_template(
@@ -124,6 +151,7 @@ def oai():
                     request_uri=request.base_url,
                     metadataPrefix=request.values.get('metadataPrefix'),
                     samples=samples,
+                    deleted_records=deleted_records,
                     resumptiontoken=resumption_token
                 ),
                 mimetype='text/xml'
@@ -132,6 +160,8 @@ def oai():
             oai_code = 'idDoesNotExist'
             message = 'No matching identifier in GA Samples Database'
             return render_error(response_date, request.base_url, oai_code, message)
+        except OaiError as e:
+            return render_error(response_date, request.base_url, e.oainame(), e)
 
     elif request.values.get('verb') == 'ListMetadataFormats':
         return Response(
@@ -146,12 +176,23 @@ def oai():
 
     elif request.values.get('verb') == 'ListRecords':
         try:
-            samples, token = list_records_xml(
-                request.values.get('metadataPrefix'),
+            deleted_records = list_deleted_records(
                 request.values.get('resumptionToken'),
                 request.values.get('from'),
                 request.values.get('until')
             )
+            try:
+                samples, token = list_records_xml(
+                    request.values.get('metadataPrefix'),
+                    request.values.get('resumptionToken'),
+                    request.values.get('from'),
+                    request.values.get('until')
+                )
+            except NoRecordsMatchError:
+                # a window may contain only deletions
+                if len(deleted_records) == 0:
+                    raise
+                samples, token = [], None
 
             return Response(
                 render_template(
@@ -160,6 +201,7 @@ def oai():
                     request_uri=request.base_url,
                     metadataPrefix=request.values.get('metadataPrefix'),
                     samples=samples,
+                    deleted_records=deleted_records,
                     resumptiontoken=token
                 ),
                 mimetype='text/xml'
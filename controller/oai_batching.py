@@ -0,0 +1,60 @@
+"""
+Chooses the number of records in each OAI-PMH ListRecords/ListIdentifiers page from how long recent pages took to
+fetch from GA's Oracle XML API and render, aiming for pages that take about OAI_BATCH_TARGET_SECONDS.
+
+A harvest keeps the batch size chosen for its first page, recorded in its resumption token, since the Oracle XML API
+pages by page number and changing the page size part way through would skip or repeat records.
+"""
+import threading
+from collections import deque
+import _config as conf
+
+
+OAI_BATCH_SIZE_MIN = getattr(conf, 'OAI_BATCH_SIZE_MIN', 10)
+OAI_BATCH_SIZE_MAX = getattr(conf, 'OAI_BATCH_SIZE_MAX', 1000)
+OAI_BATCH_TARGET_SECONDS = getattr(conf, 'OAI_BATCH_TARGET_SECONDS', 2.0)
+OAI_BATCH_TIMINGS_KEPT = 20
+
+_timings = {}
+_lock = threading.Lock()
+
+
+def _clamp(batch_size):
+    return max(OAI_BATCH_SIZE_MIN, min(OAI_BATCH_SIZE_MAX, int(batch_size)))
+
+
+def record_timing(verb, metadataPrefix, batch_size, seconds):
+    """
+    Records how long a page took to fetch and render
+
+    :param verb: ListRecords or ListIdentifiers
+    :param metadataPrefix:
+    :param batch_size: the number of records in the page
+    :param seconds: the time taken
+    :return: None
+    """
+    if batch_size < 1:
+        return
+    with _lock:
+        _timings.setdefault((verb, metadataPrefix), deque(maxlen=OAI_BATCH_TIMINGS_KEPT)).append((batch_size, seconds))
+
+
+def choose_batch_size(verb, metadataPrefix):
+    """
+    Chooses the batch size for a new harvest. The time per record of recent pages includes the fixed cost of each
+    upstream call so the estimate is high for small pages, however repeatedly sizing pages from it converges on the
+    size that meets the target.
+
+    :param verb: ListRecords or ListIdentifiers
+    :param metadataPrefix:
+    :return: a batch size within OAI_BATCH_SIZE_MIN and OAI_BATCH_SIZE_MAX
+    """
+    with _lock:
+        timings = list(_timings.get((verb, metadataPrefix), ()))
+
+    records = sum(batch_size for batch_size, seconds in timings)
+    seconds = sum(seconds for batch_size, seconds in timings)
+    if records == 0 or seconds <= 0:
+        return _clamp(conf.OAI_BATCH_SIZE)
+
+    return _clamp(OAI_BATCH_TARGET_SECONDS * records / seconds)
@@ -1,12 +1,15 @@
 from datetime import datetime, timedelta
 from io import BytesIO
+import time
 import requests
+from flask import request
 from lxml import etree
 import _config as conf
-from model import sample
+from model import sample, store
 from controller.oai_datestamp import *
 from controller.oai_errors import *
-import math
+from controller.oai_token import encode_token, decode_token, OAI_TOKEN_LIFETIME
+from controller.oai_batching import choose_batch_size, record_timing
 
 
 # https://www.openarchives.org/OAI/openarchivesprotocol.html, 3.6 Error and Exception Conditions
@@ -89,74 +92,118 @@ def validate_oai_parameters(qsa_args):
     return True
 
 
-def list_records(metadataPrefix, resumptionToken=None, from_=None, until=None):
-    # if we don't have a resumption token, start at the beginning
-    if resumptionToken is None:
-        oracle_api_samples_url = conf.XML_API_URL_SAMPLESET.format(1, conf.OAI_BATCH_SIZE)
-    else:
-        oracle_api_samples_url = create_url_query_token(resumptionToken)
-        [from_, until, batch_num, metadataPrefix] = resumptionToken.split(',')
+def get_harvest_state(verb, metadataPrefix, resumptionToken=None, from_=None, until=None):
+    """
+    Returns the state of a harvest, either from its resumption token or, for the first page, from the request
+    arguments. Only the first page of a harvest queries GA's Oracle DB for the complete list size and chooses the
+    batch size, later pages read them from the token.
 
-    r = requests.get(oracle_api_samples_url)
+    :param verb: ListRecords or ListIdentifiers
+    :param metadataPrefix:
+    :param resumptionToken:
+    :param from_:
+    :param until:
+    :return: dict of harvest state, as per controller.oai_token.KEYS
+    """
+    if resumptionToken is not None:
+        state = decode_token(resumptionToken)
+        if state['batch_size'] is None:
+            state['batch_size'] = conf.OAI_BATCH_SIZE
+        return state
+
+    return {
+        'from_': from_,
+        'until': until,
+        'cursor': 0,
+        'metadataPrefix': metadataPrefix,
+        'complete_list_size': get_complete_list_size(from_, until),
+        'batch_size': choose_batch_size(verb, metadataPrefix),
+        'last_identifier': None
+    }
+
+
+def get_harvest_rows(state):
+    """
+    Gets the Oracle DB's XML ROWs for the page of a harvest at the state's cursor
 
-    if "No data" in r.content.decode('utf-8'):
-        raise NoRecordsMatchError('No Data')
+    :param state: harvest state from get_harvest_state()
+    :return: a list of ROW elements
+    """
+    no_per_page = state['batch_size']
+    page_no = state['cursor'] // no_per_page + 1
 
-    samples = []
+    r = requests.get(create_url_query(page_no, no_per_page, state['from_'], state['until']))
 
-    for event, elem in etree.iterparse(BytesIO(r.content), tag='ROW'):
-        samples.append(get_obj_vars_as_dict(
-            sample.SampleRenderer(None, xml='<root>{}</root>'.format(etree.tostring(elem)))))
+    if "No data" in r.content.decode('utf-8'):
+        raise NoRecordsMatchError(
+            'The combination of the values of the from, until, '
+            'set and metadataPrefix arguments results in an empty list.')
 
-    resumption_token = get_resumption_token(metadataPrefix, resumptionToken, from_, until)
+    rows = [elem for event, elem in etree.iterparse(BytesIO(r.content), tag='ROW')]
 
-    return samples, resumption_token
+    # if Samples have been added since the last page, this page will start with some already given so skip them
+    if state['last_identifier'] is not None:
+        igsns = [row.findtext('IGSN') for row in rows]
+        if state['last_identifier'] in igsns:
+            rows = rows[igsns.index(state['last_identifier']) + 1:]
 
+    return rows
 
-def list_records_xml(metadataPrefix, resumptionToken=None, from_=None, until=None):
-    no_per_page = conf.OAI_BATCH_SIZE
-    page_no = 1
 
-    if resumptionToken is None:
-        oracle_api_samples_url = conf.XML_API_URL_SAMPLESET.format(page_no, no_per_page)
+def get_row_datestamp(row):
+    date_modified = str2datetime(row.findtext('MODIFIED_DATE'))
+    if date_modified is not None:
+        return datetime_to_datestamp(date_modified)
     else:
-        oracle_api_samples_url = create_url_query_token(resumptionToken)
-        [from_, until, batch_num, metadataPrefix] = resumptionToken.split(',')
+        return '1900-01-01T00:00:00Z'
 
-    print(oracle_api_samples_url)
-    r = requests.get(oracle_api_samples_url)
 
-    if "No data" in r.content.decode('utf-8'):
-        raise NoRecordsMatchError(
-            'The combination of the values of the from, until, '
-            'set and metadataPrefix arguments results in an empty list.')
+def list_records(metadataPrefix, resumptionToken=None, from_=None, until=None):
+    state = get_harvest_state('ListIdentifiers', metadataPrefix, resumptionToken, from_, until)
+    started = time.perf_counter()
+
+    # only headers are needed so there's no need to make a Sample for each ROW
+    samples = []
+    for row in get_harvest_rows(state):
+        samples.append({
+            'igsn': row.findtext('IGSN'),
+            'datestamp': get_row_datestamp(row)
+        })
+
+    record_timing('ListIdentifiers', state['metadataPrefix'], len(samples), time.perf_counter() - started)
+    resumption_token = get_resumption_token(state, samples[-1]['igsn'] if len(samples) > 0 else None)
+
+    return samples, resumption_token
+
+
+def list_records_xml(metadataPrefix, resumptionToken=None, from_=None, until=None):
+    state = get_harvest_state('ListRecords', metadataPrefix, resumptionToken, from_, until)
+    started = time.perf_counter()
+    # for some reason, there's this odd whitespace character in the metadataPrefix
+    metadataPrefix = state['metadataPrefix'].replace(u'\u200b', '')
 
     samples = []
+    igsn = None
 
-    for event, elem in etree.iterparse(BytesIO(r.content), tag='ROW'):
+    for row in get_harvest_rows(state):
         # create a Sample for each XML ROW
-        sample = sample.SampleRenderer(None, '<root>{}</root>'.format(etree.tostring(elem)))
-        if sample.date_modified is not None:
-            datestamp = datetime_to_datestamp(sample.date_modified)
-        else:
-            datestamp = '1900-01-01T00:00:00Z'
+        s = sample.SampleRenderer(request, '<root>{}</root>'.format(etree.tostring(row).decode('utf-8')))
+        igsn = s.igsn
 
         # make the record XML using the Sample export
-        # for some reason, there's this odd whitespace character in the metadataPrefix
-        metadataPrefix = metadataPrefix.replace(u'\u200b', '')
         if metadataPrefix == 'igsn':
-            record_xml = sample.export_igsn_xml()
+            record_xml = s.export_igsn_xml()
         elif metadataPrefix == 'igsn-r1':
-            record_xml = sample.export_igsn_r1_xml()
+            record_xml = s.export_igsn_r1_xml()
         elif metadataPrefix == 'csirov3':
-            record_xml = sample.export_csirov3_xml()
+            record_xml = s.export_csirov3_xml()
         else:  # oai_dc
-            record_xml = sample.export_dct_xml()
+            record_xml = s.export_dct_xml()
 
         # make the full OAI record
         oai_record_vars = {
-            'identifier': sample.igsn,
-            'datestamp': datestamp,
+            'identifier': s.igsn,
+            'datestamp': get_row_datestamp(row),
             'record_xml': record_xml
         }
         if metadataPrefix == 'oai_dc':
@@ -184,53 +231,63 @@ def list_records_xml(metadataPrefix, resumptionToken=None, from_=None, until=Non
 
         # add the OAI record to the list of samples
         samples.append(oai_record)
-    resumption_token = get_resumption_token(metadataPrefix, resumptionToken, from_, until)
+    record_timing('ListRecords', state['metadataPrefix'], len(samples), time.perf_counter() - started)
+    resumption_token = get_resumption_token(state, igsn)
 
     return samples, resumption_token
 
 
-def get_resumption_token(metadataPrefix, resumptionToken=None, from_=None, until=None):
+def list_deleted_records(resumptionToken=None, from_=None, until=None):
     """
-    <resumptionToken expirationDate="2017-03-24T05:02:52Z"
-    completeListSize="6267770" cursor="100">
-    1490328172912,2011-06-01T00:00:00Z,9999-12-31T23:59:59Z,150,null,oai_dc
-    </resumptionToken>
+    Lists the Samples deleted, according to the local store's tombstones, within a harvest's from/until window. They are
+    all given on the first page of a harvest, i.e. when there is no resumption token, as there are few of them compared
+    with live Samples.
+
     :param resumptionToken:
-    :param metadataPrefix:
     :param from_:
     :param until:
-    :return:
+    :return: a list of dicts with 'identifier' and 'datestamp' keys
     """
+    if resumptionToken is not None:
+        return []
 
-    expiration_date = calc_expiration_datestamp()
+    try:
+        if from_ is not None:
+            from_ = datetime_to_datestamp(datestamp_to_datetime(from_))
+        if until is not None:
+            until = datetime_to_datestamp(datestamp_to_datetime(until, inclusive=True))
+    except DatestampError as e:
+        raise BadArgumentError('Illegal datestamp: {}'.format(e.datestamp))
 
-    if resumptionToken:
-        [from_, until, cursor, metadataPrefix] = resumptionToken.split(',')
-    else:
-        if from_ is None:
-            from_ = '2011-06-01T00:00:00Z'
+    return [
+        {'identifier': igsn, 'datestamp': deleted}
+        for igsn, deleted in store.get_tombstones(from_, until)
+    ]
 
-        if until is None:
-            until = '9999-12-31T23:59:59Z'
 
-        cursor = 0
+def get_resumption_token(state, last_identifier=None):
+    """
+    <resumptionToken expirationDate="2017-03-24T05:02:52Z"
+    completeListSize="6267770" cursor="100">
+    eyJjIjoxMDAsImUiOjE0OTAzMjgxNzIsIm0iOiJvYWlfZGMiLCJuIjo2MjY3NzcwfQ.rXg4kR3_8nV0ZQpN4Nf3dA
+    </resumptionToken>
+    :param state: the harvest state of the page just given, from get_harvest_state()
+    :param last_identifier: the IGSN of the last Sample on the page just given
+    :return: a dict for the resumptionToken element, or None if this was the last page
+    """
+    cursor_next = state['cursor'] + state['batch_size']
+    if cursor_next >= state['complete_list_size']:
+        return None
 
-    complete_list_size = get_complete_list_size(from_, until)
-    cursor_next = int(cursor) + conf.OAI_BATCH_SIZE
-    if cursor_next >= complete_list_size:
-        next_resumption_token = None
-    else:
-        next_resumption_token = {
-            'expiration_date': expiration_date,
-            'complete_list_size': complete_list_size,
-            'cursor': cursor,
-            'from_': from_,
-            'until': until,
-            'cursor_next': cursor_next,
-            'metadataPrefix': metadataPrefix
-        }
+    expires = int(time.time()) + OAI_TOKEN_LIFETIME
+    next_state = dict(state, cursor=cursor_next, last_identifier=last_identifier, expires=expires)
 
-    return next_resumption_token
+    return {
+        'token': encode_token(next_state),
+        'expiration_date': datetime_to_datestamp(datetime.datetime.utcfromtimestamp(expires)),
+        'complete_list_size': state['complete_list_size'],
+        'cursor': state['cursor']
+    }
 
 
 def get_earliest_date():
@@ -290,45 +347,31 @@ def get_complete_list_size(str_from_date=None, str_until_date=None):
     return int(str_record_count)
 
 
-def create_url_query_token(token):
+def create_url_query(page_no, no_per_page, from_=None, until=None):
     """
-    returns the url to query GA's Samples database based
-    on a resumption token.
-    :param token: a resumption token
+    returns the url to query GA's Samples database for a page of a harvest,
+    restricted to the harvest's from/until window if one was given.
+    :param page_no: the page number
+    :param no_per_page: the number of records per page
+    :param from_: OAI-PMH datestamp, or None
+    :param until: OAI-PMH datestamp, or None
     :return: A url for querying the samples DB
     """
-    no_per_page = conf.OAI_BATCH_SIZE
-
-    [from_, until, cursor, metadataPrefix] = token.split(',')
-    from_date = convert_datestamp_to_oracle(from_)
-    until_date = convert_datestamp_to_oracle(until)
-
-    page_no = str(math.floor(int(cursor) / int(no_per_page)))
-
-    oracle_api_samples_url = conf.XML_API_URL_SAMPLESET_DATE_RANGE.format(
-        page_no, no_per_page, from_date, until_date
+    if from_ is None and until is None:
+        return conf.XML_API_URL_SAMPLESET.format(page_no, no_per_page)
+
+    return conf.XML_API_URL_SAMPLESET_DATE_RANGE.format(
+        page_no,
+        no_per_page,
+        convert_datestamp_to_oracle(from_ or '2011-06-01T00:00:00Z'),
+        convert_datestamp_to_oracle(until or '9999-12-31T23:59:59Z')
     )
-    return oracle_api_samples_url
 
 
 def get_obj_vars_as_dict(x):
     return dict((key, getattr(x, key)) for key in dir(x) if key not in dir(x.__class__))
 
 
-def calc_expiration_datestamp():
-    """
-    responseDate = 2017-02-08T06:01:12Z
-    expirationDate=2017-02-08T07:01:13Z
-    """
-    dt = datetime.datetime.now()
-    request_datestamp = datetime_to_datestamp(dt)
-    request_date = datestamp_to_datetime(request_datestamp)
-    expiration_date = request_date + timedelta(hours=1)
-    expiration_timestamp = datetime_to_datestamp(expiration_date)
-
-    return expiration_timestamp
-
-
 class ParameterError(ValueError):
     pass
 
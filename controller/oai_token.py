@@ -0,0 +1,100 @@
+"""
+Stateless OAI-PMH resumption tokens. A token carries all of the state a harvest needs to continue, signed so that it
+can be trusted by any worker without server-side storage or calls to GA's Oracle XML API.
+
+A token is the base64url encoding of a compact JSON object followed by a '.' and a truncated HMAC-SHA256 signature.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import _config as conf
+from controller.oai_errors import BadResumptionTokenError
+
+
+# all workers serving a harvest must share this secret, otherwise tokens issued by one are rejected by the others
+OAI_TOKEN_SECRET = getattr(conf, 'OAI_TOKEN_SECRET', None)
+if OAI_TOKEN_SECRET is None:
+    logging.warning('OAI_TOKEN_SECRET is not set, resumption tokens will only be valid for this process')
+    OAI_TOKEN_SECRET = os.urandom(32)
+elif isinstance(OAI_TOKEN_SECRET, str):
+    OAI_TOKEN_SECRET = OAI_TOKEN_SECRET.encode('utf-8')
+
+OAI_TOKEN_LIFETIME = getattr(conf, 'OAI_TOKEN_LIFETIME', 3600)  # seconds
+
+SIGNATURE_LENGTH = 16  # bytes of the HMAC-SHA256 digest kept
+
+# token state names to the short keys used in the encoded token
+KEYS = {
+    'from_': 'f',
+    'until': 'u',
+    'cursor': 'c',
+    'metadataPrefix': 'm',
+    'complete_list_size': 'n',
+    'batch_size': 'b',
+    'last_identifier': 'k',
+    'expires': 'e'
+}
+
+
+def _b64encode(b):
+    return base64.urlsafe_b64encode(b).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(s):
+    return base64.urlsafe_b64decode(s + '=' * (-len(s) % 4))
+
+
+def _sign(payload):
+    return hmac.new(OAI_TOKEN_SECRET, payload, hashlib.sha256).digest()[:SIGNATURE_LENGTH]
+
+
+def encode_token(state):
+    """
+    Makes a signed resumption token from a harvest's state. An expiry is added if the state doesn't have one.
+
+    :param state: dict with some or all of the keys of KEYS
+    :return: a URL-safe token string
+    """
+    state = dict(state)
+    state.setdefault('expires', int(time.time()) + OAI_TOKEN_LIFETIME)
+    payload = json.dumps(
+        {KEYS[k]: v for k, v in state.items() if k in KEYS and v is not None},
+        separators=(',', ':'),
+        sort_keys=True
+    ).encode('utf-8')
+
+    return '{}.{}'.format(_b64encode(payload), _b64encode(_sign(payload)))
+
+
+def decode_token(token):
+    """
+    Validates a resumption token and returns the harvest state it carries
+
+    :param token: a token made by encode_token()
+    :return: dict with the keys of KEYS, missing values as None
+    :raises BadResumptionTokenError: if the token is malformed, has been tampered with or has expired
+    """
+    try:
+        payload, signature = token.strip().split('.')
+        payload = _b64decode(payload)
+        signature = _b64decode(signature)
+    except (ValueError, AttributeError):
+        raise BadResumptionTokenError('The resumptionToken is not valid.')
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise BadResumptionTokenError('The resumptionToken is not valid.')
+
+    try:
+        values = json.loads(payload.decode('utf-8'))
+    except ValueError:
+        raise BadResumptionTokenError('The resumptionToken is not valid.')
+
+    state = {k: values.get(short) for k, short in KEYS.items()}
+    if state['expires'] is None or state['expires'] < time.time():
+        raise BadResumptionTokenError('The resumptionToken has expired.')
+
+    return state
@@ -0,0 +1,38 @@
+"""
+This file contains the HTTP routes for searching across the registers
+"""
+from flask import Blueprint, request, Response, jsonify
+from model.suggest import suggest_index, SUGGEST_REGISTERS
+
+
+search = Blueprint('search', __name__)
+
+SUGGEST_K_MAX = 100
+
+
+@search.route('/search/suggest')
+def suggest():
+    """
+    Type-ahead suggestions of Samples, Sites & Surveys whose identifier, or Survey name, starts with q
+
+    :return: HTTP Response
+    """
+    q = request.values.get('q', '').strip()
+    try:
+        k = int(request.values.get('k')) if request.values.get('k') is not None else 10
+    except ValueError:
+        return Response('k must be an integer', mimetype='text/plain', status=400)
+    if k < 1 or k > SUGGEST_K_MAX:
+        return Response('k must be between 1 and {}'.format(SUGGEST_K_MAX), mimetype='text/plain', status=400)
+
+    registers = request.values.get('register').split(',') if request.values.get('register') is not None else None
+    if registers is not None and any(r not in SUGGEST_REGISTERS for r in registers):
+        return Response(
+            'register must be one or more of {}'.format(', '.join(SUGGEST_REGISTERS)),
+            mimetype='text/plain',
+            status=400
+        )
+
+    if q == '':
+        return jsonify({'q': q, 'suggestions': []})
+    return jsonify({'q': q, 'suggestions': suggest_index.suggest(q, k, registers)})
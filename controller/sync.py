@@ -0,0 +1,163 @@
+"""
+Synchronises the local store (model/store.py) with GA's Oracle XML API. Run it periodically, e.g. from cron:
+
+    python -m controller.sync
+"""
+import datetime
+import logging
+from io import BytesIO
+import requests
+from lxml import etree
+import _config as conf
+from model import store, geometry
+from controller.oai_datestamp import datetime_to_datestamp, str2datetime
+
+
+SYNC_BATCH_SIZE = getattr(conf, 'SYNC_BATCH_SIZE', 1000)
+
+
+def _float(text):
+    return float(text) if text is not None else None
+
+
+def _geom_polygon(elem):
+    """
+    :param elem: a ROW element
+    :return: list of the (lon, lat) vertices of the ROW's GEOM polygon, or None if it has none
+    """
+    ordinates = elem.find('GEOM/SDO_ORDINATES')
+    if ordinates is None:
+        return None
+    # (lon, lat, elevation) triples
+    vertices = [tuple(vertex) for vertex in geometry.parse_ordinates(ordinates, 3).tolist()]
+    return vertices if len(vertices) > 0 else None
+
+
+def _geom_bbox(elem, polygon):
+    """
+    :param elem: a ROW element
+    :param polygon: the ROW's polygon, from _geom_polygon()
+    :return: (min_x, min_y, max_x, max_y) of the ROW's GEOM point or polygon, or Nones if it has neither
+    """
+    if polygon is not None:
+        lons = [v[0] for v in polygon]
+        lats = [v[1] for v in polygon]
+        return min(lons), min(lats), max(lons), max(lats)
+    x = _float(elem.findtext('GEOM/SDO_POINT/X'))
+    y = _float(elem.findtext('GEOM/SDO_POINT/Y'))
+    if x is not None and y is not None:
+        return x, y, x, y
+    return None, None, None, None
+
+
+def _sample_row(elem):
+    modified = str2datetime(elem.findtext('MODIFIED_DATE'))
+    eno = elem.findtext('ENO')
+    return {
+        'igsn': elem.findtext('IGSN'),
+        'modified': datetime_to_datestamp(modified) if modified is not None else None,
+        'x': _float(elem.findtext('GEOM/SDO_POINT/X')),
+        'y': _float(elem.findtext('GEOM/SDO_POINT/Y')),
+        'eno': int(eno) if eno else None
+    }
+
+
+def _site_row(elem):
+    eno = elem.findtext('ENO')
+    polygon = _geom_polygon(elem)
+    min_x, min_y, max_x, max_y = _geom_bbox(elem, polygon)
+    return {
+        'eno': int(eno) if eno is not None else None,
+        'min_x': min_x,
+        'min_y': min_y,
+        'max_x': max_x,
+        'max_y': max_y,
+        'polygon': store.format_vertices(polygon) if polygon is not None else None
+    }
+
+
+def _survey_row(elem):
+    return {
+        'surveyid': elem.findtext('SURVEYID'),
+        'name': elem.findtext('SURVEYNAME'),
+        'min_x': _float(elem.findtext('WLONG')),
+        'min_y': _float(elem.findtext('SLAT')),
+        'max_x': _float(elem.findtext('ELONG')),
+        'max_y': _float(elem.findtext('NLAT'))
+    }
+
+
+# register: (Oracle XML API register URL, function making a store row from an XML ROW)
+SYNC_REGISTERS = {
+    'sample': (conf.XML_API_URL_SAMPLESET, _sample_row),
+    'site': (conf.XML_API_URL_SITESET, _site_row),
+    'survey': (conf.XML_API_URL_SURVEY_REGISTER, _survey_row)
+}
+
+
+def _iter_pages(register):
+    """
+    Reads a whole register from the Oracle XML API, a page at a time. A page that is neither XML nor the API's "No
+    data" message raises an XMLSyntaxError, rather than being taken for the end of the register.
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: generator of lists of store rows
+    """
+    url, make_row = SYNC_REGISTERS[register]
+    page_no = 1
+    while True:
+        r = requests.get(url.format(page_no, SYNC_BATCH_SIZE), timeout=60)
+        r.raise_for_status()
+        # the API returns a plain "No data" message, not XML, past the last page
+        if not r.content.lstrip().startswith(b'<') and b'No data' in r.content:
+            return
+
+        rows = []
+        for event, elem in etree.iterparse(BytesIO(r.content), tag='ROW'):
+            rows.append(make_row(elem))
+            elem.clear()
+
+        if len(rows) == 0:
+            return
+        yield rows
+
+        if len(rows) < SYNC_BATCH_SIZE:
+            return
+        page_no += 1
+
+
+def sync_register(register):
+    """
+    Records every item currently in one of the Oracle XML API's registers and removes those missing from this sync and
+    the last completed one, tombstoning Samples. If the upstream read fails part way through, nothing is removed.
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: the number of items removed
+    """
+    id_column = store.REGISTERS[register][1]
+    generation = store.begin_sync(register)
+    seen = 0
+    try:
+        for rows in _iter_pages(register):
+            store.upsert_items(register, [row for row in rows if row[id_column] is not None], generation)
+            seen += len(rows)
+    except (requests.RequestException, etree.XMLSyntaxError) as e:
+        # items not yet read would be wrongly removed, so the sync is abandoned & the next one starts again
+        logging.error('{} sync {} failed after {} items, not removing anything: {}'.format(
+            register, generation, seen, e))
+        return 0
+
+    # an empty upstream is far more likely to be an outage than the withdrawal of every item
+    if seen == 0:
+        logging.error('{} sync {} read nothing, not removing anything'.format(register, generation))
+        return 0
+
+    removed = store.finish_sync(register, generation, datetime_to_datestamp(datetime.datetime.utcnow()))
+    logging.info('{} sync {} complete, {} removed'.format(register, generation, removed))
+    return removed
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    for register in SYNC_REGISTERS:
+        sync_register(register)
@@ -0,0 +1,33 @@
+"""
+This file contains the HTTP routes for map tiles of the registers
+"""
+from flask import Blueprint, Response
+from model.tiles import get_tile, TILE_LAYERS, TILE_MAX_ZOOM
+
+
+tiles = Blueprint('tiles', __name__)
+
+
+@tiles.route('/tiles/<string:layer>/<int:z>/<int:x>/<int:y>.mvt')
+def tile(layer, z, x, y):
+    """
+    A Mapbox Vector Tile of the Sites, Samples or Survey extents
+
+    :return: HTTP Response
+    """
+    if layer not in TILE_LAYERS:
+        return Response(
+            'The layer must be one of {}'.format(', '.join(TILE_LAYERS)),
+            mimetype='text/plain',
+            status=404
+        )
+    if z > TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return Response('There is no tile {}/{}/{}'.format(z, x, y), mimetype='text/plain', status=404)
+
+    try:
+        mvt = get_tile(layer, z, x, y)
+    except Exception as e:
+        print(e)
+        return Response('The tiles are unavailable', mimetype='text/plain', status=500)
+
+    return Response(mvt, mimetype='application/vnd.mapbox-vector-tile')
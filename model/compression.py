@@ -0,0 +1,188 @@
+"""
+gzip & Brotli compression of responses, negotiated by Accept-Encoding. compress_response() is an after_request hook of
+the whole app: streamed responses, e.g. register exports, are compressed chunk by chunk as they're sent and others
+whole. Responses from the output cache are compressed there instead, by compress_entry(), so that each cached response
+is compressed once per encoding. Brotli is used if the brotli package is installed.
+"""
+import zlib
+from flask import request
+import _config as config
+from model import conditional
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSION_MIN_BYTES = getattr(config, 'COMPRESSION_MIN_BYTES', 500)
+# levels for responses compressed as they're sent and for those compressed once, for the output cache
+GZIP_LEVEL = 6
+GZIP_CACHED_LEVEL = 9
+BROTLI_QUALITY = 5
+BROTLI_CACHED_QUALITY = 9
+
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/rdf+xml',
+    'application/rdf+json',
+    'application/ld+json',
+    'application/n-triples',
+    'application/vnd.geo+json',
+    'application/x-ndjson',
+    'application/vnd.mapbox-vector-tile',
+    'image/svg+xml'
+}
+
+
+def compressible(mimetype):
+    return mimetype is not None and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES)
+
+
+def negotiate(request):
+    """
+    :return: the encoding to compress the response to the request with, or None for none
+    """
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+class _Compressor:
+    """
+    A gzip or Brotli stream, with the same methods for both
+    """
+    def __init__(self, encoding, cached=False):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.stream = brotli.Compressor(quality=BROTLI_CACHED_QUALITY if cached else BROTLI_QUALITY)
+        else:
+            # wbits 31 is a gzip header & trailer around the deflate stream
+            self.stream = zlib.compressobj(GZIP_CACHED_LEVEL if cached else GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self.stream.process(data)
+        return self.stream.compress(data)
+
+    def flush(self):
+        """
+        :return: all the output so far, so that a client can decompress everything sent
+        """
+        if self.encoding == 'br':
+            return self.stream.flush()
+        return self.stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.stream.finish()
+        return self.stream.flush()
+
+
+def compress(data, encoding, cached=False):
+    """
+    :param data: bytes
+    :param encoding: 'gzip' or 'br'
+    :param cached: whether the result will be cached, so is worth compressing harder
+    :return: the compressed bytes
+    """
+    compressor = _Compressor(encoding, cached)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _compress_stream(chunks, encoding):
+    compressor = _Compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        # each chunk is sent as soon as it's made, rather than when the compressor's buffer fills
+        data = compressor.compress(chunk) + compressor.flush()
+        if len(data) > 0:
+            yield data
+    yield compressor.finish()
+
+
+def _encoded_headers(headers, encoding):
+    """
+    Sets the headers of a response compressed with encoding, including a different ETag for each encoding
+    """
+    headers['Content-Encoding'] = encoding
+    etag = headers.get('ETag')
+    if etag is not None:
+        headers['ETag'] = '"{}"'.format(conditional.encoded_etag(etag.strip('"'), encoding))
+
+
+def _vary(headers):
+    vary = headers.get('Vary')
+    if vary is None:
+        headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower():
+        headers['Vary'] = vary + ', Accept-Encoding'
+
+
+class _HeaderList:
+    """
+    The list of (name, value) headers of a cached response, with the few dict methods compression needs
+    """
+    def __init__(self, items):
+        self.items = list(items)
+
+    def get(self, name):
+        return next((value for n, value in self.items if n.lower() == name.lower()), None)
+
+    def pop(self, name, default=None):
+        self.items = [(n, value) for n, value in self.items if n.lower() != name.lower()]
+
+    def __setitem__(self, name, value):
+        self.pop(name)
+        self.items.append((name, value))
+
+    def mimetype(self):
+        content_type = self.get('Content-Type')
+        return content_type.split(';')[0].strip() if content_type is not None else None
+
+
+def compress_entry(entry, encoding):
+    """
+    :param entry: the (status, headers, body) of an uncompressed cached response
+    :param encoding: 'gzip' or 'br'
+    :return: the (status, headers, body) of the response compressed with encoding, or the entry itself if it isn't
+        worth compressing
+    """
+    status, headers, body = entry
+    headers = _HeaderList(headers)
+    if not compressible(headers.mimetype()) or len(body) < COMPRESSION_MIN_BYTES:
+        return entry
+    _encoded_headers(headers, encoding)
+    _vary(headers)
+    headers.pop('Content-Length', None)
+    return status, headers.items, compress(body, encoding, cached=True)
+
+
+def compress_response(response):
+    """
+    Compresses a response, if the request accepts an encoding & the response is worth compressing. For
+    Flask.after_request.
+
+    :param response: HTTP Response
+    :return: the Response, compressed or not
+    """
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers or \
+            not compressible(response.mimetype):
+        return response
+    _vary(response.headers)
+    encoding = negotiate(request)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_BYTES:
+            return response
+        response.set_data(compress(data, encoding))
+    _encoded_headers(response.headers, encoding)
+    return response
@@ -0,0 +1,52 @@
+"""
+Conditional GET for Sample, Site & Survey instances and registers. A response's strong ETag is a hash of what it is
+made from, e.g. the record's version and the view & format, so it can be compared with If-None-Match, and a
+Last-Modified date with If-Modified-Since, before anything is rendered. A client whose copy is current gets a 304.
+A compressed response's ETag has its encoding appended, so that each encoding is a different representation. The
+responses are negotiated, so they and their 304s vary by Accept, and ETags are made from the chosen view & format.
+"""
+import hashlib
+from flask import Response
+from werkzeug.http import is_resource_modified
+
+
+def make_etag(*parts):
+    """
+    :param parts: everything the response depends on, with stable reprs
+    :return: the unquoted strong ETag of the response
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def encoded_etag(etag, encoding):
+    """
+    :return: the ETag of a response compressed with encoding, e.g. gzip
+    """
+    return '{}-{}'.format(etag, encoding)
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    :param etag: an ETag from make_etag()
+    :param last_modified: datetime, UTC, or None
+    :return: the response, with ETag, Last-Modified & Vary headers
+    """
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.vary.add('Accept')
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    :return: a 304 Response if the request's If-None-Match or If-Modified-Since shows the client's copy is current,
+        otherwise None
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    for variant in [etag] + [encoded_etag(etag, encoding) for encoding in ('gzip', 'br')]:
+        if not is_resource_modified(request.environ, etag=variant, last_modified=last_modified):
+            # the 304 has the ETag of the representation the client has
+            return set_validators(Response(status=304), variant, last_modified)
+    return None
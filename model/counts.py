@@ -0,0 +1,110 @@
+"""
+Cached total counts of the Sample, Site & Survey registers. The totals change slowly but each costs a call to GA's
+Oracle XML API so they are refreshed in the background, every REGISTER_COUNT_REFRESH_SECONDS, and the cached value is
+given immediately.
+"""
+import logging
+import threading
+import time
+from io import BytesIO
+import requests
+from lxml import etree
+import _config as config
+
+
+REGISTER_COUNT_REFRESH_SECONDS = getattr(config, 'REGISTER_COUNT_REFRESH_SECONDS', 600)
+SURVEY_COUNT_PAGE_SIZE = 1000
+
+
+def _fetch_element_count(url, tag):
+    r = requests.get(url, timeout=10)
+    for event, elem in etree.iterparse(BytesIO(r.content), tag=tag):
+        return int(elem.text)
+    raise ValueError('No {} element in the response from {}'.format(tag, url))
+
+
+def _count_survey_page(page_no):
+    r = requests.get(config.XML_API_URL_SURVEY_REGISTER.format(page_no, SURVEY_COUNT_PAGE_SIZE), timeout=10)
+    try:
+        return sum(1 for event, elem in etree.iterparse(BytesIO(r.content), tag='SURVEYID'))
+    except etree.XMLSyntaxError:
+        # the API returns a plain "No data" message, not XML, past the last page
+        return 0
+
+
+def _fetch_survey_count():
+    """
+    The Oracle XML API has no Survey count so this finds the last page of the Survey register by an exponential then a
+    binary search, i.e. in a number of calls that grows with the log of the number of Surveys.
+
+    :return: the number of Surveys
+    """
+    full = 0  # the last page known to be full
+    page_no = 1
+    n = _count_survey_page(page_no)
+    while n == SURVEY_COUNT_PAGE_SIZE:
+        full = page_no
+        page_no *= 2
+        n = _count_survey_page(page_no)
+
+    # page_no is now the first page known not to be full; if it's empty, the last page is between it and full
+    while n == 0 and page_no - full > 1:
+        mid = (full + page_no) // 2
+        mid_n = _count_survey_page(mid)
+        if mid_n == SURVEY_COUNT_PAGE_SIZE:
+            full = mid
+        else:
+            page_no, n = mid, mid_n
+
+    if n > 0:
+        return (page_no - 1) * SURVEY_COUNT_PAGE_SIZE + n
+    return full * SURVEY_COUNT_PAGE_SIZE
+
+
+class RegisterCount:
+    """
+    The total count of a register, fetched when first asked for and then refreshed by a background thread
+    """
+    def __init__(self, fetch, refresh_seconds=REGISTER_COUNT_REFRESH_SECONDS):
+        self.fetch = fetch
+        self.refresh_seconds = refresh_seconds
+        self.value = None
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def get(self):
+        """
+        :return: the cached count, fetching it now only if it has never been fetched
+        """
+        if self.value is None:
+            with self._lock:
+                if self.value is None:
+                    self.value = self.fetch()
+                if self._refresher is None:
+                    self._refresher = threading.Thread(target=self._refresh, daemon=True)
+                    self._refresher.start()
+        return self.value
+
+    def _refresh(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.value = self.fetch()
+            except Exception as e:
+                # keep serving the last count until the Oracle XML API is back
+                logging.warning('Could not refresh register count: {}'.format(e))
+
+
+COUNTS = {
+    'sample': RegisterCount(lambda: _fetch_element_count(config.XML_API_URL_TOTAL_COUNT, 'RECORD_COUNT')),
+    'site': RegisterCount(lambda: _fetch_element_count(config.XML_API_URL_SITES_TOTAL_COUNT, 'RECORDS')),
+    'survey': RegisterCount(_fetch_survey_count)
+}
+
+
+def get_count(register):
+    """
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: the total number of items in the register
+    """
+    return COUNTS[register].get()
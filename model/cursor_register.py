@@ -0,0 +1,103 @@
+import base64
+from pyldapi import RegisterRenderer
+from rdflib import Namespace, URIRef
+
+
+# pyldapi's RegisterRenderer default page_size_max
+PAGE_SIZE_MAX = 1000
+
+
+def encode_cursor(identifier):
+    """
+    Makes an opaque register cursor from the identifier of the last item on a page
+
+    :param identifier: an IGSN, ENO or SURVEYID
+    :return: a URL-safe cursor string
+    """
+    return base64.urlsafe_b64encode(str(identifier).encode('utf-8')).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: a cursor from encode_cursor(), or an empty string for the start of the register
+    :return: the identifier the cursor encodes, or None for the start of the register
+    :raises ValueError: if the cursor is not valid
+    """
+    if cursor is None or cursor == '':
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('The cursor {} is not valid'.format(cursor))
+
+
+class CursorRegisterRenderer(RegisterRenderer):
+    """
+    A RegisterRenderer for a register paged by an opaque cursor, which encodes the last item of the previous page,
+    rather than by page number. Fetching the page after a cursor is a keyset query so deep pages cost the same as the
+    first. Its paging links are to the first page and the next page only.
+    """
+    def __init__(self, request, uri, label, comment, register_items, contained_item_classes, register_total_count,
+                 cursor, next_cursor, *args, **kwargs):
+        """
+        :param cursor: the cursor of this page, '' for the first page
+        :param next_cursor: the cursor of the next page, or None if this is the last page
+        """
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        super(CursorRegisterRenderer, self).__init__(request, uri, label, comment, register_items,
+                                                     contained_item_classes, register_total_count, *args, **kwargs)
+
+    def _cursor_uri(self, cursor):
+        return '{}?per_page={}&cursor={}'.format(self.uri, self.per_page, cursor)
+
+    def _paging(self):
+        self.first_page = 1
+        self.prev_page = None
+        self.next_page = None
+        self.last_page = None
+
+        # larger pages are clamped, as they are when read from the store, so the next link has the page's own size
+        self.per_page = min(self.per_page, self.page_size_max)
+
+        links = list()
+        # signalling this is an LDP Resource
+        links.append('<http://www.w3.org/ns/ldp#Resource>; rel="type"')
+        # signalling that this is, in fact, a Resource described in pages
+        links.append('<http://www.w3.org/ns/ldp#Page>; rel="type"')
+        links.append('<{}>; rel="first"'.format(self._cursor_uri('')))
+        if self.next_cursor is not None:
+            links.append('<{}>; rel="next"'.format(self._cursor_uri(self.next_cursor)))
+
+        self.headers = {
+            'Link': ', '.join(links)
+        }
+
+        return None
+
+    def _render_reg_view_html(self, template_context=None):
+        context = {
+            'pagination': None,
+            'first_page_uri': self._cursor_uri(''),
+            'next_page_uri': self._cursor_uri(self.next_cursor) if self.next_cursor is not None else None
+        }
+        if template_context is not None:
+            context.update(template_context)
+        return super(CursorRegisterRenderer, self)._render_reg_view_html(template_context=context)
+
+    def _generate_reg_view_rdf(self):
+        g = super(CursorRegisterRenderer, self)._generate_reg_view_rdf()
+        XHV = Namespace('https://www.w3.org/1999/xhtml/vocab#')
+
+        # replace the numbered page & its links with the cursor page & its links
+        numbered_page = URIRef('{}?per_page={}&page={}'.format(self.uri, self.per_page, self.page))
+        this_page = URIRef(self._cursor_uri(self.cursor))
+        for p, o in list(g.predicate_objects(numbered_page)):
+            g.remove((numbered_page, p, o))
+            if p not in (XHV.first, XHV.last, XHV.prev, XHV.next):
+                g.add((this_page, p, o))
+        g.add((this_page, XHV.first, URIRef(self._cursor_uri(''))))
+        if self.next_cursor is not None:
+            g.add((this_page, XHV.next, URIRef(self._cursor_uri(self.next_cursor))))
+
+        return g
@@ -0,0 +1,89 @@
+"""
+Whole-register exports, as NDJSON or CSV, streamed from the local store in keyset batches so that memory use doesn't
+grow with the size of the register and an interrupted export can be resumed after the last identifier received.
+"""
+import csv
+import io
+import json
+import _config as config
+from model import store
+
+
+EXPORT_BATCH_SIZE = getattr(config, 'EXPORT_BATCH_SIZE', 1000)
+
+EXPORT_MIMETYPES = {
+    'application/x-ndjson': 'ndjson',
+    'text/csv': 'csv'
+}
+
+# register: (instance URI base, item label prefix, extra store columns exported)
+EXPORT_REGISTERS = {
+    'sample': (config.URI_SAMPLE_INSTANCE_BASE, 'Sample ', ['modified']),
+    'site': (config.URI_SITE_INSTANCE_BASE, 'Site ', []),
+    'survey': (config.URI_SURVEY_INSTANCE_BASE, 'Survey ', ['name'])
+}
+
+
+def get_export_fields(register):
+    """
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: the names of the fields of each exported item, in order
+    """
+    return ['id', 'label', 'uri'] + EXPORT_REGISTERS[register][2]
+
+
+def iter_export_items(register, after=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Reads every item in a register, a batch at a time
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param after: the identifier to export from, exclusive, or None to export the whole register
+    :param batch_size: the number of items read from the store at a time
+    :return: generator of lists of item dicts with the keys given by get_export_fields()
+    """
+    uri_base, label, extra_fields = EXPORT_REGISTERS[register]
+    id_column = store.REGISTERS[register][1]
+    while True:
+        rows = store.get_rows_after(register, after, batch_size)
+        if len(rows) == 0:
+            return
+        items = []
+        for row in rows:
+            item_id = str(row[id_column])
+            item = {
+                'id': item_id,
+                'label': label + item_id,
+                'uri': uri_base + item_id
+            }
+            for field in extra_fields:
+                item[field] = row[field]
+            items.append(item)
+        yield items
+
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][id_column]
+
+
+def stream_ndjson(register, after=None):
+    """
+    :return: generator of NDJSON text chunks, one per batch of items
+    """
+    for items in iter_export_items(register, after):
+        yield ''.join(json.dumps(item) + '\n' for item in items)
+
+
+def stream_csv(register, after=None):
+    """
+    :return: generator of CSV text chunks, the header row then one per batch of items
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=get_export_fields(register), lineterminator='\n')
+    writer.writeheader()
+    yield buffer.getvalue()
+
+    for items in iter_export_items(register, after):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(items)
+        yield buffer.getvalue()
@@ -0,0 +1,41 @@
+from urllib.parse import urlencode
+from pyldapi import RegisterRenderer
+from rdflib import URIRef
+
+
+class FilteredRegisterRenderer(RegisterRenderer):
+    """
+    A RegisterRenderer for a page of the items of a register that match a filter, such as ?bbox=. The filter's query
+    string arguments are kept in the paging links so that following them pages through the matching items only.
+    """
+    def __init__(self, request, uri, label, comment, register_items, contained_item_classes, register_total_count,
+                 filters, *args, **kwargs):
+        """
+        :param uri: the register's URI, without a query string
+        :param filters: dict of the filter's query string arguments
+        """
+        self.filters = filters
+        super(FilteredRegisterRenderer, self).__init__(request, uri, label, comment, register_items,
+                                                       contained_item_classes, register_total_count, *args, **kwargs)
+
+    def _filtered(self, page_uri):
+        return page_uri.replace(self.uri + '?', '{}?{}&'.format(self.uri, urlencode(self.filters)), 1)
+
+    def _paging(self):
+        error = super(FilteredRegisterRenderer, self)._paging()
+        if error is None:
+            self.headers['Link'] = ', '.join(self._filtered(link) for link in self.headers['Link'].split(', '))
+        return error
+
+    def _generate_reg_view_rdf(self):
+        g = super(FilteredRegisterRenderer, self)._generate_reg_view_rdf()
+        prefix = self.uri + '?'
+        for s, p, o in list(g):
+            if str(s).startswith(prefix) or (isinstance(o, URIRef) and str(o).startswith(prefix)):
+                g.remove((s, p, o))
+                g.add((
+                    URIRef(self._filtered(str(s))) if str(s).startswith(prefix) else s,
+                    p,
+                    URIRef(self._filtered(str(o))) if isinstance(o, URIRef) and str(o).startswith(prefix) else o
+                ))
+        return g
@@ -0,0 +1,176 @@
+"""
+Geometry of Oracle SDO_ORDINATES as NumPy arrays of (lon, lat) vertices, with vectorised centroid, bounding box & area
+and WKT, GML & GeoJSON formatting, shared by the Sample & Site renderers.
+"""
+import re
+import numpy as np
+from lxml import etree
+
+
+# the default simplification tolerance, as a fraction of a polygon's larger extent; about a pixel on a 1000 pixel map
+SIMPLIFY_EXTENT_FRACTION = 0.001
+
+
+def parse_ordinates(ordinates, stride=2):
+    """
+    :param ordinates: an SDO_ORDINATES element, or a sequence of numbers or numeric strings
+    :param stride: the number of ordinates per vertex, 2 for (lon, lat) or 3 for (lon, lat, elevation)
+    :return: (n, 2) float array of (lon, lat) vertices
+    """
+    if hasattr(ordinates, 'tag'):
+        # reading the serialised element's text with a regex is far faster than visiting each (objectify) child
+        ordinates = re.findall(r'>\s*([^<\s]+)\s*<', etree.tostring(ordinates, encoding='unicode'))
+    values = np.asarray(ordinates, dtype=float)
+    values = values[:len(values) - len(values) % stride]
+    return values.reshape(-1, stride)[:, :2]
+
+
+def close_ring(coords):
+    """
+    :return: the vertices with the first repeated at the end, unless it already is
+    """
+    if len(coords) > 0 and not np.array_equal(coords[0], coords[-1]):
+        return np.vstack((coords, coords[:1]))
+    return coords
+
+
+def bbox(coords):
+    """
+    :return: (min_lon, min_lat, max_lon, max_lat)
+    """
+    mins = coords.min(axis=0)
+    maxs = coords.max(axis=0)
+    return mins[0], mins[1], maxs[0], maxs[1]
+
+
+def _cross(ring):
+    return ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1]
+
+
+def area(coords):
+    """
+    :return: the planar area of the polygon, in square degrees, by the shoelace formula
+    """
+    return abs(_cross(close_ring(coords)).sum()) / 2
+
+
+def centroid(coords):
+    """
+    :return: (lon, lat) of the polygon's area-weighted centroid, or the mean of its vertices if it has no area
+    """
+    ring = close_ring(coords)
+    cross = _cross(ring)
+    a = cross.sum() / 2
+    if a == 0:
+        distinct = ring[:-1] if len(ring) > 1 else ring
+        return distinct[:, 0].mean(), distinct[:, 1].mean()
+    return (
+        ((ring[:-1, 0] + ring[1:, 0]) * cross).sum() / (6 * a),
+        ((ring[:-1, 1] + ring[1:, 1]) * cross).sum() / (6 * a)
+    )
+
+
+def _douglas_peucker(line, tolerance):
+    """
+    :return: the vertices of an open line kept by Douglas-Peucker simplification
+    """
+    keep = np.zeros(len(line), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(line) - 1)]
+    while len(stack) > 0:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        inner = line[first + 1:last]
+        a = line[first]
+        d = line[last] - a
+        length = np.hypot(d[0], d[1])
+        if length == 0:
+            distances = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            # perpendicular distances of all the inner vertices from the chord at once
+            distances = np.abs(d[0] * (inner[:, 1] - a[1]) - d[1] * (inner[:, 0] - a[0])) / length
+        i = int(distances.argmax())
+        if distances[i] > tolerance:
+            furthest = first + 1 + i
+            keep[furthest] = True
+            stack.append((first, furthest))
+            stack.append((furthest, last))
+    return line[keep]
+
+
+def default_tolerance(coords):
+    """
+    :return: a simplification tolerance, in degrees, in proportion to the polygon's extent
+    """
+    min_x, min_y, max_x, max_y = bbox(coords)
+    return max(max_x - min_x, max_y - min_y) * SIMPLIFY_EXTENT_FRACTION
+
+
+def simplify(coords, tolerance=None):
+    """
+    Simplifies a polygon by Douglas-Peucker, for display. The ring is split at the vertex furthest from its first so
+    that each half is an open line.
+
+    :param tolerance: the furthest, in degrees, a removed vertex may be from the simplified outline, None for
+        default_tolerance() or 0 for no simplification
+    :return: the simplified polygon's vertices, as a closed ring, or the polygon unchanged if it can't be simplified
+    """
+    if len(coords) < 4:
+        return coords
+    if tolerance is None:
+        tolerance = default_tolerance(coords)
+    if tolerance <= 0:
+        return coords
+
+    ring = close_ring(coords)
+    furthest = int(np.hypot(ring[:, 0] - ring[0, 0], ring[:, 1] - ring[0, 1]).argmax())
+    if furthest == 0:
+        return coords
+    simplified = np.vstack((
+        _douglas_peucker(ring[:furthest + 1], tolerance),
+        _douglas_peucker(ring[furthest:], tolerance)[1:]
+    ))
+    # a closed triangle is the least that is still a polygon
+    return simplified if len(simplified) >= 4 else coords
+
+
+def _join_pairs(coords, separator, pair_separator):
+    # one format of all the ordinates at once, rather than one per vertex
+    return pair_separator.join(['%r' + separator + '%r'] * len(coords)) % tuple(coords.ravel().tolist())
+
+
+def to_wkt_polygon(coords):
+    """
+    :return: the WKT of the polygon, without a CRS, e.g. POLYGON((x y, x y, ...))
+    """
+    return 'POLYGON(({}))'.format(_join_pairs(close_ring(coords), ' ', ', '))
+
+
+def to_gml_polygon(coords, srid):
+    """
+    :return: the GML of the polygon
+    """
+    return '<gml:Polygon srsName="https://epsg.io/{}">' \
+           '<gml:exterior><gml:LinearRing><gml:posList>{}</gml:posList></gml:LinearRing></gml:exterior>' \
+           '</gml:Polygon>'.format(srid, ' '.join(map(repr, close_ring(coords).ravel().tolist())))
+
+
+def to_geojson_polygon(coords):
+    """
+    :return: a GeoJSON Polygon geometry dict
+    """
+    return {
+        'type': 'Polygon',
+        'coordinates': [close_ring(coords).tolist()]
+    }
+
+
+def to_latlngs(coords, before, middle, after, separator):
+    """
+    Formats the vertices lat first, e.g. for Google Maps JavaScript, each as before + lat + middle + lon + after
+
+    :return: the formatted vertices, joined by separator
+    """
+    vertex = before.replace('%', '%%') + '%r' + middle.replace('%', '%%') + '%r' + after.replace('%', '%%')
+    return separator.join([vertex] * len(coords)) % tuple(coords[:, ::-1].ravel().tolist())
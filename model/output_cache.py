@@ -0,0 +1,240 @@
+"""
+A cache of the responses of the Sample, Site & Survey renderers, keyed by (entity, identifier, view, format, record
+version, the renderer's OUTPUT_ARGS & the day, for HTML pages, which cite when they were accessed). A record's version
+is its modified date, or a digest of its XML if it has none, so a cached response is used until the record changes
+upstream and is never stale. Other request arguments don't change a response, so aren't in its key and can't be used to
+fill the cache with copies of it. Responses are held in memory, in an LRU bounded by OUTPUT_CACHE_MAX_BYTES, and those
+evicted can spill to files under OUTPUT_CACHE_DIR, which any number of worker processes may share. The files are a line
+of JSON, of the key, status & headers, and then the body, so reading one runs nothing from it.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import Response, make_response
+import _config as config
+from model import conditional, compression
+
+
+OUTPUT_CACHE_MAX_BYTES = getattr(config, 'OUTPUT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+OUTPUT_CACHE_DIR = getattr(config, 'OUTPUT_CACHE_DIR', None)
+OUTPUT_CACHE_DIR_MAX_BYTES = getattr(config, 'OUTPUT_CACHE_DIR_MAX_BYTES', 1024 * 1024 * 1024)
+
+
+def record_version(xml, modified=None):
+    """
+    :param xml: the record's XML from GA's Oracle XML API, str or bytes
+    :param modified: the record's modified date, if it has one
+    :return: the version of the record, for the cache key
+    """
+    if modified is not None:
+        return modified.isoformat()
+    if isinstance(xml, str):
+        xml = xml.encode('utf-8')
+    return hashlib.sha1(xml).hexdigest()
+
+
+def _size(entry):
+    status, headers, body = entry
+    return len(body) + sum(len(name) + len(value) for name, value in headers)
+
+
+class OutputCache:
+    def __init__(self, max_bytes=OUTPUT_CACHE_MAX_BYTES, directory=OUTPUT_CACHE_DIR,
+                 directory_max_bytes=OUTPUT_CACHE_DIR_MAX_BYTES):
+        """
+        :param max_bytes: the most bytes of responses to hold in memory
+        :param directory: the directory to which responses evicted from memory spill, or None to drop them
+        :param directory_max_bytes: the most bytes of responses to hold in the directory
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.directory_max_bytes = directory_max_bytes
+        self._entries = OrderedDict()  # key: (status, headers, body)
+        self._bytes = 0
+        self._files = OrderedDict()  # file name: size, of the files in the directory, least recently used first
+        self._file_bytes = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            self._index_directory()
+
+    def _index_directory(self):
+        files = sorted(os.scandir(self.directory), key=lambda f: f.stat().st_mtime)
+        for f in files:
+            if f.name.endswith('.response'):
+                self._files[f.name] = f.stat().st_size
+                self._file_bytes += f.stat().st_size
+
+    def get(self, key):
+        """
+        :return: the cached (status, headers, body) of a response, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.directory is None:
+            return None
+
+        entry = self._read(key)
+        if entry is not None:
+            with self._lock:
+                self._add(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """
+        :param entry: the (status, headers, body) of a response
+        """
+        if _size(entry) > self.max_bytes:
+            if self.directory is not None:
+                self._write(key, entry)
+            return
+        with self._lock:
+            evicted = self._add(key, entry)
+        for evicted_key, evicted_entry in evicted:
+            self._write(evicted_key, evicted_entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _add(self, key, entry):
+        """
+        Adds an entry to memory, with the lock held
+
+        :return: list of the (key, entry) tuples evicted to make room, for spilling to the directory
+        """
+        if key in self._entries:
+            self._bytes -= _size(self._entries.pop(key))
+        self._entries[key] = entry
+        self._bytes += _size(entry)
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            evicted_key, evicted_entry = self._entries.popitem(last=False)
+            self._bytes -= _size(evicted_entry)
+            if self.directory is not None:
+                evicted.append((evicted_key, evicted_entry))
+        return evicted
+
+    @staticmethod
+    def _file_name(key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.response'
+
+    def _read(self, key):
+        name = self._file_name(key)
+        try:
+            with open(os.path.join(self.directory, name), 'rb') as f:
+                header = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+            if header['key'] != json.dumps(key):
+                return None
+            entry = (header['status'], [tuple(h) for h in header['headers']], body)
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+        with self._lock:
+            # the file may have been written by another worker since this one indexed the directory
+            if name in self._files:
+                self._files.move_to_end(name)
+            else:
+                self._files[name] = _size(entry)
+                self._file_bytes += _size(entry)
+        return entry
+
+    def _write(self, key, entry):
+        name = self._file_name(key)
+        with self._lock:
+            if name in self._files:
+                self._files.move_to_end(name)
+                return
+
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.directory)
+            status, headers, body = entry
+            with os.fdopen(fd, 'wb') as f:
+                # JSON escapes newlines, so the header is the first line
+                f.write(json.dumps({'key': json.dumps(key), 'status': status, 'headers': headers}).encode('utf-8'))
+                f.write(b'\n')
+                f.write(body)
+            os.replace(tmp, os.path.join(self.directory, name))
+        except IOError as e:
+            logging.info('Could not write a cached response to {}: {}'.format(self.directory, e))
+            return
+
+        removed = []
+        with self._lock:
+            self._files[name] = _size(entry)
+            self._file_bytes += _size(entry)
+            while self._file_bytes > self.directory_max_bytes and len(self._files) > 1:
+                removed_name, removed_size = self._files.popitem(last=False)
+                self._file_bytes -= removed_size
+                removed.append(removed_name)
+        for removed_name in removed:
+            try:
+                os.remove(os.path.join(self.directory, removed_name))
+            except OSError:
+                pass
+
+
+output_cache = OutputCache()
+
+
+def render(renderer, entity, identifier, version, render_response, last_modified=None):
+    """
+    Gives a renderer's response from the cache, rendering & caching it if it isn't there. Only 200 responses are
+    cached, so records not found are looked for again. Responses have an ETag of their key and, if given and they
+    aren't HTML, a Last-Modified date, and a client whose copy is current gets a 304 before either. Responses are
+    compressed as the request accepts and each compressed response is cached alongside the uncompressed one.
+
+    :param renderer: a pyldapi Renderer, whose view & format have been chosen
+    :param entity: 'sample', 'site' or 'survey'
+    :param identifier: the record's identifier, e.g. its IGSN
+    :param version: the record's version, from record_version(), and anything else its responses depend on
+    :param render_response: function of no arguments rendering the response
+    :param last_modified: datetime the record was last modified, or None
+    :return: HTTP Response
+    """
+    request = renderer.request
+    # templates link to the request's base URL, so the host is part of the key
+    args = tuple(tuple(request.args.getlist(name)) for name in getattr(renderer, 'OUTPUT_ARGS', []))
+    # the "Accessed" date of an HTML page's citation
+    day = datetime.date.today().isoformat() if renderer.format == 'text/html' else None
+    key = (entity, identifier, renderer.view, renderer.format, version, request.host_url, args, day)
+    etag = conditional.make_etag(*key)
+    if day is not None:
+        # the page changes daily, not only with the record, so it's only validated by its ETag
+        last_modified = None
+    if version is not None:
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+    entry = output_cache.get(key)
+    if entry is None:
+        response = make_response(render_response())
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        conditional.set_validators(response, etag, last_modified)
+        entry = (response.status_code, list(response.headers.items()), response.get_data())
+        output_cache.put(key, entry)
+
+    # the compressed response is cached too, so it's only compressed once
+    encoding = compression.negotiate(request)
+    if encoding is not None:
+        encoded = output_cache.get(key + (encoding,))
+        if encoded is None:
+            encoded = compression.compress_entry(entry, encoding)
+            if encoded is not entry:
+                output_cache.put(key + (encoding,), encoded)
+        entry = encoded
+
+    status, headers, body = entry
+    return Response(body, status=status, headers=headers)
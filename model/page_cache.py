@@ -0,0 +1,110 @@
+"""
+An LRU cache of register pages, keyed by (register, page, per_page), that prefetches the pages either side of each one
+requested in the background. People and crawlers page through registers sequentially so, after the first, most pages
+are already cached when they're asked for.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import _config as config
+
+
+REGISTER_CACHE_MAX_ITEMS = getattr(config, 'REGISTER_CACHE_MAX_ITEMS', 100000)
+REGISTER_CACHE_SECONDS = getattr(config, 'REGISTER_CACHE_SECONDS', 600)
+REGISTER_CACHE_PREFETCH_PREVIOUS = getattr(config, 'REGISTER_CACHE_PREFETCH_PREVIOUS', False)
+
+
+class PageCache:
+    def __init__(self, fetch, max_items=REGISTER_CACHE_MAX_ITEMS, max_age=REGISTER_CACHE_SECONDS,
+                 prefetch_previous=REGISTER_CACHE_PREFETCH_PREVIOUS):
+        """
+        :param fetch: function of (page, per_page, register) returning a list of items, or None if there are none
+        :param max_items: the most register items, across all cached pages, to hold
+        :param max_age: seconds for which a cached page is used
+        :param prefetch_previous: whether to prefetch page N-1 as well as N+1
+        """
+        self.fetch = fetch
+        self.max_items = max_items
+        self.max_age = max_age
+        self.prefetch_previous = prefetch_previous
+        self._pages = OrderedDict()  # key: (items, time fetched)
+        self._item_count = 0
+        self._in_flight = {}  # key: Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    def get(self, register, page, per_page):
+        """
+        Gets a page of a register, from the cache if it's there, and starts prefetching its neighbours
+
+        :param register: the register's item element tag, e.g. IGSN
+        :param page: the page number, int
+        :param per_page: the number of items per page, int
+        :return: the page's items
+        """
+        key = (register, page, per_page)
+
+        with self._lock:
+            items = self._lookup(key)
+            future = self._in_flight.get(key) if items is None else None
+
+        if future is not None:
+            # wait for a prefetch of this page already under way rather than fetching it twice
+            items = future.result()
+        if items is None:
+            items = self._fetch(key)
+
+        self._prefetch((register, page + 1, per_page))
+        if self.prefetch_previous and page > 1:
+            self._prefetch((register, page - 1, per_page))
+
+        return items
+
+    def _is_fresh(self, key):
+        cached = self._pages.get(key)
+        return cached is not None and time.time() - cached[1] <= self.max_age
+
+    def _lookup(self, key):
+        if key not in self._pages:
+            return None
+        if not self._is_fresh(key):
+            self._remove(key)
+            return None
+        self._pages.move_to_end(key)
+        return self._pages[key][0]
+
+    def _remove(self, key):
+        items, fetched = self._pages.pop(key)
+        self._item_count -= len(items)
+
+    def _fetch(self, key):
+        register, page, per_page = key
+        items = self.fetch(page, per_page, register)
+        if items is not None:
+            with self._lock:
+                if key in self._pages:
+                    self._remove(key)
+                self._pages[key] = (items, time.time())
+                self._item_count += len(items)
+                while self._item_count > self.max_items and len(self._pages) > 1:
+                    self._remove(next(iter(self._pages)))
+        return items
+
+    def _prefetch(self, key):
+        with self._lock:
+            # an expired page is fetched again, so that the page is fresh when it's asked for
+            if self._is_fresh(key) or key in self._in_flight:
+                return
+            self._in_flight[key] = self._executor.submit(self._prefetch_page, key)
+
+    def _prefetch_page(self, key):
+        try:
+            return self._fetch(key)
+        except Exception as e:
+            logging.info('Could not prefetch register page {}: {}'.format(key, e))
+            return None
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
@@ -0,0 +1,162 @@
+"""
+PROV graphs drawn with vis.js, for the prov HTML views of Samples & Surveys. The nodes & edges are found in a view's
+TripleList directly and are written as JSON escaped for a <script> element. Drawings are memoised by their record's entity, identifier &
+version, so a record is only drawn again once it changes.
+"""
+import json
+import threading
+from collections import OrderedDict
+from rdflib import BNode, RDF, RDFS, Namespace
+
+
+PROV = Namespace('http://www.w3.org/ns/prov#')
+FOAF = Namespace('http://xmlns.com/foaf/0.1/')
+
+VISJS_CACHE_SIZE = 1000
+
+# the classes drawn as nodes, in order of precedence for a node of more than one, and their default labels
+NODE_CLASSES = [(PROV.Entity, 'Entity'), (PROV.Activity, 'Activity'), (PROV.Agent, 'Agent')]
+# the relationships drawn as edges
+RELATIONSHIPS = [
+    PROV.wasAttributedTo,
+    PROV.wasGeneratedBy,
+    PROV.used,
+    PROV.wasDerivedFrom,
+    PROV.wasInformedBy,
+    PROV.wasAssociatedWith
+]
+
+NODE_STYLES = {
+    PROV.Entity: {'shape': 'ellipse', 'color': {'background': '#FFFC87', 'border': '#808080'}},
+    PROV.Activity: {'shape': 'box', 'color': {'background': '#9FB1FC', 'border': 'blue'}},
+    PROV.Agent: {'shape': 'image'}
+}
+EDGE_STYLE = {'arrows': 'to', 'font': {'align': 'bottom'}, 'color': {'color': 'black'}}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def simplify(triples):
+    """
+    Simplifies PROV triples for drawing: prov:generated is reversed to prov:wasGeneratedBy, qualified attributions to
+    named agents are added as prov:wasAttributedTo, with the agents' names as their labels, and organisations & people
+    are classed as prov:Agent
+
+    :param triples: list of (subject, predicate, object) tuples
+    :return: list of the simplified triples
+    """
+    names = {s: o for s, p, o in triples if p == FOAF.name}
+    agents = {s: o for s, p, o in triples if p == PROV.agent}
+
+    simplified = []
+    for s, p, o in triples:
+        if p == PROV.generated:
+            simplified.append((o, PROV.wasGeneratedBy, s))
+            continue
+        simplified.append((s, p, o))
+        if p == PROV.qualifiedAttribution and agents.get(o) in names:
+            simplified.append((s, PROV.wasAttributedTo, agents[o]))
+            simplified.append((agents[o], RDFS.label, names[agents[o]]))
+        elif p == RDF.type and (o == FOAF.Organization or o == PROV.Person):
+            simplified.append((s, RDF.type, PROV.Agent))
+
+    return simplified
+
+
+class _Ids:
+    """
+    Node ids: URIs as they are and blank nodes labelled in order of appearance, as in N-Triples
+    """
+    def __init__(self):
+        self.bnodes = {}
+
+    def __call__(self, term):
+        if isinstance(term, BNode):
+            return self.bnodes.setdefault(term, '_:b{}'.format(len(self.bnodes)))
+        return str(term)
+
+
+def _node(node_id, node_class, label, agent_image):
+    node = {'id': node_id, 'label': str(label)}
+    node.update(NODE_STYLES[node_class])
+    if node_class == PROV.Agent:
+        node['image'] = agent_image
+    return node
+
+
+def _edge(from_id, relationship, to_id):
+    edge = {'from': from_id, 'to': to_id, 'label': str(relationship).split('#')[-1]}
+    edge.update(EDGE_STYLE)
+    return edge
+
+
+def _nodes_and_edges(triples, agent_image):
+    ids = _Ids()
+    labels = {}
+    classes = {}
+    for s, p, o in triples:
+        if p == RDFS.label:
+            labels.setdefault(s, o)
+        elif p == RDF.type and o in NODE_STYLES:
+            classes.setdefault(s, set()).add(o)
+
+    nodes = []
+    for s, types in classes.items():
+        node_class, default_label = next((c, name) for c, name in NODE_CLASSES if c in types)
+        nodes.append(_node(ids(s), node_class, labels.get(s, default_label), agent_image))
+    edges = [_edge(ids(s), p, ids(o)) for s, p, o in triples if p in RELATIONSHIPS]
+    return nodes, edges
+
+
+def _script_json(value):
+    """
+    JSON safe to put in a <script> element, as by Flask's tojson filter: labels from upstream records can't close the
+    element, e.g. with </script>, or start markup
+    """
+    return json.dumps(value, indent=4).replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026') \
+        .replace("'", '\\u0027')
+
+
+def _visjs(nodes, edges):
+    return '''
+        var nodes = new vis.DataSet(%(nodes)s);
+
+        var edges = new vis.DataSet(%(edges)s);
+
+        var container = document.getElementById('network');
+
+        var data = {
+            nodes: nodes,
+            edges: edges,
+        };
+
+        var options = {};
+        var network = new vis.Network(container, data, options);
+        ''' % {'nodes': _script_json(nodes), 'edges': _script_json(edges)}
+
+
+def make_visjs(triples, agent_image, record_key=None):
+    """
+    :param triples: a TripleList, such as from a prov view
+    :param agent_image: the URL of the image drawn for Agents
+    :param record_key: (entity, identifier, version) of the record drawn, e.g. ('sample', 'AU1000012', its modified
+        date), or None not to memoise the drawing
+    :return: JavaScript drawing the PROV graph with vis.js
+    """
+    key = record_key + (agent_image,) if record_key is not None else None
+    if key is not None:
+        with _cache_lock:
+            visjs = _cache.get(key)
+            if visjs is not None:
+                _cache.move_to_end(key)
+                return visjs
+
+    visjs = _visjs(*_nodes_and_edges(simplify(triples.all_triples()), agent_image))
+
+    if key is not None:
+        with _cache_lock:
+            _cache[key] = visjs
+            while len(_cache) > VISJS_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return visjs
@@ -0,0 +1,222 @@
+"""
+Direct Turtle & N-Triples writers for the small, fixed-shape RDF views of Samples, Sites & Surveys. A view's triples are
+collected in a TripleList, which has the add() & bind() of an rdflib Graph but is only a list, and written straight to
+text. The namespaces & constant triples of each view are a StaticSubgraph, written once and spliced into every record's
+text. Other formats, e.g. RDF/XML & JSON-LD, fall back to an rdflib Graph and its serializers.
+"""
+import re
+from rdflib import Graph, URIRef, BNode, RDF, RDFS, XSD, OWL
+
+
+# the namespaces every Graph has bound, as rdflib declares them
+DEFAULT_NAMESPACES = [
+    ('rdf', str(RDF)),
+    ('rdfs', str(RDFS)),
+    ('xsd', str(XSD)),
+    ('owl', str(OWL))
+]
+
+_STRING_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '"': '\\"',
+    '\n': '\\n',
+    '\r': '\\r',
+    '\t': '\\t',
+    '\b': '\\b',
+    '\f': '\\f'
+})
+# characters not allowed in an IRIREF, which are written as \u escapes
+_IRI_UNSAFE = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+# a conservative PN_LOCAL, without escapes or a trailing '.'
+_LOCAL_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_-]*$')
+
+
+def _declared(namespaces):
+    """
+    :return: list of (prefix, namespace) tuples with the first namespace bound to each prefix
+    """
+    declared = {}
+    for prefix, namespace in namespaces:
+        declared.setdefault(prefix, str(namespace))
+    return list(declared.items())
+
+
+def _iri(value):
+    if _IRI_UNSAFE.search(value) is not None:
+        value = _IRI_UNSAFE.sub(lambda m: '\\u{:04X}'.format(ord(m.group())), value)
+    return '<' + value + '>'
+
+
+def _literal(literal, iri):
+    text = '"' + str(literal).translate(_STRING_ESCAPES) + '"'
+    if literal.language is not None:
+        return text + '@' + literal.language
+    if literal.datatype is not None:
+        return text + '^^' + iri(str(literal.datatype))
+    return text
+
+
+class _Terms:
+    """
+    Writes the terms of one document, labelling its blank nodes b0, b1, ... in order of appearance
+    """
+    def __init__(self, namespaces=()):
+        """
+        :param namespaces: list of (namespace, prefix) tuples, longest namespace first so that a term gets the most
+            specific of nested namespaces
+        """
+        self.bnodes = {}
+        self.namespaces = namespaces
+
+    def iri(self, value):
+        for namespace, prefix in self.namespaces:
+            if value.startswith(namespace) and _LOCAL_NAME.match(value, len(namespace)) is not None:
+                return prefix + ':' + value[len(namespace):]
+        return _iri(value)
+
+    def term(self, term):
+        if isinstance(term, URIRef):
+            return self.iri(str(term))
+        if isinstance(term, BNode):
+            label = self.bnodes.get(term)
+            if label is None:
+                label = self.bnodes[term] = '_:b{}'.format(len(self.bnodes))
+            return label
+        return _literal(term, self.iri)
+
+
+def _longest_first(namespaces):
+    return sorted(((namespace, prefix) for prefix, namespace in namespaces), key=lambda n: -len(n[0]))
+
+
+def _write_prefixes(namespaces):
+    return ''.join('@prefix {}: {} .\n'.format(prefix, _iri(namespace)) for prefix, namespace in namespaces) + '\n'
+
+
+def _write_statements(triples, terms):
+    """
+    Writes each subject's triples together, in the order the subjects first appear, with predicates & objects grouped
+    """
+    subjects = {}
+    for s, p, o in triples:
+        subjects.setdefault(s, {}).setdefault(p, []).append(o)
+
+    statements = []
+    for s, predicates in subjects.items():
+        statements.append('{} {} .\n\n'.format(terms.term(s), ' ;\n    '.join(
+            '{} {}'.format('a' if p == RDF.type else terms.term(p), ', '.join(terms.term(o) for o in objects))
+            for p, objects in predicates.items()
+        )))
+    return ''.join(statements)
+
+
+def write_ntriples(triples):
+    """
+    :param triples: iterable of (subject, predicate, object) rdflib terms
+    :return: N-Triples text
+    """
+    terms = _Terms()
+    return ''.join(
+        '{} {} {} .\n'.format(terms.term(s), terms.term(p), terms.term(o)) for s, p, o in triples
+    )
+
+
+class StaticSubgraph:
+    """
+    The namespaces & constant triples of a view, the same for every record, written to Turtle & N-Triples once, at
+    import, for splicing into each record's RDF
+    """
+    def __init__(self, namespaces, triples=()):
+        """
+        :param namespaces: list of (prefix, namespace) tuples, after DEFAULT_NAMESPACES
+        :param triples: list of (subject, predicate, object) rdflib terms, without blank nodes
+        """
+        self.namespaces = _declared(DEFAULT_NAMESPACES + list(namespaces))
+        self.triples = list(dict.fromkeys(triples))
+        if any(isinstance(term, BNode) for triple in self.triples for term in triple):
+            raise ValueError('A static subgraph can\'t have blank nodes, their labels would clash with a record\'s')
+
+        self.longest_first = _longest_first(self.namespaces)
+        self.prefixes = _write_prefixes(self.namespaces)
+        self.turtle = _write_statements(self.triples, _Terms(self.longest_first))
+        self.ntriples = write_ntriples(self.triples)
+
+
+NO_STATIC_SUBGRAPH = StaticSubgraph([])
+
+
+class TripleList:
+    """
+    Collects a record's triples & any namespace bindings in the order they are added, dropping repeated triples as a
+    Graph would
+    """
+    def __init__(self, static=NO_STATIC_SUBGRAPH):
+        """
+        :param static: the view's StaticSubgraph, which is part of the record's RDF without being added
+        """
+        self.static = static
+        self.triples = {}
+        self.bindings = []
+
+    def add(self, triple):
+        self.triples[triple] = None
+
+    def bind(self, prefix, namespace):
+        self.bindings.append((prefix, str(namespace)))
+
+    def __iter__(self):
+        return iter(self.triples)
+
+    def __len__(self):
+        return len(self.triples)
+
+    def all_triples(self):
+        """
+        :return: list of the record's triples followed by the static subgraph's
+        """
+        return list(self.triples) + self.static.triples
+
+    @property
+    def namespaces(self):
+        if len(self.bindings) == 0:
+            return self.static.namespaces
+        return _declared(self.static.namespaces + self.bindings)
+
+    def to_graph(self):
+        """
+        :return: the triples, with the static subgraph's, in an rdflib Graph, with the namespaces bound
+        """
+        g = Graph()
+        for prefix, namespace in self.namespaces:
+            g.bind(prefix, namespace)
+        for triple in self.triples:
+            g.add(triple)
+        for triple in self.static.triples:
+            g.add(triple)
+        return g
+
+
+def write_turtle(triples):
+    """
+    :param triples: a TripleList
+    :return: Turtle text, the record's triples followed by its view's static subgraph
+    """
+    static = triples.static
+    if len(triples.bindings) == 0:
+        prefixes, longest_first = static.prefixes, static.longest_first
+    else:
+        prefixes, longest_first = _write_prefixes(triples.namespaces), _longest_first(triples.namespaces)
+    return prefixes + _write_statements(triples, _Terms(longest_first)) + static.turtle
+
+
+def serialize(triples, rdf_format):
+    """
+    :param triples: a TripleList
+    :param rdf_format: an rdflib format name, from Renderer.RDF_SERIALIZER_MAP
+    :return: the triples as UTF-8 bytes if written directly, otherwise as rdflib serializes them
+    """
+    if rdf_format == 'turtle':
+        return write_turtle(triples).encode('utf-8')
+    elif rdf_format == 'nt':
+        return (write_ntriples(triples) + triples.static.ntriples).encode('utf-8')
+    return triples.to_graph().serialize(format=rdf_format)
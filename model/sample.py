@@ -5,10 +5,45 @@ from io import StringIO
 import requests
 from lxml import etree
 from lxml import objectify
-from rdflib import Graph, URIRef, RDF, RDFS, XSD, OWL, Namespace, Literal, BNode
+from rdflib import URIRef, RDF, RDFS, XSD, OWL, Namespace, Literal, BNode
 import _config as config
 from controller.oai_datestamp import *
 from .lookups import TERM_LOOKUP
+from . import geometry
+from . import rdf_writer
+from . import prov_vis
+from . import output_cache
+from .static_assets import static_url
+
+
+PROV = Namespace('http://www.w3.org/ns/prov#')
+SKOS = Namespace('http://www.w3.org/2004/02/skos/core#')
+ADMS = Namespace('http://www.w3.org/ns/adms#')
+DCT = Namespace('http://purl.org/dc/terms/')
+SAMFL = Namespace('http://def.seegrid.csiro.au/ontology/om/sam-lite#')
+GEOSP = Namespace('http://www.opengis.net/ont/geosparql#')
+AUROLE = Namespace('http://communications.data.gov.au/def/role/')
+FOAF = Namespace('http://xmlns.com/foaf/0.1/')
+ORG = Namespace('http://www.w3.org/ns/org#')
+IGSN = Namespace('http://pid.geoscience.gov.au/def/ont/igsn#')
+SOSA = Namespace('http://www.w3.org/ns/sosa/')
+SAMP = Namespace('http://www.w3.org/ns/sosa/sampling/')
+
+# the namespaces of all of the RDF views
+NAMESPACES = [
+    ('prov', PROV),
+    ('skos', SKOS),
+    ('adms', ADMS),
+    ('dct', DCT),
+    ('samfl', SAMFL),
+    ('geosp', GEOSP),
+    ('aurole', AUROLE),
+    ('foaf', FOAF),
+    ('org', ORG)
+]
+
+# domain feature, same for all Samples
+LITHOSPHERE = URIRef('http://registry.it.csiro.au/sandbox/csiro/oznome/feature/earth-realm/lithosphere')
 
 
 class SampleRenderer(Renderer):
@@ -42,6 +77,25 @@ class SampleRenderer(Renderer):
     URI_MISSSING = 'http://www.opengis.net/def/nil/OGC/0/missing'
     URI_GA = 'http://pid.geoscience.gov.au/org/ga/geoscienceaustralia'
 
+    # views made without the record, which isn't fetched for them
+    RECORDLESS_VIEWS = ['alternates']
+    # the query string arguments, other than _view & _format, that change a response, so are in its output cache key
+    OUTPUT_ARGS = ['simplify']
+
+    # the namespaces & constant triples of each RDF view
+    STATIC_RDF = {
+        'igsn-o': rdf_writer.StaticSubgraph(NAMESPACES + [('igsn', IGSN)]),
+        'dct': rdf_writer.StaticSubgraph(NAMESPACES, [
+            # define GA as a dct:Agent
+            (URIRef(URI_GA), RDF.type, DCT.Agent)
+        ]),
+        'prov': rdf_writer.StaticSubgraph(NAMESPACES),
+        'sosa': rdf_writer.StaticSubgraph(NAMESPACES + [('sosa', SOSA), ('sampling', SAMP)], [
+            (LITHOSPHERE, RDF.type, SOSA.FeatureOfInterest),
+            (LITHOSPHERE, SKOS.exactMatch, URIRef('http://sweet.jpl.nasa.gov/2.3/realmGeol.owl#Lithosphere'))
+        ])
+    }
+
     def __init__(self, request, xml=None):
         views = {
             'csirov3': View(
@@ -58,6 +112,7 @@ class SampleRenderer(Renderer):
                 [
                     "text/html",
                     "text/turtle",
+                    "application/n-triples",
                     "application/rdf+xml",
                     "application/rdf+json",
                     "application/xml",
@@ -86,7 +141,7 @@ class SampleRenderer(Renderer):
             'igsn-o': View(
                 'IGSN Ontology View',
                 "An OWL ontology of Samples based on CSIRO's XML-based IGSN schema",
-                ["text/html", "text/turtle", "application/rdf+xml", "application/rdf+json"],
+                ["text/html", "text/turtle", "application/n-triples", "application/rdf+xml", "application/rdf+json"],
                 'text/html',
                 namespace='http://pid.geoscience.gov.au/def/ont/ga/igsn'
             ),
@@ -94,7 +149,7 @@ class SampleRenderer(Renderer):
             'prov': View(
                 'PROV View',
                 "The W3C's provenance data model, PROV",
-                ["text/html", "text/turtle", "application/rdf+xml", "application/rdf+json"],
+                ["text/html", "text/turtle", "application/n-triples", "application/rdf+xml", "application/rdf+json"],
                 "text/turtle",
                 namespace="http://www.w3.org/ns/prov/"
             ),
@@ -102,7 +157,7 @@ class SampleRenderer(Renderer):
             'sosa': View(
                 'SOSA View',
                 "The W3C's Sensor, Observation, Sample, and Actuator ontology within the Semantic Sensor Networks ontology",
-                ["text/turtle", "application/rdf+xml", "application/rdf+json"],
+                ["text/turtle", "application/n-triples", "application/rdf+xml", "application/rdf+json"],
                 "text/turtle",
                 namespace="http://www.w3.org/ns/sosa/"
             ),
@@ -114,7 +169,10 @@ class SampleRenderer(Renderer):
         #       - or Local URI, e.g. http://localhost:5000/sample/AU239
         #   2. OAI-PMH URL, e.g. http://pid.geoscience.gov.au/oai?verb=GetRecord&identifier=AU239&metadataPrefix=dc
         #       - or local URL, e.g. http://localhost:5000/oai?verb=GetRecord&identifier=AU239&metadataPrefix=dc
-        if request.base_url.endswith('oai'):
+        if xml is not None:
+            # the IGSN is read from the XML, e.g. for each ROW of an OAI-PMH ListRecords page
+            self.igsn = ''
+        elif request.base_url.endswith('oai'):
             self.igsn = request.values['identifier']
         else:
             self.igsn = request.base_url.split('/')[-1]
@@ -159,10 +217,12 @@ class SampleRenderer(Renderer):
         self.custodian_label = 'Geoscience Australia'  # default
         self.collector = None
         self.not_found = False
+        self.version = None
 
         if xml is not None:  # even if there are values for Oracle API URI and IGSN, load from XML file if present
             self._populate_from_xml_file(xml)
-        else:
+            self.uri = config.URI_SAMPLE_INSTANCE_BASE + self.igsn
+        elif self.view not in self.RECORDLESS_VIEWS:
             self._populate_from_oracle_api()
 
     def validate_xml(self, xml):
@@ -241,11 +301,12 @@ class SampleRenderer(Renderer):
                 if hasattr(root.ROW.GEOM, 'SDO_ELEM_INFO'):
                     self.elem_info = root.ROW.GEOM.SDO_ELEM_INFO
                 if hasattr(root.ROW.GEOM, 'SDO_ORDINATES'):
-                    self.ordinates = root.ROW.GEOM.SDO_ORDINATES.getchildren()
+                    self.ordinates = geometry.parse_ordinates(root.ROW.GEOM.SDO_ORDINATES, 2)
                     # calculate centroid values to centre a map
-                    self.centroid_lat = round(sum(self.ordinates[1:-2:2]) / len(self.ordinates[:-2:2]), 2)
-                    self.centroid_lon = round(sum(self.ordinates[:-2:2]) / len(self.ordinates[1:-2:2]), 2)
-                    # self.ordinates = zip(*[iter(raw_ordinates)]*2)
+                    if len(self.ordinates) > 0:
+                        centroid_lon, centroid_lat = geometry.centroid(self.ordinates)
+                        self.centroid_lat = round(float(centroid_lat), 2)
+                        self.centroid_lon = round(float(centroid_lon), 2)
             if hasattr(root.ROW, 'STATEID'):
                 self.state = root.ROW.STATEID  # self._make_vocab_uri(root.ROW.STATEID, 'state')
             if hasattr(root.ROW, 'COUNTRY'):
@@ -292,6 +353,7 @@ class SampleRenderer(Renderer):
         except Exception as e:
             print(e)
 
+        self.version = output_cache.record_version(xml, self.date_modified)
         return True
 
     def _make_vocab_uri(self, xml_value, vocab_type):
@@ -308,12 +370,17 @@ class SampleRenderer(Renderer):
                 return '<a href="{}">{}</a>'.format(vocab_uri, vocab_uri.split('/')[-1])
 
     def render(self):
+        if self.view == 'alternates':
+            return self._render_alternates_view()
+        return output_cache.render(
+            self, 'sample', self.igsn, self.version, self._render, last_modified=self.date_modified
+        )
+
+    def _render(self):
         if self.not_found:
             return Response('Sample with IGSN {} not found.'.format(self.igsn), status=404, mimetype='text/plain')
 
-        if self.view == 'alternates':
-            return self._render_alternates_view()
-        elif self.view == 'igsn-o':
+        if self.view == 'igsn-o':
             if self.format == 'text/html':
                 return self.export_html(model_view=self.view)
             else:
@@ -366,22 +433,15 @@ class SampleRenderer(Renderer):
             return '<http://www.opengis.net/def/crs/EPSG/0/4283> POINTZ({} {} {})'.format(self.x, self.y, self.z)
         elif self.srid is not None and self.x is not None and self.y is not None:
             return '<http://www.opengis.net/def/crs/EPSG/0/4283> POINT({} {})'.format(self.x, self.y)
-        elif self.ordinates is not None:
-            s = []
-            for x, y in zip(*[iter(self.ordinates)] * 2):
-                s.append(str(x) + ' ' + str(y))
-            return '<http://www.opengis.net/def/crs/EPSG/0/4283> POLYGON(({}))'.format(
-                ', '.join(s)
-            )
+        elif self.ordinates is not None and len(self.ordinates) > 0:
+            return '<http://www.opengis.net/def/crs/EPSG/0/4283> ' + geometry.to_wkt_polygon(self.ordinates)
         else:
             return ''
 
     def _generate_sample_gmap_bbox(self):
         if self.ordinates is not None and len(self.ordinates) != 0:
-            s = []
-            for x, y in zip(*[iter(self.ordinates)] * 2):
-                s.append('{lat: ' + str(y) + ', lng: ' + str(x) + '}')
-            return ',\n                '.join(s)
+            simplify_tolerance = self.request.values.get('simplify', type=float)
+            return geometry.to_latlngs(geometry.simplify(self.ordinates, simplify_tolerance), '{lat: ', ', lng: ', '}', ',\n                ')
         else:
             return None
 
@@ -395,6 +455,8 @@ class SampleRenderer(Renderer):
                 gml = '<gml:Point srsDimension="2" srsName="https://epsg.io/{}">' \
                       '<gml:pos>{} {}</gml:pos>' \
                       '</gml:Point>'.format(self.srid, self.x, self.y)
+            elif self.ordinates is not None and len(self.ordinates) > 0:
+                gml = geometry.to_gml_polygon(self.ordinates, self.srid)
             else:
                 gml = ''
 
@@ -455,122 +517,6 @@ class SampleRenderer(Renderer):
     def _generate_google_maps_coords(self):
         return '{},{}'.format(self.y, self.x)
 
-    def __graph_preconstruct(self, g):
-        u = '''
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            DELETE {
-                ?a prov:generated ?e .
-            }
-            INSERT {
-                ?e prov:wasGeneratedBy ?a .
-            }
-            WHERE {
-                ?a prov:generated ?e .
-            }
-        '''
-        g.update(u)
-
-        # simplifying qualified relationships
-        u = '''
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            PREFIX foaf: <http://xmlns.com/foaf/0.1/>
-            INSERT {
-                ?e prov:wasAttributedTo ?a .
-                ?a rdfs:label ?n .
-            }
-            WHERE {
-                ?e prov:qualifiedAttribution/prov:agent ?a .
-                ?a foaf:name ?n .
-            }
-        '''
-        g.update(u)
-
-        # up classing all prov:Person & org:Org as prov:Agent
-        u = '''
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            PREFIX foaf: <http://xmlns.com/foaf/0.1/>
-            INSERT {
-                ?a a prov:Agent
-            }
-            WHERE {
-                {?a a foaf:Organization}
-                UNION
-                {?a a prov:Person}
-            }
-        '''
-        g.update(u)
-
-        return g
-
-    def __gen_visjs_nodes(self, g):
-        nodes = ''
-
-        q = '''
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            SELECT *
-            WHERE {
-                ?s a ?o .
-                {?s a prov:Entity .}
-                UNION
-                {?s a prov:Activity .}
-                UNION
-                {?s a prov:Agent .}
-                OPTIONAL {?s rdfs:label ?label .}
-            }
-            '''
-        for row in g.query(q):
-            if str(row['o']) == 'http://www.w3.org/ns/prov#Entity':
-                if row['label'] is not None:
-                    label = row['label']
-                else:
-                    label = 'Entity'
-                nodes += '\t\t\t\t{id: "%(node_id)s", label: "%(label)s", shape: "ellipse", color:{background:"#FFFC87", border:"#808080"}},\n' % {
-                    'node_id': row['s'],
-                    'label': label
-                }
-            elif str(row['o']) == 'http://www.w3.org/ns/prov#Activity':
-                if row['label'] is not None:
-                    label = row['label']
-                else:
-                    label = 'Activity'
-                nodes += '\t\t\t\t{id: "%(node_id)s", label: "%(label)s", shape: "box", color:{background:"#9FB1FC", border:"blue"}},\n' % {
-                    'node_id': row['s'],
-                    'label': label
-                }
-            elif str(row['o']) == 'http://www.w3.org/ns/prov#Agent':
-                if row['label'] is not None:
-                    label = row['label']
-                else:
-                    label = 'Agent'
-                nodes += '\t\t\t\t{id: "%(node_id)s", label: "%(label)s", image: "/static/img/ga/agent.png", shape: "image"},\n' % {
-                    'node_id': row['s'],
-                    'label': label
-                }
-
-        return nodes
-
-    def __gen_visjs_edges(self, g):
-        edges = ''
-
-        q = '''
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            SELECT *
-            WHERE {
-                ?s ?p ?o .
-                ?s prov:wasAttributedTo|prov:wasGeneratedBy|prov:used|prov:wasDerivedFrom|prov:wasInformedBy ?o .
-            }
-            '''
-        for row in g.query(q):
-            edges += '\t\t\t\t{from: "%(from)s", to: "%(to)s", arrows:"to", font: {align: "bottom"}, color:{color:"black"}, label: "%(relationship)s"},\n' % {
-                'from': row['s'],
-                'to': row['o'],
-                'relationship': str(row['p']).split('#')[1]
-            }
-
-        return edges
-
     def _make_citation(self):
         return '{} {}"Sample {}". A digital catalogue record of ' \
                'a physical sample managed by {}. Accessed {}. <a href="{}">igsn:{}</a>' \
@@ -585,35 +531,6 @@ class SampleRenderer(Renderer):
             self.igsn
         )
 
-    def _make_vsjs(self, g):
-        g = self.__graph_preconstruct(g)
-
-        nodes = 'var nodes = new vis.DataSet([\n'
-        nodes += self.__gen_visjs_nodes(g)
-        nodes = nodes.rstrip().rstrip(',') + '\n\t\t\t]);\n'
-
-        edges = 'var edges = new vis.DataSet([\n'
-        edges += self.__gen_visjs_edges(g)
-        edges = edges.rstrip().rstrip(',') + '\n\t\t\t]);\n'
-
-        visjs = '''
-        %(nodes)s
-
-        %(edges)s
-
-        var container = document.getElementById('network');
-
-        var data = {
-            nodes: nodes,
-            edges: edges,
-        };
-
-        var options = {};
-        var network = new vis.Network(container, data, options);
-        ''' % {'nodes': nodes, 'edges': edges}
-
-        return visjs
-
     def export_rdf(self, model_view='igsn-o', rdf_mime='text/turtle'):
         """
         Exports this instance in RDF, according to a given model from the list of supported models,
@@ -625,9 +542,16 @@ class SampleRenderer(Renderer):
             'trix', 'turtle', 'xml'], from http://rdflib3.readthedocs.io/en/latest/plugin_serializers.html
         :return: RDF string
         """
+        return rdf_writer.serialize(self._make_rdf(model_view), self._get_rdf_mimetype(rdf_mime))
 
-        # things that are applicable to all model views; the graph and some namespaces
-        g = Graph()
+    def _make_rdf(self, model_view):
+        """
+        :param model_view: string of one of the model view names available for Sample objects
+        :return: a TripleList of this instance in the model view
+        """
+
+        # things that are applicable to all model views; the triples, with the view's namespaces & constant triples
+        g = rdf_writer.TripleList(self.STATIC_RDF.get(model_view, rdf_writer.NO_STATIC_SUBGRAPH))
 
         # URI for this sample
         this_sample = URIRef(config.URI_SAMPLE_INSTANCE_BASE + self.igsn)
@@ -637,25 +561,7 @@ class SampleRenderer(Renderer):
         ga = URIRef(self.URI_GA)
 
         # pingback endpoint
-        PROV = Namespace('http://www.w3.org/ns/prov#')
-        g.bind('prov', PROV)
         g.add((this_sample, PROV.pingback, URIRef(config.URI_SAMPLE_INSTANCE_BASE + self.igsn + '/pingback')))
-        SKOS = Namespace('http://www.w3.org/2004/02/skos/core#')
-        g.bind('skos', SKOS)
-        ADMS = Namespace('http://www.w3.org/ns/adms#')
-        g.bind('adms', ADMS)
-        DCT = Namespace('http://purl.org/dc/terms/')
-        g.bind('dct', DCT)
-        SAMFL = Namespace('http://def.seegrid.csiro.au/ontology/om/sam-lite#')
-        g.bind('samfl', SAMFL)
-        GEOSP = Namespace('http://www.opengis.net/ont/geosparql#')
-        g.bind('geosp', GEOSP)
-        AUROLE = Namespace('http://communications.data.gov.au/def/role/')
-        g.bind('aurole', AUROLE)
-        FOAF = Namespace('http://xmlns.com/foaf/0.1/')
-        g.bind('foaf', FOAF)
-        ORG = Namespace('http://www.w3.org/ns/org#')
-        g.bind('org', ORG)
 
         # sample location in GML & WKT, formulation from GeoSPARQL
         wkt = Literal(self._generate_sample_wkt(), datatype=GEOSP.wktLiteral)
@@ -664,10 +570,6 @@ class SampleRenderer(Renderer):
         # select model view
         if model_view == 'igsn-o':
             # default model is the IGSN model
-            # IGSN model required namespaces
-            IGSN = Namespace('http://pid.geoscience.gov.au/def/ont/igsn#')
-            g.bind('igsn', IGSN)
-
             # classing the sample
             g.add((this_sample, RDF.type, SAMFL.Specimen))
 
@@ -778,8 +680,6 @@ class SampleRenderer(Renderer):
             if self.material_type is not None:
                 g.add((this_sample, URIRef('http://purl.org/dc/terms/format'), URIRef(self.material_type)))
             g.add((this_sample, DCT.identifier, Literal(self.igsn, datatype=XSD.string)))
-            # define GA as a dct:Agent
-            g.add((ga, RDF.type, DCT.Agent))
             g.add((this_sample, DCT.publisher, ga))
             # g.add((this_sample, DCT.relation, ga)) -- no value yet in GA DB
             # g.add((this_sample, DCT.subject, ga)) -- how is this different to type?
@@ -810,8 +710,6 @@ class SampleRenderer(Renderer):
                 g.add((qualified_attribution2, PROV.hadRole, AUROLE.principalInvestigator))
                 g.add((this_sample, PROV.qualifiedAttribution, qualified_attribution2))
         elif model_view == 'sosa':
-            SOSA = Namespace('http://www.w3.org/ns/sosa/')
-            g.bind('sosa', SOSA)
             # Sample
             g.add((this_sample, RDF.type, SOSA.Sample))
 
@@ -845,9 +743,6 @@ class SampleRenderer(Renderer):
             # # associate Procedure
             # g.add((this_sample, SOSA.usedProcedure, procedure))
 
-            SAMP = Namespace('http://www.w3.org/ns/sosa/sampling/')
-            g.bind('sampling', SAMP)
-
             # SampleRelationship to Site
             if self.entity_uri is not None:
                 site = URIRef(self.entity_uri)
@@ -891,13 +786,8 @@ class SampleRenderer(Renderer):
             #
             #   Feature of Interest
             #
-            # domain feature, same for all Samples
-            domain_feature = URIRef(
-                'http://registry.it.csiro.au/sandbox/csiro/oznome/feature/earth-realm/lithosphere')
-            g.add((domain_feature, RDF.type, SOSA.FeatureOfInterest))
-            g.add((domain_feature, SKOS.exactMatch,
-                   URIRef('http://sweet.jpl.nasa.gov/2.3/realmGeol.owl#Lithosphere')))
-            g.add((this_sample, SOSA.isSampleOf, domain_feature))  # associate
+            # the domain feature, the same for all Samples, is in the static subgraph
+            g.add((this_sample, SOSA.isSampleOf, LITHOSPHERE))  # associate
 
             g.add((this_sample, RDF.type, PROV.Entity))
 
@@ -923,7 +813,7 @@ class SampleRenderer(Renderer):
                 g.add((qualified_attribution2, PROV.hadRole, AUROLE.principalInvestigator))
                 g.add((this_sample, PROV.qualifiedAttribution, qualified_attribution2))
 
-        return g.serialize(format=self._get_rdf_mimetype(rdf_mime))
+        return g
 
     def _get_rdf_mimetype(self, rdf_mime):
         return self.RDF_SERIALIZER_MAP[rdf_mime]
@@ -1081,13 +971,16 @@ class SampleRenderer(Renderer):
             )
         elif model_view == 'prov':
             view_title = 'PROV Ontology view'
-            prov_turtle = self.export_rdf('prov', 'text/turtle')
-            g = Graph().parse(data=prov_turtle, format='turtle')
+            prov_triples = self._make_rdf('prov')
 
             sample_table_html = render_template(
                 'class_sample_prov.html',
-                visjs=self._make_vsjs(g),
-                prov_turtle=prov_turtle.decode('utf-8'),
+                visjs=prov_vis.make_visjs(
+                    prov_triples,
+                    static_url('img/ga/agent.png'),
+                    ('sample', self.igsn, self.version) if self.version is not None else None
+                ),
+                prov_turtle=rdf_writer.write_turtle(prov_triples),
             )
         else:  # elif model_view == 'dct':
             view_title = 'Dublin Core view'
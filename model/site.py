@@ -3,22 +3,39 @@ import requests
 from flask import Response, render_template
 from lxml import etree
 from lxml import objectify
-from rdflib import Graph, URIRef, RDF, RDFS, XSD, OWL, Namespace, Literal, BNode
+from rdflib import URIRef, RDF, RDFS, XSD, OWL, Namespace, Literal, BNode
 import _config as config
+from model import store, geometry, rdf_writer, output_cache
 from datetime import datetime
 import json
 json.encoder.FLOAT_REPR = lambda f: ("%.2f" % f)
 
+SITE_SAMPLES_PER_PAGE = 100
+SITE_SAMPLES_PER_PAGE_MAX = 1000
+
+GEO = Namespace('http://www.opengis.net/ont/geosparql#')
+SAMFL = Namespace('http://def.seegrid.csiro.au/ontology/om/sam-lite#')
+LDP = Namespace('http://www.w3.org/ns/ldp#')
+XHV = Namespace('https://www.w3.org/1999/xhtml/vocab#')
+
+# the namespaces of the pdm view; it has no constant triples
+STATIC_RDF = rdf_writer.StaticSubgraph([('geo', GEO), ('samfl', SAMFL), ('ldp', LDP), ('xhv', XHV)])
+
 
 class SiteRenderer(Renderer):
     URI_GA = 'http://pid.geoscience.gov.au/org/ga/geoscienceausralia'
 
+    # views made without the record, which isn't fetched for them
+    RECORDLESS_VIEWS = ['alternates']
+    # the query string arguments, other than _view & _format, that change a response, so are in its output cache key
+    OUTPUT_ARGS = ['simplify', 'page', 'per_page']
+
     def __init__(self, request, xml=None):
         views = {
             "pdm": View(
                 "GA's Public Data Model View",
                 "Geoscience Australia's Public Data Model ontology",
-                ["text/html", "text/turtle", "application/rdf+xml", "application/rdf+json"],
+                ["text/html", "text/turtle", "application/n-triples", "application/rdf+xml", "application/rdf+json"],
                 'text/html',
                 namespace='http://pid.geoscience.gov.au/def/ont/ga/pdm'
             ),
@@ -45,10 +62,20 @@ class SiteRenderer(Renderer):
         self.centroid_y = None
         self.coords = None
         self.not_found = False
+        self.version = None
+        # the tolerance, in degrees, to which polygons are simplified for maps & GeoJSON, or None for a default
+        self.simplify_tolerance = request.values.get('simplify', type=float)
+
+        # the page of the Samples taken at this Site to show
+        self.samples_page = max(request.args.get('page', type=int, default=1), 1)
+        self.samples_per_page = min(
+            max(request.args.get('per_page', type=int, default=SITE_SAMPLES_PER_PAGE), 1),
+            SITE_SAMPLES_PER_PAGE_MAX
+        )
 
         if xml is not None:  # even if there are values for Oracle API URI and IGSN, load from XML file if present
             self._populate_from_xml_file(xml)
-        else:
+        elif self.view not in self.RECORDLESS_VIEWS:
             self._populate_from_oracle_api()
 
     def validate_xml(self, xml):
@@ -68,6 +95,28 @@ class SiteRenderer(Renderer):
         else:
             return TERM_LOOKUP[vocab_type].get('unknown')
 
+    def _get_samples(self):
+        """
+        Gets the page of the Samples taken at this Site, from the local store's ENO index
+
+        :return: (list of the IGSNs of this page of Samples, total number of Samples taken at this Site)
+        """
+        try:
+            eno = int(self.site_no)
+            return (
+                store.get_site_samples(eno, self.samples_page, self.samples_per_page),
+                store.count_site_samples(eno)
+            )
+        except Exception as e:
+            print(e)
+            return [], 0
+
+    def _samples_page_uri(self, page):
+        return '{}?page={}&per_page={}'.format(self.uri, page, self.samples_per_page)
+
+    def _samples_last_page(self, samples_count):
+        return max((samples_count + self.samples_per_page - 1) // self.samples_per_page, 1)
+
     def _make_vocab_alink(self, vocab_uri):
         if vocab_uri is not None:
             if vocab_uri.endswith('/'):
@@ -90,14 +139,7 @@ class SiteRenderer(Renderer):
             }
             wkt = 'SRID={srid};POINT({x} {y})'.format(**coordinates)
         elif self.geometry_type == 'Polygon':
-            start = 'SRID={srid};POLYGON(('.format(srid='GDA94')
-            coordinates = ''
-            for coord in zip(self.lons, self.lats):
-                coordinates += '{} {},'.format(coord[0], coord[1])
-
-            coordinates = coordinates[:-1]  # drop the final ','
-            end = '))'
-            wkt = '{start}{coordinates}{end}'.format(start=start, coordinates=coordinates, end=end)
+            wkt = 'SRID={srid};{polygon}'.format(srid='GDA94', polygon=geometry.to_wkt_polygon(self.coords))
         else:
             wkt = ''
 
@@ -118,11 +160,9 @@ class SiteRenderer(Renderer):
             });
             ''' % self.site_no
         elif self.geometry_type == 'Polygon':
-            coords = []
-            for coord in zip(self.lons, self.lats):
-                coords.append('\t\t\t\tnew google.maps.LatLng(%06.8f, %06.8f)' % (coord[1], coord[0]))
-            # add the last first coordinate pair to end for complete polygon
-            coords.append('\t\t\t\tnew google.maps.LatLng(%06.8f, %06.8f)' % (self.lats[0], self.lons[0]))
+            # the ring is closed, i.e. its first coordinate pair is repeated at its end, for a complete polygon
+            coords = geometry.to_latlngs(
+                geometry.close_ring(geometry.simplify(self.coords, self.simplify_tolerance)), '\t\t\t\tnew google.maps.LatLng(', ', ', ')', ',\n')
             js = '''
             var map = new google.maps.Map(document.getElementById("map"), {
                 zoom: 4,
@@ -150,7 +190,7 @@ class SiteRenderer(Renderer):
                 bounds.extend(point);
             }            
             map.fitBounds(bounds);                           
-            ''' % ',\n'.join(coords)
+            ''' % coords
         else:
             js = ''
 
@@ -215,17 +255,13 @@ class SiteRenderer(Renderer):
 
                 if hasattr(root.ROW.GEOM, 'SDO_ORDINATES'):
                     self.geometry_type = 'Polygon'
-                    self.lons = []
-                    self.lats = []
-                    self.coords = []
-                    # iterate all children, splitting into lons & lats & ignoring elevs
-                    for i, val in enumerate(root.ROW.GEOM.SDO_ORDINATES.getchildren()):
-                        if i % 3 == 0:
-                            self.lons.append(val)
-                        elif (i - 1) % 3 == 0:
-                            self.lats.append(val)
-                    self.centroid_x = sum(self.lons) / len(self.lons)
-                    self.centroid_y = sum(self.lats) / len(self.lats)
+                    # (lon, lat, elevation) triples, keeping lons & lats
+                    self.coords = geometry.parse_ordinates(root.ROW.GEOM.SDO_ORDINATES, 3)
+                    self.lons = self.coords[:, 0]
+                    self.lats = self.coords[:, 1]
+                    centroid_x, centroid_y = geometry.centroid(self.coords)
+                    self.centroid_x = float(centroid_x)
+                    self.centroid_y = float(centroid_y)
             if hasattr(root.ROW, 'ACCESS_CODE'):
                 self.access_code = root.ROW.ACCESS_CODE
             if hasattr(root.ROW, 'ENTRYDATE'):
@@ -236,15 +272,22 @@ class SiteRenderer(Renderer):
         except Exception as e:
             print(e)
 
+        self.version = output_cache.record_version(xml)
         return True
 
     def render(self):
+        if self.view == 'alternates':
+            return self._render_alternates_view()
+        # the HTML view lists the Samples taken at the Site, which change with each sync of the Sample register
+        return output_cache.render(
+            self, 'site', self.site_no, (self.version, store.get_completed_generation('sample')), self._render
+        )
+
+    def _render(self):
         if self.not_found:
             return Response('Sample {} not found.'.format(self.site_no), status=404, mimetype='text/plain')
 
-        if self.view == 'alternates':
-            return self._render_alternates_view()
-        elif self.view == 'pdm':
+        if self.view == 'pdm':
             if self.format == 'text/html':
                 return self.export_html(model_view=self.view)
             else:
@@ -258,7 +301,7 @@ class SiteRenderer(Renderer):
                 self.alternates_template or 'alternates.html',
                 instance_uri=self.uri,
                 register_name='Site Register',
-                class_uri=self.site_type,
+                class_uri=config.URI_SITE_CLASS,
                 default_view_token=self.default_view_token,
                 views=self.views
             ),
@@ -274,15 +317,7 @@ class SiteRenderer(Renderer):
                 ]
             }
         else:  # elif self.geometry_type == 'Polygon':
-            coords = []
-            for coord in zip(self.lons, self.lats):
-                coords.append([float(coord[0]), float(coord[1])])
-            g = {
-                'type': 'Polygon',
-                'coordinates': [
-                    coords
-                ]
-            }
+            g = geometry.to_geojson_polygon(geometry.simplify(self.coords, self.simplify_tolerance))
 
         return g
 
@@ -360,10 +395,8 @@ class SiteRenderer(Renderer):
 
         <http://vocabulary.odm2.org/samplingfeaturetype/borehole> rdfs:subClassOf sosa:Sample .
         '''
-        # things that are applicable to all model views; the graph and some namespaces
-        g = Graph()
-        GEO = Namespace('http://www.opengis.net/ont/geosparql#')
-        g.bind('geo', GEO)
+        # things that are applicable to all model views; the triples, with the view's namespaces
+        g = rdf_writer.TripleList(STATIC_RDF)
 
         # URI for this site
         this_site = URIRef(config.URI_SITE_INSTANCE_BASE + self.site_no)
@@ -376,7 +409,23 @@ class SiteRenderer(Renderer):
         g.add((site_geometry, RDF.type, GEO.Geometry))
         g.add((site_geometry, GEO.asWKT, Literal(self._generate_wkt(), datatype=GEO.wktLiteral)))
 
-        return g.serialize(format=self._get_rdf_mimetype(rdf_mime))
+        # this page of the Samples taken at this Site
+        samples, samples_count = self._get_samples()
+        for igsn in samples:
+            g.add((URIRef(config.URI_SAMPLE_INSTANCE_BASE + igsn), SAMFL.relatedSamplingFeature, this_site))
+        if samples_count > self.samples_per_page:
+            last_page = self._samples_last_page(samples_count)
+            page_uri = URIRef(self._samples_page_uri(self.samples_page))
+            g.add((page_uri, RDF.type, LDP.Page))
+            g.add((page_uri, LDP.pageOf, this_site))
+            g.add((page_uri, XHV.first, URIRef(self._samples_page_uri(1))))
+            g.add((page_uri, XHV.last, URIRef(self._samples_page_uri(last_page))))
+            if self.samples_page > 1:
+                g.add((page_uri, XHV.prev, URIRef(self._samples_page_uri(self.samples_page - 1))))
+            if self.samples_page < last_page:
+                g.add((page_uri, XHV.next, URIRef(self._samples_page_uri(self.samples_page + 1))))
+
+        return rdf_writer.serialize(g, self._get_rdf_mimetype(rdf_mime))
 
     def _get_rdf_mimetype(self, rdf_mime):
         return self.RDF_SERIALIZER_MAP[rdf_mime]
@@ -391,8 +440,18 @@ class SiteRenderer(Renderer):
         """
         if model_view == 'pdm':
             view_title = 'PDM Ontology view'
+            samples, samples_count = self._get_samples()
+            last_page = self._samples_last_page(samples_count)
             sample_table_html = render_template(
                 'class_site_pdm.html',
+                samples=[(config.URI_SAMPLE_INSTANCE_BASE + igsn, igsn) for igsn in samples],
+                samples_count=samples_count,
+                samples_page=self.samples_page,
+                samples_last_page=last_page,
+                samples_prev_uri='?page={}&per_page={}'.format(self.samples_page - 1, self.samples_per_page)
+                if self.samples_page > 1 else None,
+                samples_next_uri='?page={}&per_page={}'.format(self.samples_page + 1, self.samples_per_page)
+                if self.samples_page < last_page else None,
                 site_no=self.site_no,
                 description=self.description,
                 wkt=self._generate_wkt(),
@@ -400,16 +459,6 @@ class SiteRenderer(Renderer):
                 site_type_alink=self._make_vocab_alink(self.site_type),
                 entry_date=self.entry_date
             )
-        elif model_view == 'prov':
-            view_title = 'PROV Ontology view'
-            prov_turtle = self.export_rdf('prov', 'text/turtle')
-            g = Graph().parse(data=prov_turtle, format='turtle')
-
-            sample_table_html = render_template(
-                'class_site_prov.html',
-                visjs=self._make_vsjs(g),
-                prov_turtle=prov_turtle,
-            )
         else:  # elif model_view == 'dc':
             view_title = 'Dublin Core view'
 
@@ -0,0 +1,285 @@
+"""
+Spatial indexes of the local store: an R-tree over the bounding boxes of Site geometries and of Surveys, for answering
+"what is in this map window?", and a k-d tree over Sample locations, for "which Samples are near here?", without
+fetching every item from the Oracle XML API.
+"""
+import heapq
+import math
+import numpy as np
+import _config as config
+from model import store
+from model.store_index import StoreIndex
+
+
+SPATIAL_REFRESH_SECONDS = getattr(config, 'SPATIAL_REFRESH_SECONDS', 60)
+RTREE_NODE_CAPACITY = 16
+EARTH_RADIUS_KM = 6371.0088
+# rebuild the Sample k-d tree, rather than searching changes to it linearly, once this fraction of Samples has changed
+KDTREE_REBUILD_FRACTION = 0.05
+
+
+def _union(entries):
+    return (
+        min(e[0][0] for e in entries),
+        min(e[0][1] for e in entries),
+        max(e[0][2] for e in entries),
+        max(e[0][3] for e in entries)
+    )
+
+
+def _intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _pack(entries, capacity):
+    """
+    Packs one level of an R-tree by Sort-Tile-Recursive: the entries are sorted into vertical slices by the x of their
+    centres, then each slice into nodes by y, so that nodes are nearly full and overlap little.
+
+    :param entries: list of (bbox, child) tuples
+    :return: list of (bbox, list of entries) nodes
+    """
+    n_slices = int(math.ceil(math.sqrt(math.ceil(len(entries) / capacity))))
+    slice_size = n_slices * capacity
+    by_x = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+    nodes = []
+    for s in range(0, len(by_x), slice_size):
+        by_y = sorted(by_x[s:s + slice_size], key=lambda e: e[0][1] + e[0][3])
+        for n in range(0, len(by_y), capacity):
+            children = by_y[n:n + capacity]
+            nodes.append((_union(children), children))
+    return nodes
+
+
+class RTree:
+    """
+    A static R-tree packed by Sort-Tile-Recursive. It can't be added to; a changed set of items needs a new tree.
+    """
+    def __init__(self, items, capacity=RTREE_NODE_CAPACITY):
+        """
+        :param items: list of (min_x, min_y, max_x, max_y, item) tuples
+        :param capacity: the most children of a node
+        """
+        self.size = len(items)
+        self.height = 0
+        self.root = None
+        if self.size == 0:
+            return
+
+        level = [((min_x, min_y, max_x, max_y), item) for min_x, min_y, max_x, max_y, item in items]
+        while True:
+            level = _pack(level, capacity)
+            self.height += 1
+            if len(level) == 1:
+                break
+        self.root = level[0]
+
+    def search(self, bbox):
+        """
+        :param bbox: (min_x, min_y, max_x, max_y)
+        :return: list of the items whose bounding boxes intersect bbox, in no particular order
+        """
+        if self.root is None:
+            return []
+        found = []
+        stack = [(self.root, 1)]
+        while len(stack) > 0:
+            (node_bbox, children), depth = stack.pop()
+            if not _intersects(node_bbox, bbox):
+                continue
+            if depth == self.height:
+                found.extend(item for item_bbox, item in children if _intersects(item_bbox, bbox))
+            else:
+                stack.extend((child, depth + 1) for child in children)
+        return found
+
+
+class SpatialIndex(StoreIndex):
+    """
+    An R-tree of each of the Site & Survey registers
+    """
+    def __init__(self, refresh_seconds=SPATIAL_REFRESH_SECONDS):
+        super(SpatialIndex, self).__init__(['site', 'survey'], refresh_seconds)
+        self.trees = {register: RTree([]) for register in self.registers}
+
+    def update(self, register):
+        self.trees[register] = RTree([
+            (min_x, min_y, max_x, max_y, item_id)
+            for item_id, min_x, min_y, max_x, max_y in store.get_bboxes(register)
+        ])
+
+    def intersecting(self, register, bbox):
+        """
+        :param register: 'site' or 'survey'
+        :param bbox: (min_x, min_y, max_x, max_y) in longitude & latitude
+        :return: list of the identifiers, as strings, of the items intersecting bbox, in identifier order
+        """
+        self.ensure_built()
+        return [str(item_id) for item_id in sorted(self.trees[register].search(bbox))]
+
+
+def _unit_vector(lon, lat):
+    """
+    Points on the sphere as 3-d unit vectors, between which straight-line (chord) distance orders the same as
+    great-circle distance, so a k-d tree can find nearest neighbours without wrapping at the antimeridian or poles
+    """
+    lon = math.radians(lon)
+    lat = math.radians(lat)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def _unit_vectors(lons, lats):
+    """
+    As _unit_vector(), for arrays of points
+
+    :return: (n, 3) float array
+    """
+    lons = np.radians(np.asarray(lons, dtype=float))
+    lats = np.radians(np.asarray(lats, dtype=float))
+    return np.column_stack((np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)))
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+class KDTree:
+    """
+    A static, balanced 3-d tree held in arrays: the node for the range [lo, hi) is the point at its middle, which
+    splits on axis depth % 3, with its left subtree in [lo, mid) and its right in [mid + 1, hi).
+    """
+    def __init__(self, coords, items):
+        """
+        The tree is built a level at a time: each level's ranges are padded to the same width, as rows of an array, and
+        all partitioned about their middles at once by NumPy, so building it costs a few array operations per level
+        rather than a sort per node.
+
+        :param coords: (n, 3) float array of points
+        :param items: list of the n items at the points
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+        order = np.arange(len(coords))
+        starts = np.array([0])
+        sizes = np.array([len(coords)])
+        depth = 0
+        while len(sizes) > 0 and sizes.max() > 1:
+            columns = np.arange(sizes.max())
+            valid = columns < sizes[:, None]
+            positions = np.where(valid, starts[:, None] + columns, 0)
+            # padding sorts after every point, so partitioning each row at its last point keeps it out of the range
+            values = np.where(valid, coords[order[positions], depth % 3], np.inf)
+            mids = sizes // 2
+            partitioned = np.argpartition(values, np.unique(np.concatenate((mids, sizes - 1))), axis=1)
+            order[positions[valid]] = order[np.take_along_axis(positions, partitioned, axis=1)][valid]
+
+            starts = np.concatenate((starts, starts + mids + 1))
+            sizes = np.concatenate((mids, sizes - mids - 1))
+            # ranges of one point need no partitioning
+            starts, sizes = starts[sizes > 1], sizes[sizes > 1]
+            depth += 1
+
+        # searching visits one point at a time, which is faster from lists than from arrays
+        self.coords = coords[order].tolist()
+        self.items = [items[i] for i in order.tolist()]
+
+    def nearest(self, point, k, max_distance):
+        """
+        :param point: (x, y, z)
+        :param k: the most points to find
+        :param max_distance: the furthest, straight-line, a point may be
+        :return: list of (distance, item) tuples of the nearest points, nearest first
+        """
+        coords = self.coords
+        bound = max_distance ** 2
+        found = []  # max-heap, by negated squared distance, of the k nearest so far
+        stack = [(0, len(coords), 0, 0.0)]
+        while len(stack) > 0:
+            lo, hi, depth, min_d2 = stack.pop()
+            if lo >= hi or min_d2 > bound:
+                continue
+            mid = (lo + hi) // 2
+            c = coords[mid]
+            d2 = (point[0] - c[0]) ** 2 + (point[1] - c[1]) ** 2 + (point[2] - c[2]) ** 2
+            if d2 <= bound:
+                heapq.heappush(found, (-d2, mid))
+                if len(found) > k:
+                    heapq.heappop(found)
+                if len(found) == k:
+                    bound = -found[0][0]
+
+            diff = point[depth % 3] - c[depth % 3]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            # the far side can only hold points at least diff away; it's popped, and so pruned, after the near side
+            stack.append((far[0], far[1], depth + 1, diff ** 2))
+            stack.append((near[0], near[1], depth + 1, 0.0))
+
+        return [(math.sqrt(-d2), self.items[i]) for d2, i in sorted(found, reverse=True)]
+
+
+class SampleIndex(StoreIndex):
+    """
+    A k-d tree of Sample locations. Samples added, moved or removed by later syncs are searched linearly alongside the
+    tree until there are enough of them to make rebuilding the tree worthwhile.
+    """
+    def __init__(self, refresh_seconds=SPATIAL_REFRESH_SECONDS):
+        super(SampleIndex, self).__init__(['sample'], refresh_seconds)
+        # (tree, {igsn: (x, y)} the tree was built from, [(vector, igsn)] added since, {igsn} removed since)
+        self.state = (KDTree([], []), {}, [], set())
+
+    def update(self, register):
+        current = {igsn: (x, y) for igsn, x, y in store.get_sample_points()}
+        tree, built, added, removed = self.state
+
+        added = [(_unit_vector(*xy), igsn) for igsn, xy in current.items() if built.get(igsn) != xy]
+        removed = {igsn for igsn, xy in built.items() if current.get(igsn) != xy}
+
+        if len(built) == 0 or len(added) + len(removed) > len(built) * KDTREE_REBUILD_FRACTION:
+            igsns = list(current)
+            xys = np.array([current[igsn] for igsn in igsns], dtype=float).reshape(-1, 2)
+            self.state = (KDTree(_unit_vectors(xys[:, 0], xys[:, 1]), igsns), current, [], set())
+        else:
+            self.state = (tree, built, added, removed)
+
+    def nearest(self, lon, lat, radius_km, k):
+        """
+        :param lon: longitude of the point to search around
+        :param lat: latitude of the point to search around
+        :param radius_km: the furthest a Sample may be from the point, in km
+        :param k: the most Samples to find
+        :return: list of (distance in km, igsn) tuples of the nearest Samples, nearest first
+        """
+        self.ensure_built()
+        tree, built, added, removed = self.state
+        point = _unit_vector(lon, lat)
+        max_chord = _km_to_chord(radius_km)
+
+        found = [(d, igsn) for d, igsn in tree.nearest(point, k + len(removed), max_chord) if igsn not in removed]
+        for vector, igsn in added:
+            d = math.sqrt(sum((a - b) ** 2 for a, b in zip(point, vector)))
+            if d <= max_chord:
+                found.append((d, igsn))
+
+        return [(_chord_to_km(d), igsn) for d, igsn in sorted(found)[:k]]
+
+
+def parse_bbox(value):
+    """
+    :param value: a bbox query string argument, min_lon,min_lat,max_lon,max_lat
+    :return: (min_x, min_y, max_x, max_y)
+    :raises ValueError: if the value is not a valid bbox
+    """
+    try:
+        bbox = tuple(float(v) for v in value.split(','))
+    except ValueError:
+        bbox = ()
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    return bbox
+
+
+spatial_index = SpatialIndex()
+sample_index = SampleIndex()
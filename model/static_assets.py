@@ -0,0 +1,121 @@
+"""
+Fingerprinted static assets. The build, run whenever view/static changes, before the app is (re)started:
+
+    python -m controller.assets
+
+copies each asset under STATIC_DIR to STATIC_BUILD_DIR with a hash of its content in its name, e.g.
+js/vis.0123456789ab.js, writes precompressed copies of the text assets beside it (.gz and, if the brotli package is
+installed, .br) and lists them all in a manifest. static_url() gives templates the fingerprinted URL of an asset, which
+browsers can cache for good because a changed asset gets a new name, or its plain /static URL if there's no build.
+Earlier builds' files are left in place for pages, e.g. in the output cache, that still link to them.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from flask import url_for
+import _config as config
+from model import compression
+
+
+STATIC_BUILD_DIR = getattr(
+    config,
+    'STATIC_BUILD_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'static_build')
+)
+MANIFEST = 'manifest.json'
+FINGERPRINT_LENGTH = 12
+# a year, the longest max-age HTTP caches are expected to honour
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+# the extensions of the precompressed copies of an asset, by encoding
+ENCODED_EXTENSIONS = {'gzip': '.gz', 'br': '.br'}
+# the assets worth precompressing; images are already compressed
+PRECOMPRESSED_EXTENSIONS = {'.js', '.css', '.svg', '.ico', '.json', '.txt'}
+
+
+def _fingerprinted(name, data):
+    root, extension = os.path.splitext(name)
+    return '{}.{}{}'.format(root, hashlib.sha1(data).hexdigest()[:FINGERPRINT_LENGTH], extension)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    # readable by a web server serving the build directory itself
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def precompressed(name):
+    return os.path.splitext(name)[1].lower() in PRECOMPRESSED_EXTENSIONS
+
+
+def build(source_dir=config.STATIC_DIR, build_dir=STATIC_BUILD_DIR):
+    """
+    Builds the fingerprinted & precompressed assets and their manifest
+
+    :param source_dir: the directory of the assets
+    :param build_dir: the directory to build them in
+    :return: the manifest, dict of asset name: fingerprinted name, e.g. js/vis.js: js/vis.0123456789ab.js
+    """
+    manifest = {}
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        for file_name in file_names:
+            source = os.path.join(dir_path, file_name)
+            name = os.path.relpath(source, source_dir).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            manifest[name] = _fingerprinted(name, data)
+
+            target = os.path.join(build_dir, *manifest[name].split('/'))
+            _write(target, data)
+            if precompressed(name):
+                for encoding in compression.ENCODINGS:
+                    encoded = compression.compress(data, encoding, cached=True)
+                    if len(encoded) < len(data):
+                        _write(target + ENCODED_EXTENSIONS[encoding], encoded)
+
+    _write(os.path.join(build_dir, MANIFEST), json.dumps(manifest, indent=4, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(build_dir=STATIC_BUILD_DIR):
+    """
+    :return: the manifest of the last build, or an empty one if there hasn't been one
+    """
+    try:
+        with open(os.path.join(build_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+manifest = load_manifest()
+
+
+def static_url(filename):
+    """
+    For templates, in place of url_for('static', filename=...)
+
+    :param filename: the asset's name under STATIC_DIR, e.g. js/vis.js
+    :return: the URL of the fingerprinted asset, if it's been built, otherwise of the asset itself
+    """
+    built = manifest.get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', filename=built)
+
+
+def encoded_file(filename, encoding):
+    """
+    :param filename: a fingerprinted asset's name under STATIC_BUILD_DIR
+    :param encoding: the encoding the request accepts, or None
+    :return: the name of the asset's precompressed copy in that encoding, or None if there isn't one
+    """
+    if encoding is None or not precompressed(filename):
+        return None
+    encoded = filename + ENCODED_EXTENSIONS[encoding]
+    return encoded if os.path.isfile(os.path.join(STATIC_BUILD_DIR, *encoded.split('/'))) else None
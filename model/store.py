@@ -0,0 +1,410 @@
+"""
+A local SQLite store of the identifiers held in GA's Oracle XML API. It is filled by controller/sync.py and lets the
+API answer questions, such as which Samples have been withdrawn or what comes after a given Site, that the Oracle XML
+API cannot.
+"""
+import os
+import sqlite3
+import threading
+import _config as config
+
+
+STORE_DB = getattr(
+    config,
+    'STORE_DB',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'store.db')
+)
+
+# each script is run once, in order, on a store whose user_version is below its position in this list
+MIGRATIONS = [
+    '''
+    CREATE TABLE IF NOT EXISTS samples (
+        igsn TEXT PRIMARY KEY,
+        modified TEXT,
+        generation INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tombstones (
+        igsn TEXT PRIMARY KEY,
+        deleted TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS tombstones_deleted ON tombstones (deleted);
+    CREATE TABLE IF NOT EXISTS sync_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    );
+    ''',
+    '''
+    CREATE TABLE sites (
+        eno INTEGER PRIMARY KEY,
+        generation INTEGER NOT NULL
+    );
+    CREATE TABLE surveys (
+        surveyid TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL
+    );
+    ''',
+    '''
+    ALTER TABLE surveys ADD COLUMN name TEXT;
+    ''',
+    '''
+    ALTER TABLE sites ADD COLUMN min_x REAL;
+    ALTER TABLE sites ADD COLUMN min_y REAL;
+    ALTER TABLE sites ADD COLUMN max_x REAL;
+    ALTER TABLE sites ADD COLUMN max_y REAL;
+    ALTER TABLE surveys ADD COLUMN min_x REAL;
+    ALTER TABLE surveys ADD COLUMN min_y REAL;
+    ALTER TABLE surveys ADD COLUMN max_x REAL;
+    ALTER TABLE surveys ADD COLUMN max_y REAL;
+    ''',
+    '''
+    ALTER TABLE samples ADD COLUMN x REAL;
+    ALTER TABLE samples ADD COLUMN y REAL;
+    ''',
+    '''
+    ALTER TABLE samples ADD COLUMN eno INTEGER;
+    CREATE INDEX samples_eno ON samples (eno, igsn);
+    ''',
+    '''
+    ALTER TABLE sites ADD COLUMN polygon TEXT;
+    ''',
+    '''
+    CREATE TABLE changes (
+        register TEXT NOT NULL,
+        generation INTEGER NOT NULL,
+        id TEXT NOT NULL,
+        removed INTEGER NOT NULL
+    );
+    CREATE INDEX changes_generation ON changes (register, generation);
+    ''',
+]
+
+# the changes of this many of a register's last syncs are kept, for indexes to bring themselves up to date with
+CHANGES_KEPT_GENERATIONS = 10
+# the most variables in an SQLite statement, by default, before SQLite 3.32
+SQLITE_MAX_VARIABLES = 999
+
+# register: (table, identifier column)
+REGISTERS = {
+    'sample': ('samples', 'igsn'),
+    'site': ('sites', 'eno'),
+    'survey': ('surveys', 'surveyid')
+}
+
+_local = threading.local()
+
+
+def _migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for i, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.executescript(script)
+        conn.execute('PRAGMA user_version = {}'.format(i))
+
+
+def get_connection():
+    """
+    Returns this thread's connection to the store, creating or updating the store's tables on first use
+
+    :return: a sqlite3 Connection
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(STORE_DB)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+
+def get_state(name, default=None):
+    row = get_connection().execute('SELECT value FROM sync_state WHERE name = ?', (name,)).fetchone()
+    return row[0] if row is not None else default
+
+
+def set_state(name, value):
+    conn = get_connection()
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)', (name, str(value)))
+
+
+def get_generation(register):
+    """
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: the number of the register's last sync, which increases with each sync
+    """
+    return int(get_state(REGISTERS[register][0] + '_generation', 0))
+
+
+def get_completed_generation(register):
+    """
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: the number of the register's last completed sync. Indexes & caches of the store are keyed on this, not
+        get_generation(), which changes when a sync starts, while the register's table is only partly synced.
+    """
+    return int(get_state(REGISTERS[register][0] + '_completed_generation', 0))
+
+
+def begin_sync(register):
+    """
+    Starts a new sync generation for a register. Every item seen during the sync is stamped with this generation so
+    that those not seen can be removed once the sync completes.
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: the generation number for this sync
+    """
+    generation = get_generation(register) + 1
+    set_state(REGISTERS[register][0] + '_generation', generation)
+    return generation
+
+
+def upsert_items(register, rows, generation):
+    """
+    Records a batch of a register's items seen upstream
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param rows: list of dicts of column values, each with at least the register's identifier column
+    :param generation: the generation number from begin_sync()
+    :return: None
+    """
+    if len(rows) == 0:
+        return
+    table, id_column = REGISTERS[register]
+    columns = list(rows[0].keys()) + ['generation']
+
+    conn = get_connection()
+    with conn:
+        # items new to the store are recorded as changes, for the indexes of it
+        ids = [str(row[id_column]) for row in rows]
+        existing = set()
+        for i in range(0, len(ids), SQLITE_MAX_VARIABLES):
+            batch = ids[i:i + SQLITE_MAX_VARIABLES]
+            existing.update(str(row[0]) for row in conn.execute(
+                'SELECT {0} FROM {1} WHERE {0} IN ({2})'.format(id_column, table, ', '.join('?' * len(batch))), batch))
+        conn.executemany(
+            'INSERT INTO changes (register, generation, id, removed) VALUES (?, ?, ?, 0)',
+            [(register, generation, item_id) for item_id in ids if item_id not in existing]
+        )
+        conn.executemany(
+            'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(table, ', '.join(columns), ', '.join('?' * len(columns))),
+            [[row[c] for c in columns[:-1]] + [generation] for row in rows]
+        )
+        if register == 'sample':
+            # a Sample that reappears upstream is no longer deleted
+            conn.executemany('DELETE FROM tombstones WHERE igsn = ?', [(row['igsn'],) for row in rows])
+
+
+def finish_sync(register, generation, synced_datestamp):
+    """
+    Removes every item seen in neither a completed sync nor the completed sync before it, tombstoning Samples. The Oracle
+    XML API is read by offset, so items removed upstream during a sync shift those after them onto pages already read,
+    and they're missed; an item must be missed twice in a row to be removed. Only call this once the whole upstream
+    register has been read, otherwise unread items will be wrongly removed.
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param generation: the generation number from begin_sync()
+    :param synced_datestamp: OAI-PMH datestamp of the sync, recorded as the deletion time of tombstoned Samples
+    :return: the number of items removed
+    """
+    table, id_column = REGISTERS[register]
+    # items seen in the last completed sync, or in an abandoned sync since, are stamped with it or later
+    previous = get_completed_generation(register)
+    conn = get_connection()
+    with conn:
+        if register == 'sample':
+            conn.execute(
+                'INSERT OR REPLACE INTO tombstones (igsn, deleted) SELECT igsn, ? FROM samples WHERE generation < ?',
+                (synced_datestamp, previous)
+            )
+        conn.execute(
+            'INSERT INTO changes (register, generation, id, removed) SELECT ?, ?, {}, 1 FROM {} WHERE generation < ?'
+            .format(id_column, table),
+            (register, generation, previous)
+        )
+        cursor = conn.execute('DELETE FROM {} WHERE generation < ?'.format(table), (previous,))
+        conn.execute(
+            'DELETE FROM changes WHERE register = ? AND generation <= ?',
+            (register, generation - CHANGES_KEPT_GENERATIONS)
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?), (?, ?), (?, ?)',
+            (table + '_synced', synced_datestamp, table + '_completed_generation', str(generation),
+             table + '_changes_after', str(generation - CHANGES_KEPT_GENERATIONS))
+        )
+    return cursor.rowcount
+
+
+def get_changes(register, after, until, limit):
+    """
+    Lists the items added to & removed from a register by the syncs after one generation, up to another, including
+    syncs that were abandoned
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param after: the generation to list the changes since, exclusive
+    :param until: the generation to list the changes to, inclusive
+    :param limit: the most changes to list
+    :return: list of (identifier, removed) tuples, in the order they were made, or None if there are more than limit
+        or the changes since after are no longer kept
+    """
+    if after < int(get_state(REGISTERS[register][0] + '_changes_after', 0)):
+        return None
+    rows = get_connection().execute(
+        'SELECT id, removed FROM changes WHERE register = ? AND generation > ? AND generation <= ? ORDER BY rowid '
+        'LIMIT ?',
+        (register, after, until, limit + 1)
+    ).fetchall()
+    if len(rows) > limit:
+        return None
+    return [(item_id, removed == 1) for item_id, removed in rows]
+
+
+def get_identifiers(register):
+    """
+    :param register: one of 'sample', 'site' or 'survey'
+    :return: list of the register's identifiers, as strings, in case-insensitive order
+    """
+    table, id_column = REGISTERS[register]
+    return [str(row[0]) for row in get_connection().execute(
+        'SELECT {0} FROM {1} ORDER BY CAST({0} AS TEXT) COLLATE NOCASE'.format(id_column, table))]
+
+
+def get_items_after(register, after=None, limit=20):
+    """
+    Lists a register's identifiers in order, after a given identifier. This is a keyset query on the identifier's
+    index so its cost doesn't depend on how far into the register it starts. Survey IDs are text, so are in lexical
+    order.
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param after: the identifier to list from, exclusive, or None to start at the beginning
+    :param limit: the most identifiers to list
+    :return: list of identifiers, as strings
+    """
+    table, id_column = REGISTERS[register]
+    if after is None:
+        rows = get_connection().execute(
+            'SELECT {0} FROM {1} ORDER BY {0} LIMIT ?'.format(id_column, table), (limit,))
+    else:
+        rows = get_connection().execute(
+            'SELECT {0} FROM {1} WHERE {0} > ? ORDER BY {0} LIMIT ?'.format(id_column, table), (after, limit))
+    return [str(row[0]) for row in rows]
+
+
+def get_rows_after(register, after=None, limit=1000):
+    """
+    As get_items_after() but gives each item's whole row, less its sync generation
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param after: the identifier to list from, exclusive, or None to start at the beginning
+    :param limit: the most rows to list
+    :return: list of dicts of column values
+    """
+    table, id_column = REGISTERS[register]
+    if after is None:
+        cursor = get_connection().execute(
+            'SELECT * FROM {} ORDER BY {} LIMIT ?'.format(table, id_column), (limit,))
+    else:
+        cursor = get_connection().execute(
+            'SELECT * FROM {0} WHERE {1} > ? ORDER BY {1} LIMIT ?'.format(table, id_column), (after, limit))
+    columns = [d[0] for d in cursor.description]
+    return [
+        {c: v for c, v in zip(columns, row) if c != 'generation'}
+        for row in cursor
+    ]
+
+
+def get_tombstones(from_=None, until=None):
+    """
+    Lists the Samples deleted within a datestamp window
+
+    :param from_: OAI-PMH datestamp, inclusive, or None for no lower bound
+    :param until: OAI-PMH datestamp, inclusive, or None for no upper bound
+    :return: list of (igsn, deleted datestamp) tuples, ordered by deletion time
+    """
+    return get_connection().execute(
+        'SELECT igsn, deleted FROM tombstones WHERE deleted >= ? AND deleted <= ? ORDER BY deleted, igsn',
+        (from_ or '0000-01-01T00:00:00Z', until or '9999-12-31T23:59:59Z')
+    ).fetchall()
+
+
+def get_tombstone(igsn):
+    """
+    :param igsn: the IGSN of a Sample
+    :return: the OAI-PMH datestamp at which the Sample was deleted, or None if it has not been deleted
+    """
+    row = get_connection().execute('SELECT deleted FROM tombstones WHERE igsn = ?', (igsn,)).fetchone()
+    return row[0] if row is not None else None
+
+
+def get_bboxes(register):
+    """
+    :param register: 'site' or 'survey'
+    :return: list of (identifier, min_x, min_y, max_x, max_y) tuples of the register's items with a known geometry
+    """
+    table, id_column = REGISTERS[register]
+    return get_connection().execute(
+        'SELECT {}, min_x, min_y, max_x, max_y FROM {} WHERE min_x IS NOT NULL'.format(id_column, table)).fetchall()
+
+
+def format_vertices(vertices):
+    """
+    :param vertices: list of (lon, lat) tuples
+    :return: the vertices as stored, 'lon lat,lon lat,...'
+    """
+    return ','.join('{} {}'.format(lon, lat) for lon, lat in vertices)
+
+
+def parse_vertices(text):
+    """
+    :param text: vertices from format_vertices()
+    :return: list of (lon, lat) tuples
+    """
+    return [tuple(float(v) for v in vertex.split(' ')) for vertex in text.split(',')]
+
+
+def get_site_geometries():
+    """
+    :return: list of (eno, min_x, min_y, max_x, max_y, polygon) tuples of the Sites with a known geometry, polygon
+        being as given by format_vertices() or None for a point
+    """
+    return get_connection().execute(
+        'SELECT eno, min_x, min_y, max_x, max_y, polygon FROM sites WHERE min_x IS NOT NULL').fetchall()
+
+
+def get_sample_points():
+    """
+    :return: list of (igsn, x, y) tuples of the Samples with a known point location
+    """
+    return get_connection().execute('SELECT igsn, x, y FROM samples WHERE x IS NOT NULL AND y IS NOT NULL').fetchall()
+
+
+def get_site_samples(eno, page=1, per_page=100):
+    """
+    Lists a page of the Samples taken at a Site, from the samples_eno index
+
+    :param eno: the ENO of the Site
+    :param page: the page number
+    :param per_page: the number of IGSNs per page
+    :return: list of IGSNs, in order
+    """
+    return [row[0] for row in get_connection().execute(
+        'SELECT igsn FROM samples WHERE eno = ? ORDER BY igsn LIMIT ? OFFSET ?',
+        (eno, per_page, (page - 1) * per_page)
+    )]
+
+
+def count_site_samples(eno):
+    """
+    :param eno: the ENO of a Site
+    :return: the number of Samples taken at the Site
+    """
+    return get_connection().execute('SELECT COUNT(*) FROM samples WHERE eno = ?', (eno,)).fetchone()[0]
+
+
+def get_column(register, column):
+    """
+    Lists one column of all a register's items, with their identifiers
+
+    :param register: one of 'sample', 'site' or 'survey'
+    :param column: the name of the column
+    :return: list of (identifier, value) tuples, ordered by identifier
+    """
+    table, id_column = REGISTERS[register]
+    return get_connection().execute(
+        'SELECT {0}, {1} FROM {2} ORDER BY {0}'.format(id_column, column, table)).fetchall()
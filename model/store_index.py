@@ -0,0 +1,69 @@
+"""
+A base for in-memory indexes of the local store. An index is built when first used, either then or in the background,
+and then a background thread checks for new completed syncs of its registers every refresh_seconds, updating the index
+for each register that has been synced. A sync in progress is ignored until it completes, so an index never holds a
+partly synced register.
+"""
+import logging
+import threading
+import time
+from model import store
+
+
+class StoreIndex:
+    def __init__(self, registers, refresh_seconds):
+        """
+        :param registers: list of the registers indexed, of 'sample', 'site' or 'survey'
+        :param refresh_seconds: seconds between checks for new syncs
+        """
+        self.registers = registers
+        self.refresh_seconds = refresh_seconds
+        self.generations = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def update(self, register):
+        """
+        Brings the index of one register up to date with the store. Readers may be using the index at the same time so
+        implementations should build a new structure and then swap it in.
+
+        :param register: the register that has been synced
+        :return: None
+        """
+        raise NotImplementedError
+
+    def refresh(self):
+        """
+        Updates the index for each register whose sync has completed since it was last updated
+
+        :return: None
+        """
+        for register in self.registers:
+            generation = store.get_completed_generation(register)
+            if generation != self.generations.get(register):
+                self.update(register)
+                self.generations[register] = generation
+
+    def _refresh(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.warning('Could not refresh {}: {}'.format(self.__class__.__name__, e))
+            time.sleep(self.refresh_seconds)
+
+    def ensure_built(self, wait=True):
+        """
+        Builds the index, if it hasn't been, and starts its background refresh
+
+        :param wait: whether to build the index before returning, or to leave it to the background refresh, meanwhile
+            using the index as far as it has been built
+        :return: None
+        """
+        if self._refresher is None:
+            with self._lock:
+                if self._refresher is None:
+                    if wait:
+                        self.refresh()
+                    self._refresher = threading.Thread(target=self._refresh, daemon=True)
+                    self._refresher.start()
@@ -0,0 +1,163 @@
+"""
+An in-memory prefix index, for type-ahead suggestions, over Sample IGSNs, Site ENOs and Survey IDs & names. Each register
+is held as its identifiers alone, in case-insensitive order, searched with bisect, and labels are made as suggestions
+are given. Survey names, of which there are few, are held as a sorted list of (lower-cased name, identifier, name)
+tuples. The index is built in the background from the local store and then brought up to date after each sync with the
+items it added & removed.
+"""
+import bisect
+import heapq
+import _config as config
+from model import store
+from model.store_index import StoreIndex
+
+
+SUGGEST_REFRESH_SECONDS = getattr(config, 'SUGGEST_REFRESH_SECONDS', 60)
+# read a register's identifiers again, rather than applying its syncs' changes, once this fraction of it has changed
+SUGGEST_REBUILD_FRACTION = 0.05
+
+# register: (instance URI base, item label prefix, store column of its name or None)
+SUGGEST_REGISTERS = {
+    'sample': (config.URI_SAMPLE_INSTANCE_BASE, 'Sample ', None),
+    'site': (config.URI_SITE_INSTANCE_BASE, 'Site ', None),
+    'survey': (config.URI_SURVEY_INSTANCE_BASE, 'Survey ', 'name')
+}
+
+
+def _read_names(register):
+    """
+    :return: sorted list of (lower-cased name, identifier, name) tuples of the register's named items in the store
+    """
+    column = SUGGEST_REGISTERS[register][2]
+    if column is None:
+        return []
+    return sorted((name.lower(), str(item_id), name) for item_id, name in store.get_column(register, column) if name)
+
+
+def _bisect_left(ids, prefix):
+    """
+    :param ids: list of identifiers in case-insensitive order
+    :param prefix: a lower-cased prefix
+    :return: the position of the first identifier not before the prefix
+    """
+    lo, hi = 0, len(ids)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ids[mid].lower() < prefix:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _contains(ids, item_id):
+    i = _bisect_left(ids, item_id.lower())
+    while i < len(ids) and ids[i].lower() == item_id.lower():
+        if ids[i] == item_id:
+            return True
+        i += 1
+    return False
+
+
+def _apply_changes(ids, changes):
+    """
+    :param ids: list of identifiers in case-insensitive order
+    :param changes: list of (identifier, removed) tuples, in the order they were made
+    :return: a new list of the identifiers with the changes made
+    """
+    # an item's last change is the one that counts, and it may already be in the index if a sync completed while the
+    # index was being brought up to date
+    last = dict(changes)
+    removed = {item_id for item_id, is_removed in last.items() if is_removed}
+    added = sorted((item_id for item_id, is_removed in last.items() if not is_removed and not _contains(ids, item_id)),
+                   key=str.lower)
+
+    # the identifiers kept are still in order, so merging the few added ones in is linear rather than a whole sort
+    kept = [item_id for item_id in ids if item_id not in removed] if len(removed) > 0 else ids
+    return list(heapq.merge(kept, added, key=str.lower))
+
+
+def _id_matches(ids, prefix, label):
+    i = _bisect_left(ids, prefix)
+    while i < len(ids) and ids[i].lower().startswith(prefix):
+        yield ids[i].lower(), ids[i], label + ids[i]
+        i += 1
+
+
+def _name_matches(names, prefix):
+    i = bisect.bisect_left(names, (prefix,))
+    while i < len(names) and names[i][0].startswith(prefix):
+        yield names[i]
+        i += 1
+
+
+def _search(ids, names, label, prefix, k):
+    """
+    :param ids: list of identifiers in case-insensitive order
+    :param names: sorted list of (lower-cased name, identifier, name) tuples
+    :param label: the register's item label prefix
+    :param prefix: the start of an identifier or name, in any case
+    :param k: the most matches to give
+    :return: list of (identifier, display label) tuples of the matching items, ordered by key
+    """
+    prefix = prefix.lower()
+    matches = []
+    seen = set()
+    for key, item_id, item_label in heapq.merge(_id_matches(ids, prefix, label), _name_matches(names, prefix)):
+        if len(matches) >= k:
+            break
+        if item_id not in seen:
+            seen.add(item_id)
+            matches.append((item_id, item_label))
+    return matches
+
+
+class SuggestIndex(StoreIndex):
+    """
+    The (identifiers, names) of each register
+    """
+    def __init__(self, refresh_seconds=SUGGEST_REFRESH_SECONDS):
+        super(SuggestIndex, self).__init__(list(SUGGEST_REGISTERS), refresh_seconds)
+        self.keys = {register: ([], []) for register in SUGGEST_REGISTERS}
+
+    def update(self, register):
+        ids, names = self.keys[register]
+        changes = None
+        if register in self.generations:
+            changes = store.get_changes(
+                register,
+                self.generations[register],
+                store.get_completed_generation(register),
+                int(len(ids) * SUGGEST_REBUILD_FRACTION)
+            )
+
+        ids = store.get_identifiers(register) if changes is None else _apply_changes(ids, changes)
+        self.keys[register] = (ids, _read_names(register))
+
+    def suggest(self, prefix, k=10, registers=None):
+        """
+        Suggestions come from the index as far as it has been built, so there are none until it is first built
+
+        :param prefix: the start of an IGSN, ENO, Survey ID or Survey name, in any case
+        :param k: the most suggestions to give
+        :param registers: list of the registers to search, or None for all of them
+        :return: list of dicts with the register, id, label & uri of each suggested item
+        """
+        self.ensure_built(wait=False)
+        suggestions = []
+        for register in registers or SUGGEST_REGISTERS:
+            uri_base, label = SUGGEST_REGISTERS[register][:2]
+            ids, names = self.keys[register]
+            for item_id, item_label in _search(ids, names, label, prefix, k - len(suggestions)):
+                suggestions.append({
+                    'register': register,
+                    'id': item_id,
+                    'label': item_label,
+                    'uri': uri_base + item_id
+                })
+            if len(suggestions) >= k:
+                break
+        return suggestions
+
+
+suggest_index = SuggestIndex()
@@ -1,11 +1,24 @@
 from pyldapi import Renderer, View
 from lxml import etree
 from lxml import objectify
-from rdflib import Graph, URIRef, RDF, RDFS, XSD, Namespace, Literal, BNode
+from rdflib import URIRef, RDF, RDFS, XSD, Namespace, Literal, BNode
 import requests
 from datetime import datetime
 from flask import Response, render_template, redirect
 import _config as config
+from model import rdf_writer, prov_vis, output_cache
+from model.static_assets import static_url
+
+
+PROV = Namespace('http://www.w3.org/ns/prov#')
+GEOSP = Namespace('http://www.opengis.net/ont/geosparql#')
+AUROLE = Namespace('http://communications.data.gov.au/def/role/')
+SAMFL = Namespace('http://def.seegrid.csiro.au/ontology/om/sam-lite#')
+GAPD = Namespace('http://pid.geoscience.gov.au/def/ont/gapd#')
+SOSA = Namespace('http://www.w3.org/ns/sosa/')
+TIME = Namespace('http://www.w3.org/2006/time#')
+
+EARTH_SUBSURFACE = URIRef('http://pid.geoscience.gov.au/feature/earthSusbsurface')
 
 
 class SurveyRenderer(Renderer):
@@ -19,12 +32,43 @@ class SurveyRenderer(Renderer):
     URI_INAPPLICABLE = 'http://www.opengis.net/def/nil/OGC/0/inapplicable'
     URI_GA = 'http://pid.geoscience.gov.au/org/ga'
 
+    # views made without the record, which isn't fetched for them
+    RECORDLESS_VIEWS = ['alternates', 'argus']
+    # the query string arguments, other than _view & _format, that change a response, so are in its output cache key
+    OUTPUT_ARGS = []
+
+    # the namespaces & constant triples of each RDF view
+    STATIC_RDF = {
+        'gapd': rdf_writer.StaticSubgraph(
+            [('prov', PROV), ('geosp', GEOSP), ('aurole', AUROLE), ('samfl', SAMFL), ('gapd', GAPD)],
+            [
+                (URIRef(URI_GA), RDF.type, PROV.Org),
+                (URIRef(URI_GA), RDFS.label, Literal('Geoscience Australia', datatype=XSD.string))
+            ]
+        ),
+        'prov': rdf_writer.StaticSubgraph(
+            [('prov', PROV), ('geosp', GEOSP), ('aurole', AUROLE)],
+            [
+                (URIRef(URI_GA), RDF.type, PROV.Org),
+                (URIRef(URI_GA), RDFS.label, Literal('Geoscience Australia', datatype=XSD.string)),
+                (URIRef(URI_GA), RDF.type, PROV.Agent)
+            ]
+        ),
+        'sosa': rdf_writer.StaticSubgraph(
+            [('sosa', SOSA), ('time', TIME), ('geosp', GEOSP)],
+            [
+                (EARTH_SUBSURFACE, RDFS.label, Literal('Earth Subsurface', datatype=XSD.string)),
+                (EARTH_SUBSURFACE, RDFS.comment, Literal('Below the earth\'s terrestrial surface', datatype=XSD.string))
+            ]
+        )
+    }
+
     def __init__(self, request, xml=None):
         views = {
             "gapd": View(
                 'GA Public Data View',
                 "Geoscience Australia's Public Data Model",
-                ['text/html', 'text/turtle', 'application/rdf+xml', 'application/rdf+json', 'application/json'],
+                ['text/html', 'text/turtle', 'application/n-triples', 'application/rdf+xml', 'application/rdf+json', 'application/json'],
                 'text/html',
                 namespace=None
             ),
@@ -40,7 +84,7 @@ class SurveyRenderer(Renderer):
             'sosa': View(
                 'SOSA View',
                 "The W3C's Sensor, Observation, Sample, and Actuator ontology within the Semantic Sensor Networks ontology",
-                ["text/turtle", "application/rdf+xml", "application/rdf+json"],
+                ["text/turtle", "application/n-triples", "application/rdf+xml", "application/rdf+json"],
                 "text/turtle",
                 namespace="http://www.w3.org/ns/sosa/"
             ),
@@ -48,7 +92,7 @@ class SurveyRenderer(Renderer):
             'prov': View(
                 'PROV View',
                 "The W3C's provenance data model, PROV",
-                ["text/html", "text/turtle", "application/rdf+xml", "application/rdf+json"],
+                ["text/html", "text/turtle", "application/n-triples", "application/rdf+xml", "application/rdf+json"],
                 "text/turtle",
                 namespace="http://www.w3.org/ns/prov/"
             )
@@ -59,6 +103,7 @@ class SurveyRenderer(Renderer):
         super(SurveyRenderer, self).__init__(request, config.URI_SURVEY_INSTANCE_BASE + self.survey_no, views, "gapd")
 
         self.survey_name = None
+        self.version = None
         self.state = None
         self.operator = None
         self.contractor = None
@@ -92,8 +137,11 @@ class SurveyRenderer(Renderer):
 
         self.srid = 8311  # TODO: replace this magic number with a value from the DB
 
-        # populate all instance variables from API
-        # TODO: lazy load this, i.e. only populate if a controller that need populating is loaded which is every controller except for Alternates
+        # populate all instance variables from API, unless the view doesn't need them
+        if xml is not None or self.view not in self.RECORDLESS_VIEWS:
+            self._populate(xml)
+
+    def _populate(self, xml):
         if xml is not None:  # even if there are values for Oracle API URI and IGSN, load from XML file if present
             self._populate_from_xml_file(xml)
         else:
@@ -110,17 +158,20 @@ class SurveyRenderer(Renderer):
             self.end_date = datetime(1900, 1, 1)
 
     def render(self):
+        if self.view == 'alternates':
+            return self._render_alternates_view()
+        elif self.view == 'argus':  # XML only for this controller
+            return redirect(config.XML_API_URL_SURVEY.format(self.survey_no), code=303)
+        return output_cache.render(self, 'survey', self.survey_no, self.version, self._render)
+
+    def _render(self):
         if self.survey_name is None:
             return Response('Survey with ID {} not found.'.format(self.survey_no), status=404, mimetype='text/plain')
-        if self.view == "alternates":
-            return self._render_alternates_view()
-        elif self.view == 'gapd':
+        if self.view == 'gapd':
             if self.format == 'text/html':
                 return self.export_html(model_view=self.view)
             else:
                 return Response(self.export_rdf(self.view, self.format), mimetype=self.format)
-        elif self.view == 'argus':  # XML only for this controller
-            return redirect(config.XML_API_URL_SURVEY.format(self.survey_no), code=303)
         elif self.view == 'prov':
             if self.format == 'text/html':
                 return self.export_html(model_view=self.view)
@@ -222,6 +273,7 @@ class SurveyRenderer(Renderer):
         '''
         # turn the XML doc into a Python object
         root = objectify.fromstring(xml)
+        self.version = output_cache.record_version(xml)
 
         if hasattr(root.ROW, 'SURVEYNAME'):
             self.survey_name = root.ROW.SURVEYNAME
@@ -322,9 +374,16 @@ class SurveyRenderer(Renderer):
             'trix', 'turtle', 'xml'], from http://rdflib3.readthedocs.io/en/latest/plugin_serializers.html
         :return: RDF string
         """
+        return rdf_writer.serialize(self._make_rdf(model_view), self._get_rdf_mimetype(rdf_mime))
+
+    def _make_rdf(self, model_view):
+        """
+        :param model_view: string of one of the model controller names available for Survey objects
+        :return: a TripleList of this instance in the model view
+        """
 
-        # things that are applicable to all model views; the graph and some namespaces
-        g = Graph()
+        # things that are applicable to all model views; the triples, with the view's namespaces & constant triples
+        g = rdf_writer.TripleList(self.STATIC_RDF.get(model_view, rdf_writer.NO_STATIC_SUBGRAPH))
 
         # URI for this survey
         this_survey = URIRef(config.URI_SURVEY_INSTANCE_BASE + self.survey_no)
@@ -334,17 +393,8 @@ class SurveyRenderer(Renderer):
 
         # select model controller
         if model_view == 'gapd' or model_view == 'prov':
-            PROV = Namespace('http://www.w3.org/ns/prov#')
-            g.bind('prov', PROV)
-
             g.add((this_survey, RDF.type, PROV.Activity))
 
-            GEOSP = Namespace('http://www.opengis.net/ont/geosparql#')
-            g.bind('geosp', GEOSP)
-
-            AUROLE = Namespace('http://communications.data.gov.au/def/role/')
-            g.bind('aurole', AUROLE)
-
             # default model is the GAPD model
             # Activity properties
             # TODO: add in label, startedAtTime, endedAtTime, atLocation
@@ -377,21 +427,16 @@ class SurveyRenderer(Renderer):
             g.add((processor_agent, RDFS.label, Literal(self.processor, datatype=XSD.string)))
             g.add((this_survey, PROV.qualifiedAttribution, processor))
 
+            # GA, the publisher, is in the static subgraph
             publisher = BNode()
-            g.add((ga, RDF.type, PROV.Org))
             g.add((publisher, RDF.type, PROV.Attribution))
             g.add((publisher, PROV.agent, ga))
             g.add((publisher, PROV.hadRole, AUROLE.Publisher))
-            g.add((ga, RDFS.label, Literal("Geoscience Australia", datatype=XSD.string)))
             g.add((this_survey, PROV.qualifiedAttribution, publisher))
 
             # TODO: add in other Agents
 
             if model_view == 'gapd':
-                # Geometry
-                SAMFL = Namespace('http://def.seegrid.csiro.au/ontology/om/sam-lite#')
-                g.bind('samfl', SAMFL)
-
                 # Survey location in GML & WKT, formulation from GeoSPARQL
 
                 geometry = BNode()
@@ -400,10 +445,6 @@ class SurveyRenderer(Renderer):
                 # g.add((geometry, GEOSP.asGML, gml))
                 g.add((geometry, GEOSP.asWKT, Literal(self._generate_wkt(), datatype=GEOSP.wktLiteral)))
 
-                # GAPD model required namespaces
-                GAPD = Namespace('http://pid.geoscience.gov.au/def/ont/gapd#')
-                g.bind('gapd', GAPD)
-
                 # classing the Survey in GAPD
                 g.add((this_survey, RDF.type, GAPD.PublicSurvey))
 
@@ -412,19 +453,13 @@ class SurveyRenderer(Renderer):
                 # redundant relationships just for SVG viewing
                 # TODO: add in a recognition of Agent roles for the graph
                 g.add((this_survey, RDFS.label, Literal('Survey ' + self.survey_no, datatype=XSD.string)))
-                g.add((ga, RDF.type, PROV.Agent))
                 g.add((this_survey, PROV.wasAssociatedWith, contractor_agent))
                 g.add((this_survey, PROV.wasAssociatedWith, operator_agent))
                 g.add((this_survey, PROV.wasAssociatedWith, processor_agent))
                 g.add((this_survey, PROV.wasAssociatedWith, ga))
         elif model_view == 'sosa':
-            SOSA = Namespace('http://www.w3.org/ns/sosa/')
-            g.bind('sosa', SOSA)
-
             # Sampling
             g.add((this_survey, RDF.type, SOSA.Sampling))
-            TIME = Namespace('http://www.w3.org/2006/time#')
-            g.bind('time', TIME)
 
             if self.start_date is not None and self.end_date is not None:
                 t = BNode()
@@ -472,10 +507,8 @@ class SurveyRenderer(Renderer):
                 g.add((sampler, RDF.type, SOSA.Sampler))
                 g.add((sampler, SOSA.isHostedBy, platform))  # associate
 
-            # FOI
-            foi = URIRef('http://pid.geoscience.gov.au/feature/earthSusbsurface')
-            g.add((foi, RDFS.label, Literal('Earth Subsurface', datatype=XSD.string)))
-            g.add((foi, RDFS.comment, Literal('Below the earth\'s terrestrial surface', datatype=XSD.string)))
+            # FOI, whose label & comment are in the static subgraph
+            foi = EARTH_SUBSURFACE
             g.add((this_survey, SOSA.hasFeatureOfInterest, foi))  # associate
 
             # Sample
@@ -485,134 +518,16 @@ class SurveyRenderer(Renderer):
             g.add((foi, SOSA.hasSample, sample))  # associate with FOI
 
             # Sample geometry
-            GEOSP = Namespace('http://www.opengis.net/ont/geosparql#')
-            g.bind('geosp', GEOSP)
             geometry = BNode()
             g.add((geometry, RDF.type, GEOSP.Geometry))
             g.add((geometry, GEOSP.asWKT, Literal(self._generate_wkt(), datatype=GEOSP.wktLiteral)))
             g.add((sample, GEOSP.hasGeometry, geometry))  # associate
 
-        return g.serialize(format=self._get_rdf_mimetype(rdf_mime))
+        return g
 
     def _get_rdf_mimetype(self, rdf_mime):
         return self.RDF_SERIALIZER_MAP[rdf_mime]
 
-    # TODO: split these RDF --> SVG parts into a stand-alone module
-    def __graph_preconstruct(self, g):
-        u = '''
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            DELETE {
-                ?a prov:generated ?e .
-            }
-            INSERT {
-                ?e prov:wasGeneratedBy ?a .
-            }
-            WHERE {
-                ?a prov:generated ?e .
-            }
-        '''
-        g.update(u)
-
-        return g
-
-    def __gen_visjs_nodes(self, g):
-        nodes = ''
-
-        q = '''
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            SELECT *
-            WHERE {
-                ?s a ?o .
-                {?s a prov:Entity .}
-                UNION
-                {?s a prov:Activity .}
-                UNION
-                {?s a prov:Agent .}
-                OPTIONAL {?s rdfs:label ?label .}
-            }
-            '''
-        for row in g.query(q):
-            if str(row['o']) == 'http://www.w3.org/ns/prov#Entity':
-                if row['label'] is not None:
-                    label = row['label']
-                else:
-                    label = 'Entity'
-                nodes += '\t\t\t\t{id: "%(node_id)s", label: "%(label)s", shape: "ellipse", color:{background:"#FFFC87", border:"#808080"}},\n' % {
-                    'node_id': row['s'],
-                    'label': label
-                }
-            elif str(row['o']) == 'http://www.w3.org/ns/prov#Activity':
-                if row['label'] is not None:
-                    label = row['label']
-                else:
-                    label = 'Activity'
-                nodes += '\t\t\t\t{id: "%(node_id)s", label: "%(label)s", shape: "box", color:{background:"#9FB1FC", border:"blue"}},\n' % {
-                    'node_id': row['s'],
-                    'label': label
-                }
-            elif str(row['o']) == 'http://www.w3.org/ns/prov#Agent':
-                if row['label'] is not None:
-                    label = row['label']
-                else:
-                    label = 'Agent'
-                nodes += '\t\t\t\t{id: "%(node_id)s", label: "%(label)s", image: "/surveys/static/img/agent.png", shape: "image"},\n' % {
-                    'node_id': row['s'],
-                    'label': label
-                }
-
-        return nodes
-
-    def __gen_visjs_edges(self, g):
-        edges = ''
-
-        q = '''
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX prov: <http://www.w3.org/ns/prov#>
-            SELECT *
-            WHERE {
-                ?s ?p ?o .
-                ?s prov:wasAttributedTo|prov:wasGeneratedBy|prov:used|prov:wasDerivedFrom|prov:wasInformedBy|prov:wasAssociatedWith ?o .
-            }
-            '''
-        for row in g.query(q):
-            edges += '\t\t\t\t{from: "%(from)s", to: "%(to)s", arrows:"to", font: {align: "bottom"}, color:{color:"black"}, label: "%(relationship)s"},\n' % {
-                'from': row['s'],
-                'to': row['o'],
-                'relationship': str(row['p']).split('#')[1]
-            }
-
-        return edges
-
-    def _make_vsjs(self, g):
-        g = self.__graph_preconstruct(g)
-
-        nodes = 'var nodes = new vis.DataSet([\n'
-        nodes += self.__gen_visjs_nodes(g)
-        nodes = nodes.rstrip().rstrip(',') + '\n\t\t\t]);\n'
-
-        edges = 'var edges = new vis.DataSet([\n'
-        edges += self.__gen_visjs_edges(g)
-        edges = edges.rstrip().rstrip(',') + '\n\t\t\t]);\n'
-
-        visjs = '''
-        %(nodes)s
-
-        %(edges)s
-
-        var container = document.getElementById('network');
-
-        var data = {
-            nodes: nodes,
-            edges: edges,
-        };
-
-        var options = {};
-        var network = new vis.Network(container, data, options);
-        ''' % {'nodes': nodes, 'edges': edges}
-
-        return visjs
-
     def export_html(self, model_view='gapd'):
         """
         Exports this instance in HTML, according to a given model from the list of supported models.
@@ -660,13 +575,16 @@ class SurveyRenderer(Renderer):
         </ROWSET>
         '''
         if model_view == 'prov':
-            prov_turtle = self.export_rdf('prov', 'text/turtle')
-            g = Graph().parse(data=prov_turtle, format='turtle')
+            prov_triples = self._make_rdf('prov')
 
             view_html = render_template(
                 'survey_prov.html',
-                visjs=self._make_vsjs(g),
-                prov_turtle=prov_turtle,
+                visjs=prov_vis.make_visjs(
+                    prov_triples,
+                    static_url('img/ga/agent.png'),
+                    ('survey', self.survey_no, self.version) if self.version is not None else None
+                ),
+                prov_turtle=rdf_writer.write_turtle(prov_triples),
             )
         else:  # model_view == 'gapd':
             view_html = render_template(
@@ -0,0 +1,362 @@
+"""
+Mapbox Vector Tiles (https://github.com/mapbox/vector-tile-spec/tree/master/2.1) of Sites, Samples & Survey extents in
+Web Mercator tiles. Each layer's features are found with an R-tree of the local store, clipped to the tile and
+snapped to its grid, which simplifies them for the zoom level, and points too close to tell apart are thinned. Tiles
+with features are cached on disk, up to TILE_CACHE_MAX_BYTES, until the layer's register is next synced.
+"""
+import math
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+import _config as config
+from model import store
+from model.spatial import RTree
+from model.store_index import StoreIndex
+
+
+TILE_CACHE_DIR = getattr(
+    config,
+    'TILE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'tile_cache')
+)
+TILE_CACHE_MAX_BYTES = getattr(config, 'TILE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+TILE_REFRESH_SECONDS = getattr(config, 'TILE_REFRESH_SECONDS', 60)
+# a z14 tile's grid is under a metre, finer than the store's locations; clients overzoom its tiles beyond it
+TILE_MAX_ZOOM = 14
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+# points closer than this, in tile units, are drawn as one
+TILE_POINT_SPACING = 16
+MAX_LATITUDE = 85.0511287798
+
+# changed whenever the tiles' encoding changes, so that tiles cached before are not served
+TILE_ENCODING_VERSION = 2
+
+# layer: (register, instance URI base)
+TILE_LAYERS = {
+    'sites': ('site', config.URI_SITE_INSTANCE_BASE),
+    'samples': ('sample', config.URI_SAMPLE_INSTANCE_BASE),
+    'surveys': ('survey', config.URI_SURVEY_INSTANCE_BASE)
+}
+
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+
+
+def _world(lon, lat):
+    """
+    :return: (x, y) of a point in Web Mercator, scaled to 0..1 with y down
+    """
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    s = math.sin(math.radians(lat))
+    return (lon + 180.0) / 360.0, 0.5 - math.log((1 + s) / (1 - s)) / (4 * math.pi)
+
+
+def _latitude(world_y):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * min(max(world_y, 0.0), 1.0)))))
+
+
+def tile_bbox(z, x, y):
+    """
+    :return: (min_lon, min_lat, max_lon, max_lat) of a tile, including its buffer
+    """
+    n = 2 ** z
+    buffer = TILE_BUFFER / TILE_EXTENT
+    return (
+        (x - buffer) / n * 360.0 - 180.0,
+        _latitude((y + 1 + buffer) / n),
+        (x + 1 + buffer) / n * 360.0 - 180.0,
+        _latitude((y - buffer) / n)
+    )
+
+
+def _clip(ring, lo, hi):
+    """
+    Clips a polygon ring to the square lo..hi by Sutherland-Hodgman, one edge of the square at a time
+    """
+    for axis, bound, keep_above in ((0, lo, True), (0, hi, False), (1, lo, True), (1, hi, False)):
+        if len(ring) == 0:
+            break
+        clipped = []
+        prev = ring[-1]
+        prev_in = prev[axis] >= bound if keep_above else prev[axis] <= bound
+        for point in ring:
+            point_in = point[axis] >= bound if keep_above else point[axis] <= bound
+            if point_in != prev_in:
+                t = (bound - prev[axis]) / (point[axis] - prev[axis])
+                crossing = [prev[0] + t * (point[0] - prev[0]), prev[1] + t * (point[1] - prev[1])]
+                crossing[axis] = bound
+                clipped.append(tuple(crossing))
+            if point_in:
+                clipped.append(point)
+            prev, prev_in = point, point_in
+        ring = clipped
+    return ring
+
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else ((-n) << 1) - 1
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _encode_point(px, py):
+    return [_command(1, 1), _zigzag(px), _zigzag(py)]
+
+
+def _ring_area(ring):
+    """
+    :param ring: list of (x, y) tile coordinates, not closed
+    :return: twice the ring's signed area by the surveyor's formula, sum of x_i * y_i+1 - x_i+1 * y_i, which is positive
+        for a ring that is clockwise in tile coordinates, i.e. with y down
+    """
+    return sum(ring[i - 1][0] * ring[i][1] - ring[i][0] * ring[i - 1][1] for i in range(len(ring)))
+
+
+def _encode_ring(ring):
+    """
+    :param ring: list of integer (x, y) tile coordinates, not closed, with a non-zero area
+    :return: geometry commands of a polygon of one exterior ring
+    """
+    if _ring_area(ring) < 0:
+        # an exterior ring has a positive area; holes, which these polygons don't have, would be negative
+        ring = ring[::-1]
+    geometry = [_command(1, 1), _zigzag(ring[0][0]), _zigzag(ring[0][1]), _command(2, len(ring) - 1)]
+    for i in range(1, len(ring)):
+        geometry.append(_zigzag(ring[i][0] - ring[i - 1][0]))
+        geometry.append(_zigzag(ring[i][1] - ring[i - 1][1]))
+    geometry.append(_command(7, 1))
+    return geometry
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, wire_type, payload):
+    """
+    A protobuf field: varint (wire type 0) payloads are already encoded, length-delimited (2) ones are prefixed here
+    """
+    if wire_type == 2:
+        payload = _varint(len(payload)) + payload
+    return _varint(number << 3 | wire_type) + payload
+
+
+def _packed(number, values):
+    return _field(number, 2, b''.join(_varint(v) for v in values))
+
+
+def encode_layer(name, features):
+    """
+    :param name: the layer name
+    :param features: list of (geometry type, geometry commands, dict of string properties) tuples
+    :return: the layer as a protobuf Tile message of one layer, which concatenate into a Tile of many
+    """
+    keys = {}
+    values = {}
+    body = bytearray(_field(15, 0, _varint(2)) + _field(1, 2, name.encode('utf-8')))
+    for geom_type, geometry, properties in features:
+        tags = []
+        for key, value in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(value, len(values)))
+        body += _field(2, 2, _packed(2, tags) + _field(3, 0, _varint(geom_type)) + _packed(4, geometry))
+    for key in keys:
+        body += _field(3, 2, key.encode('utf-8'))
+    for value in values:
+        body += _field(4, 2, _field(1, 2, value.encode('utf-8')))
+    body += _field(5, 0, _varint(TILE_EXTENT))
+    return _field(3, 2, bytes(body))
+
+
+class TileIndex(StoreIndex):
+    """
+    An R-tree of the features of each layer, each item being (identifier, list of (lon, lat) vertices)
+    """
+    def __init__(self, refresh_seconds=TILE_REFRESH_SECONDS):
+        super(TileIndex, self).__init__([register for register, uri_base in TILE_LAYERS.values()], refresh_seconds)
+        self.trees = {register: RTree([]) for register in self.registers}
+
+    def update(self, register):
+        if register == 'site':
+            items = [
+                (min_x, min_y, max_x, max_y,
+                 (str(eno), store.parse_vertices(polygon) if polygon is not None else [(min_x, min_y)]))
+                for eno, min_x, min_y, max_x, max_y, polygon in store.get_site_geometries()
+            ]
+        elif register == 'sample':
+            items = [(x, y, x, y, (igsn, [(x, y)])) for igsn, x, y in store.get_sample_points()]
+        else:
+            items = [
+                (min_x, min_y, max_x, max_y,
+                 (str(surveyid), [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]))
+                for surveyid, min_x, min_y, max_x, max_y in store.get_bboxes(register)
+            ]
+        self.trees[register] = RTree(items)
+
+    def refresh(self):
+        generations = dict(self.generations)
+        super(TileIndex, self).refresh()
+        # pruned once the new generation is published, so tiles of the old one are no longer written
+        for register in self.registers:
+            if self.generations[register] != generations.get(register):
+                tile_cache.prune(register, self.generations[register])
+
+    def features(self, register, uri_base, z, x, y):
+        """
+        :return: the features of a tile of a layer, for encode_layer()
+        """
+        self.ensure_built()
+        n = 2 ** z
+        features = []
+        seen_points = set()
+        for item_id, vertices in sorted(self.trees[register].search(tile_bbox(z, x, y))):
+            coords = []
+            for lon, lat in vertices:
+                wx, wy = _world(lon, lat)
+                coords.append(((wx * n - x) * TILE_EXTENT, (wy * n - y) * TILE_EXTENT))
+            properties = {'id': item_id, 'uri': uri_base + item_id}
+
+            if len(coords) == 1:
+                px, py = int(round(coords[0][0])), int(round(coords[0][1]))
+                cell = (px // TILE_POINT_SPACING, py // TILE_POINT_SPACING)
+                if cell in seen_points:
+                    continue
+                seen_points.add(cell)
+                features.append((GEOM_POINT, _encode_point(px, py), properties))
+                continue
+
+            ring = []
+            for cx, cy in _clip(coords, -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER):
+                vertex = (int(round(cx)), int(round(cy)))
+                if len(ring) == 0 or vertex != ring[-1]:
+                    ring.append(vertex)
+            if len(ring) > 1 and ring[0] == ring[-1]:
+                ring.pop()
+            # a ring snapped to a line or a point has no area, and isn't a valid polygon
+            if len(ring) >= 3 and _ring_area(ring) != 0:
+                features.append((GEOM_POLYGON, _encode_ring(ring), properties))
+        return features
+
+
+def _generation_dir(generation):
+    return '{}-v{}'.format(generation, TILE_ENCODING_VERSION)
+
+
+class TileCache:
+    """
+    The tiles of each layer's current generation, in files under a directory, of which the least recently used are
+    removed once they total more than max_bytes. Empty tiles, of which there are far more, are cheap to make so aren't
+    cached.
+    """
+    def __init__(self, directory=TILE_CACHE_DIR, max_bytes=TILE_CACHE_MAX_BYTES):
+        """
+        :param directory: the directory of the cached tiles
+        :param max_bytes: the most bytes of tiles to hold in the directory
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = OrderedDict()  # path: size, of the cached tiles, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._index_directory()
+
+    def _index_directory(self):
+        files = []
+        for root, dirs, names in os.walk(self.directory):
+            files.extend(os.path.join(root, name) for name in names if name.endswith('.mvt'))
+        for path, stat in sorted(((path, os.stat(path)) for path in files), key=lambda f: f[1].st_mtime):
+            self._files[path] = stat.st_size
+            self._bytes += stat.st_size
+
+    def path(self, register, generation, z, x, y):
+        return os.path.join(self.directory, register, _generation_dir(generation), str(z), str(x), '{}.mvt'.format(y))
+
+    def read(self, path):
+        """
+        :return: the cached tile, or None
+        """
+        try:
+            with open(path, 'rb') as f:
+                tile = f.read()
+        except IOError:
+            return None
+        with self._lock:
+            # the file may have been written by another worker since this one indexed the directory
+            if path not in self._files:
+                self._bytes += len(tile)
+            self._files[path] = len(tile)
+            self._files.move_to_end(path)
+        return tile
+
+    def write(self, path, tile):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(tile)
+        os.replace(tmp, path)
+
+        removed = []
+        with self._lock:
+            self._bytes += len(tile) - self._files.pop(path, 0)
+            self._files[path] = len(tile)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                removed_path, removed_size = self._files.popitem(last=False)
+                self._bytes -= removed_size
+                removed.append(removed_path)
+        for removed_path in removed:
+            try:
+                os.remove(removed_path)
+            except OSError:
+                pass
+
+    def prune(self, register, generation):
+        """
+        Removes a layer's cached tiles from generations other than the given one
+        """
+        layer_dir = os.path.join(self.directory, register)
+        if not os.path.isdir(layer_dir):
+            return
+        for name in os.listdir(layer_dir):
+            if name != _generation_dir(generation):
+                shutil.rmtree(os.path.join(layer_dir, name), ignore_errors=True)
+                prefix = os.path.join(layer_dir, name) + os.sep
+                with self._lock:
+                    for path in [path for path in self._files if path.startswith(prefix)]:
+                        self._bytes -= self._files.pop(path)
+
+
+def get_tile(layer, z, x, y):
+    """
+    :param layer: one of TILE_LAYERS
+    :return: the tile as MVT bytes, from the cache if it's there
+    """
+    register, uri_base = TILE_LAYERS[layer]
+    tile_index.ensure_built()
+    path = tile_cache.path(register, tile_index.generations[register], z, x, y)
+    tile = tile_cache.read(path)
+    if tile is not None:
+        return tile
+
+    features = tile_index.features(register, uri_base, z, x, y)
+    if len(features) == 0:
+        return b''
+    tile = encode_layer(layer, features)
+    tile_cache.write(path, tile)
+    return tile
+
+
+tile_cache = TileCache()
+tile_index = TileIndex()
@@ -0,0 +1,67 @@
+# times the RDF views of a Sample, a Site & a Survey in each RDF format, written directly (after) and by an rdflib
+# Graph (before), from the same triples. Run from the app directory, with _config.py on the path:
+#   python tests/benchmark_rdf.py
+import os
+import sys
+import timeit
+from unittest import mock
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from app import app
+from model import rdf_writer
+from model.sample import SampleRenderer
+from model.site import SiteRenderer
+from model.survey import SurveyRenderer
+
+RUNS = 200
+FORMATS = ['text/turtle', 'application/n-triples', 'application/rdf+xml']
+
+SAMPLE_XML = '''<ROWSET><ROW>
+<IGSN>AU1000012</IGSN><SAMPLEID>R1234</SAMPLEID><SAMPLE_TYPE_NEW>core</SAMPLE_TYPE_NEW><SAMPLING_METHOD>Drill</SAMPLING_METHOD>
+<MATERIAL_CLASS>rock</MATERIAL_CLASS><REMARK>Drill core, "split"</REMARK><ACQUIREDATE>2001-02-03T00:00:00</ACQUIREDATE>
+<ENO>17943</ENO><ENTITYID>BH 1</ENTITYID><ENTITY_TYPE>BOREHOLE</ENTITY_TYPE>
+<HOLE_LONG_MIN>120.5</HOLE_LONG_MIN><HOLE_LAT_MIN>-30.5</HOLE_LAT_MIN>
+<GEOM><SDO_GTYPE>2001</SDO_GTYPE><SDO_SRID>8311</SDO_SRID><SDO_POINT><X>120.5</X><Y>-30.5</Y><Z>12.5</Z></SDO_POINT></GEOM>
+<ORIGINATOR>J. Smith</ORIGINATOR>
+</ROW></ROWSET>'''
+
+SITE_XML = '''<ROWSET><ROW>
+<ENO>17943</ENO><ENTITYID>BH 1</ENTITYID><ENTITY_TYPE>BOREHOLE</ENTITY_TYPE><ENTRYDATE>2001-02-03T00:00:00</ENTRYDATE>
+<GEOM><SDO_GTYPE>2001</SDO_GTYPE><SDO_SRID>8311</SDO_SRID><SDO_POINT><X>120.5</X><Y>-30.5</Y></SDO_POINT></GEOM>
+</ROW></ROWSET>'''
+
+SURVEY_XML = '''<ROWSET><ROW>
+<SURVEYID>921</SURVEYID><SURVEYNAME>Goomalling, WA, 1996</SURVEYNAME><STATE>WA</STATE>
+<OPERATOR>Stockdale Prospecting Ltd.</OPERATOR><CONTRACTOR>Kevron Geophysics Pty Ltd</CONTRACTOR>
+<PROCESSOR>Kevron Geophysics Pty Ltd</PROCESSOR><VESSEL>Aero Commander</VESSEL><VESSEL_TYPE>Plane</VESSEL_TYPE>
+<STARTDATE>1996-12-05T00:00:00</STARTDATE><ENDDATE>1996-12-22T00:00:00</ENDDATE>
+<WLONG>116.366662</WLONG><ELONG>117.749996</ELONG><SLAT>-31.483336</SLAT><NLAT>-30.566668</NLAT>
+</ROW></ROWSET>'''
+
+RECORDS = [
+    ('Sample', SampleRenderer, '/sample/AU1000012', SAMPLE_XML, ['igsn-o', 'dct', 'prov', 'sosa']),
+    ('Site', SiteRenderer, '/site/ga/17943', SITE_XML, ['pdm']),
+    ('Survey', SurveyRenderer, '/survey/ga/921', SURVEY_XML, ['gapd', 'prov', 'sosa'])
+]
+
+
+def _serialize_by_graph(triples, rdf_format):
+    return triples.to_graph().serialize(format=rdf_format)
+
+
+def _time(renderer, view, mime):
+    return timeit.timeit(lambda: renderer.export_rdf(view, mime), number=RUNS) / RUNS * 1000
+
+
+if __name__ == '__main__':
+    print('{:8} {:8} {:24} {:>12} {:>12} {:>8}'.format('record', 'view', 'format', 'before (ms)', 'after (ms)', 'speedup'))
+    for name, renderer_class, path, xml, views in RECORDS:
+        with app.test_request_context(path):
+            from flask import request
+            renderer = renderer_class(request, xml=xml)
+            for view in views:
+                for mime in FORMATS:
+                    with mock.patch.object(rdf_writer, 'serialize', _serialize_by_graph):
+                        before = _time(renderer, view, mime)
+                    after = _time(renderer, view, mime)
+                    print('{:8} {:8} {:24} {:12.3f} {:12.3f} {:7.1f}x'.format(
+                        name, view, mime, before, after, before / after))
@@ -3,6 +3,8 @@ import requests
 import re
 import pytest
 import pprint as pp
+from rdflib import Graph
+from rdflib.compare import isomorphic
 
 SYSTEM_URI = 'http://localhost:5000'
 HEADERS_TTL = {'Accept': 'text/turtle'}
@@ -46,6 +48,22 @@ def test_oai_endpoint():
     )
 
 
+def test_oai_identify_deleted_record():
+    assert valid_endpoint_content(
+        f'{SYSTEM_URI}/oai?verb=Identify',
+        r'<deletedRecord>persistent<\/deletedRecord>',
+        'SSS OAI Identify deletedRecord failed'
+    )
+
+
+def test_oai_list_identifiers_bad_resumption_token():
+    assert valid_endpoint_content(
+        f'{SYSTEM_URI}/oai?verb=ListIdentifiers&resumptionToken=not-a-token',
+        r'<error code="badResumptionToken">',
+        'SSS OAI ListIdentifiers badResumptionToken failed'
+    )
+
+
 def test_sample_register_html():
     assert valid_endpoint_content(
         f'{SYSTEM_URI}/sample/',
@@ -689,5 +707,133 @@ def test_survey_instance_01020035_alternates_view_rdf_turtle_accept_header():
     )
 
 
+def test_sample_register_bad_page():
+    for query in ('page=abc', 'per_page=abc', 'page=0'):
+        r = requests.get(f'{SYSTEM_URI}/sample/?{query}')
+        assert r.status_code == 400, f'SSS API Sample Register {query} failed'
+
+
+def test_site_register_cursor_next_link():
+    r = requests.get(f'{SYSTEM_URI}/site/ga/?per_page=5&cursor=', headers=HEADERS_TTL)
+    assert re.search(r'<[^>]*\?per_page=5&cursor=[A-Za-z0-9_-]+>; rel="next"', r.headers.get('Link', '')), \
+        'SSS API Site register cursor next link failed'
+
+
+def test_site_register_cursor_bad_per_page():
+    for query in ('per_page=0', 'per_page=-1', 'per_page=abc'):
+        r = requests.get(f'{SYSTEM_URI}/site/ga/?{query}&cursor=')
+        assert r.status_code == 400, f'SSS API Site register cursor {query} failed'
+
+
+def test_site_register_cursor_next_link_over_max_per_page():
+    r = requests.get(f'{SYSTEM_URI}/site/ga/?per_page=1000000&cursor=', headers=HEADERS_TTL)
+    assert 'rel="next"' in r.headers.get('Link', ''), 'SSS API Site register cursor over max per_page failed'
+
+
+def test_site_register_export_csv():
+    assert valid_endpoint_content(
+        f'{SYSTEM_URI}/site/ga/export?_format=text/csv',
+        r'^id,label,uri\n',
+        'SSS API Site register export csv failed'
+    )
+
+
+def test_search_suggest_survey_name():
+    assert valid_endpoint_content(
+        f'{SYSTEM_URI}/search/suggest?q=goomalling&register=survey',
+        r'"label": ?"Goomalling, WA, 1996"',
+        'SSS API search suggest survey name failed'
+    )
+
+
+def test_survey_register_bbox_rdf_turtle_qsa():
+    assert valid_endpoint_content(
+        f'{SYSTEM_URI}/survey/ga/?bbox=116,-32,118,-30&_format=text/turtle',
+        r'xhv:first <[^>]*\?bbox=116%2C-32%2C118%2C-30&per_page=20&page=1>',
+        'SSS API Survey register bbox rdf turtle qsa failed'
+    )
+
+
+def test_sample_near_bad_request():
+    r = requests.get(f'{SYSTEM_URI}/sample/near?lat=-25.1')
+    assert r.status_code == 400, 'SSS API Sample near without lon failed'
+
+
+def test_tiles_sites_mvt():
+    r = requests.get(f'{SYSTEM_URI}/tiles/sites/0/0/0.mvt')
+    assert r.status_code == 200 and r.headers['Content-Type'] == 'application/vnd.mapbox-vector-tile', \
+        'SSS API sites vector tile failed'
+
+
+def test_site_geojson_simplify():
+    def vertex_count(simplify):
+        r = requests.get(f'{SYSTEM_URI}/site/ga/17943?_view=nemsr&simplify={simplify}')
+        return len(r.json()['features']['geometry']['coordinates'][0])
+
+    unsimplified = vertex_count(0)
+    assert vertex_count(0.01) < unsimplified, 'SSS API Site simplified GeoJSON failed'
+    assert vertex_count('') <= unsimplified, 'SSS API Site default simplified GeoJSON failed'
+
+
+@pytest.mark.parametrize('path,view', [
+    ('sample/AU1000012', 'igsn-o'),
+    ('sample/AU1000012', 'dct'),
+    ('sample/AU1000012', 'prov'),
+    ('sample/AU1000012', 'sosa'),
+    ('site/ga/17943', 'pdm'),
+    ('survey/ga/921', 'gapd'),
+    ('survey/ga/921', 'prov'),
+    ('survey/ga/921', 'sosa')
+])
+def test_direct_rdf_isomorphic(path, view):
+    # Turtle & N-Triples are written directly, RDF/XML by rdflib, from the same triples
+    uri = f'{SYSTEM_URI}/{path}?_view={view}&_format='
+    expected = Graph().parse(data=requests.get(uri + 'application/rdf+xml').content, format='xml')
+    for mime, rdf_format in (('text/turtle', 'turtle'), ('application/n-triples', 'nt')):
+        g = Graph().parse(data=requests.get(uri + mime).content, format=rdf_format)
+        assert isomorphic(g, expected), f'SSS API {path} {view} {rdf_format} not isomorphic to RDF/XML'
+
+
+def test_survey_cached_response_repeats():
+    # the second request is answered from the output cache, with the same body & headers
+    uri = f'{SYSTEM_URI}/survey/ga/921?_view=gapd&_format=text/turtle'
+    first, second = requests.get(uri), requests.get(uri)
+    assert first.content == second.content and second.headers['Content-Type'] == first.headers['Content-Type'], \
+        'SSS API Survey cached response differs'
+
+
+def test_survey_not_modified():
+    uri = f'{SYSTEM_URI}/survey/ga/921?_view=gapd&_format=text/turtle'
+    etag = requests.get(uri).headers['ETag']
+    r = requests.get(uri, headers={'If-None-Match': etag})
+    assert r.status_code == 304 and r.content == b'', 'SSS API Survey conditional GET failed'
+
+
+def test_sample_html_not_validated_by_date():
+    # an HTML page cites the day it's accessed, so its record's modified date doesn't show the client's copy is current
+    r = requests.get(f'{SYSTEM_URI}/sample/AU1000012', headers={'Accept': 'text/html'})
+    assert 'Last-Modified' not in r.headers and 'Accept' in [v.strip() for v in r.headers['Vary'].split(',')], \
+        'SSS API Sample HTML validators failed'
+
+
+def test_survey_gzip():
+    r = requests.get(f'{SYSTEM_URI}/survey/ga/921?_view=gapd&_format=text/turtle', headers={'Accept-Encoding': 'gzip'})
+    assert r.headers.get('Content-Encoding') == 'gzip' and 'Accept-Encoding' in r.headers['Vary'], \
+        'SSS API Survey gzip failed'
+
+
+def test_survey_argus_redirect():
+    r = requests.get(f'{SYSTEM_URI}/survey/ga/921?_view=argus', allow_redirects=False)
+    assert r.status_code == 303 and '921' in r.headers['Location'], 'SSS API Survey argus redirect failed'
+
+
+def test_static_assets_immutable():
+    # the fingerprinted assets linked from a page are cached for a year, if the assets have been built
+    html = requests.get(f'{SYSTEM_URI}/survey/ga/921?_view=prov&_format=text/html').content.decode('utf-8')
+    for url in re.findall(r'(?:src|href)="(/assets/[^"]+)"', html):
+        r = requests.get(f'{SYSTEM_URI}{url}')
+        assert r.status_code == 200 and 'immutable' in r.headers['Cache-Control'], f'SSS API asset {url} failed'
+
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -0,0 +1,267 @@
+# this set of tests calls the API's register paging, caches, indexes & encoders directly, with GA's Oracle XML API
+# mocked, so unlike test_endpoints.py it needs no running server. Run from the app directory, with _config.py on the
+# path:
+#   python -m pytest tests/test_units.py
+import io
+import json
+import os
+import sys
+import threading
+import time
+from unittest import mock
+import numpy as np
+import pytest
+from rdflib import RDF, RDFS, Graph, Literal, URIRef
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from controller.classes import _get_items
+from model.output_cache import OutputCache
+from model.page_cache import PageCache
+from model.prov_vis import PROV, make_visjs
+from model.rdf_writer import TripleList, write_ntriples, write_turtle
+from model import store
+from model.suggest import SuggestIndex, _search
+from model.spatial import KDTree, _unit_vectors
+from model.tiles import GEOM_POLYGON, TileCache, encode_layer, _encode_ring
+
+
+def mock_response(content):
+    r = mock.Mock()
+    r.content = content
+    r.raw = io.BytesIO(content)
+    return r
+
+
+def test_get_items_streams_rows():
+    rows = b''.join(b'<ROW><IGSN>AU%07d</IGSN><REMARK>r</REMARK></ROW>' % i for i in range(1, 6))
+    with mock.patch('requests.get', return_value=mock_response(b'<ROWSET>' + rows + b'</ROWSET>')):
+        items = _get_items(1, 5, 'IGSN')
+    assert items == [('AU%07d' % i, 'Sample AU%07d' % i) for i in range(1, 6)]
+
+
+def test_get_items_skips_empty_identifiers():
+    rows = b'<ROW><ENO>17943</ENO></ROW><ROW><ENO/></ROW><ROW><ENO></ENO></ROW><ROW><ENO>17944</ENO></ROW>'
+    with mock.patch('requests.get', return_value=mock_response(b'<ROWSET>' + rows + b'</ROWSET>')):
+        items = _get_items(1, 4, 'ENO')
+    assert items == [('17943', 'Site 17943'), ('17944', 'Site 17944')]
+
+
+def test_get_items_malformed():
+    truncated = b'<ROWSET><ROW><IGSN>AU0000001</IGSN></ROW><ROW><IGSN>AU00'
+    for content in (truncated, b'No data'):
+        with mock.patch('requests.get', return_value=mock_response(content)):
+            assert _get_items(1, 5, 'IGSN') is None
+
+
+class FakeRegister:
+    """
+    A register of 100 items, counting the pages fetched from it
+    """
+    def __init__(self):
+        self.fetched = []
+
+    def __call__(self, page, per_page, register):
+        self.fetched.append(page)
+        return list(range((page - 1) * per_page, min(page * per_page, 100))) or None
+
+
+def wait_for_prefetches(cache):
+    for future in list(cache._in_flight.values()):
+        future.result()
+
+
+def test_page_cache_prefetches_next_page():
+    register = FakeRegister()
+    cache = PageCache(register, max_age=600)
+    assert cache.get('IGSN', 1, 10) == list(range(10))
+    wait_for_prefetches(cache)
+    assert cache.get('IGSN', 2, 10) == list(range(10, 20))
+    assert register.fetched.count(2) == 1
+
+
+def test_page_cache_expiry():
+    register = FakeRegister()
+    cache = PageCache(register, max_age=600)
+    cache.get('IGSN', 1, 10)
+    wait_for_prefetches(cache)
+    # age the cached pages past max_age
+    for key, (items, fetched) in list(cache._pages.items()):
+        cache._pages[key] = (items, fetched - 601)
+
+    cache.get('IGSN', 1, 10)
+    wait_for_prefetches(cache)
+    # both the requested page & the expired page after it are fetched again
+    assert register.fetched.count(1) == 2 and register.fetched.count(2) == 2
+    assert all(time.time() - fetched < 600 for items, fetched in cache._pages.values())
+
+
+@pytest.fixture
+def temp_store(tmp_path):
+    with mock.patch('model.store.STORE_DB', str(tmp_path / 'store.db')), \
+            mock.patch('model.store._local', threading.local()):
+        yield
+
+
+def sync_surveys(surveys):
+    generation = store.begin_sync('survey')
+    store.upsert_items('survey', [{'surveyid': i, 'name': name} for i, name in surveys], generation)
+    return store.finish_sync('survey', generation, '2017-01-01T00:00:00Z')
+
+
+def test_sync_removes_items_missed_twice(temp_store):
+    sync_surveys([('1', 'Goomalling'), ('2', 'Albany'), ('3', 'Kalgoorlie')])
+    # missed once, e.g. shifted onto a page already read by a deletion upstream, an item is kept
+    assert sync_surveys([('1', 'Goomalling'), ('3', 'Kalgoorlie')]) == 0
+    assert sync_surveys([('1', 'Goomalling'), ('2', 'Albany'), ('3', 'Kalgoorlie')]) == 0
+    assert sync_surveys([('1', 'Goomalling')]) == 0
+    assert store.get_items_after('survey') == ['1', '2', '3']
+    assert sync_surveys([('1', 'Goomalling')]) == 2
+    assert store.get_items_after('survey') == ['1']
+
+
+def test_suggest_update_adds_and_removes(temp_store):
+    with mock.patch('model.suggest.SUGGEST_REBUILD_FRACTION', 1):
+        index = SuggestIndex()
+        sync_surveys([('1', 'Goomalling'), ('2', 'Albany'), ('3', 'Kalgoorlie')])
+        index.refresh()
+        sync_surveys([('1', 'Goomalling'), ('3', 'Kalgoorlie North'), ('4', 'Esperance'), ('10', 'Bunbury')])
+        sync_surveys([('1', 'Goomalling'), ('3', 'Kalgoorlie North'), ('4', 'Esperance'), ('10', 'Bunbury')])
+        # the syncs' changes are applied to the index, not read with the whole register
+        with mock.patch('model.store.get_identifiers', side_effect=AssertionError):
+            index.refresh()
+
+    ids, names = index.keys['survey']
+    assert ids == ['1', '10', '3', '4']
+    assert [name for name, item_id, label in names] == ['bunbury', 'esperance', 'goomalling', 'kalgoorlie north']
+    assert _search(ids, names, 'Survey ', 'KAL', 10) == [('3', 'Kalgoorlie North')]
+    assert _search(ids, names, 'Survey ', '1', 10) == [('1', 'Survey 1'), ('10', 'Survey 10')]
+
+
+def test_kdtree_nearest_matches_brute_force():
+    rng = np.random.default_rng(1)
+    points = _unit_vectors(rng.uniform(110, 155, 5000), rng.uniform(-45, -10, 5000))
+    tree = KDTree(points, list(range(5000)))
+    for point in _unit_vectors(rng.uniform(110, 155, 20), rng.uniform(-45, -10, 20)):
+        distances = np.sqrt(((points - point) ** 2).sum(axis=1))
+        expected = [i for i in np.argsort(distances)[:10] if distances[i] <= 0.02]
+        assert [i for d, i in tree.nearest(tuple(point), 10, 0.02)] == expected
+
+
+def read_varint(data, i):
+    n = shift = 0
+    while True:
+        n |= (data[i] & 0x7f) << shift
+        shift += 7
+        i += 1
+        if data[i - 1] < 0x80:
+            return n, i
+
+
+def read_fields(data):
+    """
+    :return: dict of protobuf field number: list of its values, length-delimited ones as bytes
+    """
+    fields = {}
+    i = 0
+    while i < len(data):
+        key, i = read_varint(data, i)
+        if key & 0x7 == 2:
+            length, i = read_varint(data, i)
+            value, i = data[i:i + length], i + length
+        else:
+            value, i = read_varint(data, i)
+        fields.setdefault(key >> 3, []).append(value)
+    return fields
+
+
+def decode_ring(geometry):
+    """
+    :param geometry: the geometry commands of a polygon of one ring
+    :return: the ring's vertices, in tile coordinates
+    """
+    def unzigzag(n):
+        return (n >> 1) ^ -(n & 1)
+
+    ring = []
+    x = y = i = 0
+    while i < len(geometry):
+        command, count = geometry[i] & 0x7, geometry[i] >> 3
+        i += 1
+        if command == 7:
+            continue
+        for _ in range(count):
+            x += unzigzag(geometry[i])
+            y += unzigzag(geometry[i + 1])
+            ring.append((x, y))
+            i += 2
+    return ring
+
+
+def test_tile_polygon_exterior_ring_winding():
+    square = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    for ring in (square, square[::-1]):
+        tile = encode_layer('surveys', [(GEOM_POLYGON, _encode_ring(ring), {'id': '921'})])
+        feature = read_fields(read_fields(read_fields(tile)[3][0])[2][0])
+        geometry = []
+        packed = feature[4][0]
+        i = 0
+        while i < len(packed):
+            n, i = read_varint(packed, i)
+            geometry.append(n)
+        decoded = decode_ring(geometry)
+
+        assert sorted(decoded) == sorted(square)
+        # an exterior ring has a positive area by the surveyor's formula in tile coordinates, i.e. y down
+        area = sum(decoded[i][0] * decoded[(i + 1) % 4][1] - decoded[(i + 1) % 4][0] * decoded[i][1] for i in range(4))
+        assert area == 200
+
+
+def test_tile_cache_evicts_and_prunes(tmp_path):
+    cache = TileCache(str(tmp_path), max_bytes=25)
+    paths = [cache.path('site', 1, 5, 1, y) for y in range(3)]
+    cache.write(paths[0], b'0' * 10)
+    cache.write(paths[1], b'1' * 10)
+    assert cache.read(paths[0]) == b'0' * 10
+    # the least recently used tile is removed to make room
+    cache.write(paths[2], b'2' * 10)
+    assert cache.read(paths[1]) is None
+    assert cache.read(paths[0]) == b'0' * 10
+
+    cache.prune('site', 2)
+    assert cache.read(paths[0]) is None
+    assert not os.path.exists(os.path.dirname(os.path.dirname(os.path.dirname(paths[0]))))
+
+
+def test_prov_visjs_escapes_labels():
+    sample = URIRef('http://pid.geoscience.gov.au/sample/AU1000012')
+    triples = mock.Mock()
+    triples.all_triples.return_value = [(sample, RDF.type, PROV.Entity), (sample, RDFS.label, '</script><b>&')]
+    visjs = make_visjs(triples, '/agent.png')
+    assert '</script>' not in visjs and '<b>' not in visjs
+    assert '\\u003c/script\\u003e\\u003cb\\u003e\\u0026' in visjs
+
+
+def test_output_cache_spills_without_pickle(tmp_path):
+    cache = OutputCache(max_bytes=100, directory=str(tmp_path))
+    key = ('survey', '921', 'gapd', 'text/turtle', 'v1', 'http://localhost/', (), None)
+    entry = (200, [('Content-Type', 'text/turtle'), ('ETag', '"abc"')], b'<a> <b> <c> .\n' * 5)
+    cache.put(key, entry)
+    # evicted from memory to its file
+    cache.put(('survey', '922'), (200, [], b'x' * 90))
+    path = os.path.join(str(tmp_path), OutputCache._file_name(key))
+    with open(path, 'rb') as f:
+        assert json.loads(f.readline())['status'] == 200
+
+    assert OutputCache(max_bytes=100, directory=str(tmp_path)).get(key) == entry
+    with open(path, 'wb') as f:
+        f.write(b'\x80\x04not json')
+    assert OutputCache(max_bytes=100, directory=str(tmp_path)).get(key) is None
+
+
+def test_rdf_writer_escapes_unsafe_iris():
+    unsafe = URIRef('http://pid.geoscience.gov.au/sample/a b<c>d"e{f}g|h^i`j\\k')
+    triples = TripleList()
+    triples.add((unsafe, RDFS.label, Literal('unsafe')))
+    triples.add((URIRef('http://pid.geoscience.gov.au/sample/AU1000012'), RDFS.seeAlso, unsafe))
+    for text, rdf_format in ((write_turtle(triples), 'turtle'), (write_ntriples(triples), 'nt')):
+        assert '<http://pid.geoscience.gov.au/sample/a\\u0020b\\u003Cc' in text
+        assert set(Graph().parse(data=text, format=rdf_format)) == set(triples)